@@ -0,0 +1,77 @@
+'''
+    Re-analyze every sensor data directory below a root directory in
+    parallel. A data directory is any directory whose name contains
+    sensor_<name>_<voltage>v and that holds capture files named with a gain
+    and pressure, e.g.
+
+        test_data/calibration_data_sensor_A_10v/test_..._16G_35.20psi.csv
+
+    Each directory is loaded once and both its ADCs are analyzed by
+    multiple_pressure_plot_and_stats in one worker process, then the
+    figures that are out of date are rendered by a second pool, writing
+    the same outputs as running that script by hand:
+
+        calibration_data_sensor_{sensor}_adc{n}_{voltage}V.csv
+        sensor_{sensor}_{voltage}V_adc{n}_{window}_averages.png
+
+    Inputs:
+
+        sys.argv[1] - root directory to search, defaults to test_data
+        sys.argv[2] - number of worker processes, defaults to one per core
+
+    Usage
+
+        python batch_analysis.py test_data/ [workers] [--no-figures]
+'''
+
+import os
+import re
+import sys
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from multiple_pressure_plot_and_stats import analyze_directory
+from teensy.figures import render_figures
+
+_directory_regex = re.compile(r'sensor_([A-Za-z0-9]+)_(\d+(?:\.\d+)?)v', re.IGNORECASE)
+_capture_regex = re.compile(r'\d+G_\d+\.\d+psi\.csv$')
+
+
+# every (directory, sensor, voltage) below root that holds pressure captures
+def find_data_directories(root):
+    found = []
+    for directory in sorted(Path(root).rglob('*')):
+        match = _directory_regex.search(directory.name)
+        if not directory.is_dir() or match is None:
+            continue
+        if any(_capture_regex.search(f.name) for f in directory.glob('*.csv')):
+            found.append((str(directory), match.group(1), match.group(2)))
+    return found
+
+def run(root, workers=None, figures=True):
+    jobs = find_data_directories(root)
+    start = time.perf_counter()
+    written, figure_jobs = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(analyze_directory, d, s, v, figures=False) for d, s, v in jobs]
+        for future in as_completed(futures):
+            for filename, adc_figures in future.result():
+                if filename is not None:
+                    written.append(filename)
+                    figure_jobs.extend(adc_figures)
+    rendered = render_figures(figure_jobs, workers) if figures else []
+    print('Wrote {} files and {} of {} figures from {} directories in {:.1f} s'.format(
+          len(written), len(rendered), len(figure_jobs) if figures else 0, len(jobs),
+          time.perf_counter() - start))
+    return sorted(written)
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    root = args[0] if args else 'test_data'
+    workers = int(args[1]) if len(args) > 1 else os.cpu_count()
+    for f in run(root, workers, figures='--no-figures' not in argv):
+        print(f)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,303 @@
+'''
+    End-to-end benchmarks of the acquisition pipeline, run against a
+    VirtualTeensy (teensy/simulator.py) so no hardware is needed:
+
+        decode          LineDecoder / FrameDecoder on pre-encoded bytes, and
+                        Teensy.read_block draining a flat-out simulator
+        calibration     Calibration.to_psi and CalibrationLUT.calibrate
+        hand-off        AcquisitionService publish -> subscriber ->
+                        BatchHandoff -> main thread, per batch
+        latency         device timestamp to finished LivePlot frame, through
+                        the same steps gui_live.py takes (Agg backend)
+        max rate        shortest sampling period sustained in real time for
+                        ascii and binary output, without drops or backlog
+
+    Every run is appended to a JSON history next to this file, tagged with
+    the git version, and compared with the previous run. Metrics that are
+    more than the tolerance worse than before are reported as regressions
+    and make the script exit with status 1.
+
+    The simulator runs in the same interpreter as the reader, so the max
+    rate is a lower bound for what the host can keep up with.
+
+    Usage
+
+        python benchmarks/acquisition_benchmark.py [history.json] [tolerance] [--no-save]
+'''
+
+import sys
+import json
+import time
+import asyncio
+import platform
+import threading
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(root))
+from teensy import Teensy, Calibration, CalibrationLUT, RingBuffer, AcquisitionService, BatchHandoff
+from teensy import SAMPLE_DTYPE, FrameDecoder, LineDecoder
+from teensy.decode import encode_frames
+from teensy.live_plot import LivePlot
+from teensy.simulator import VirtualTeensy, synthetic
+
+filename = root / 'calibration_coefficients.csv'
+history_filename = Path(__file__).resolve().parent / 'acquisition_history.json'
+sensors = ('A', 'B')
+
+# name: (unit, True if higher is better)
+METRICS = {
+    'line_decode_rate': ('samples/s', True),
+    'frame_decode_rate': ('samples/s', True),
+    'teensy_line_read_rate': ('samples/s', True),
+    'teensy_frame_read_rate': ('samples/s', True),
+    'calibration_polynomial_rate': ('samples/s', True),
+    'calibration_lut_rate': ('samples/s', True),
+    'handoff_per_batch': ('us', False),
+    'latency_median': ('ms', False),
+    'latency_p95': ('ms', False),
+    'max_line_rate': ('samples/s', True),
+    'max_frame_rate': ('samples/s', True),
+}
+
+# the same bytes the firmware sends for num_samples samples
+def encoded_stream(num_samples, binary):
+    adc0, adc1 = synthetic('sine', num_samples)
+    ms = np.arange(num_samples)
+    if binary:
+        return encode_frames(ms, adc0, adc1)
+    return ''.join(map('{}:{}:{}\r\n'.format, ms.tolist(), adc0.tolist(), adc1.tolist())).encode()
+
+# best of repeat runs of feeding the stream to a fresh decoder in chunks
+def decode_rate(decoder_class, data, num_samples, chunk_size=1 << 16, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        decoder = decoder_class()
+        start = time.perf_counter()
+        decoded = sum(len(decoder.feed(data[i:i + chunk_size])) for i in range(0, len(data), chunk_size))
+        best = min(best, time.perf_counter() - start)
+        assert decoded == num_samples, (decoder_class.__name__, decoded)
+    return num_samples/best
+
+# samples per second Teensy.read_block gets from a simulator sending as fast as it can
+def teensy_read_rate(binary, duration=2.0):
+    with VirtualTeensy('sine', rate=None) as sim:
+        teensy = Teensy(verbose=False)
+        teensy.connect(sim.port)
+        if binary:
+            teensy.set_binary(True)
+        teensy.serial_handle.write(b's 1000\n')
+        received = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            received += len(teensy.read_block())
+        elapsed = time.perf_counter() - start
+        teensy.serial_handle.write(b's\n')
+        teensy.serial_handle.close()
+    return received/elapsed
+
+def calibration_rates(num_samples=1000000):
+    cal = Calibration(filename)
+    lut = CalibrationLUT.from_coefficients(filename)
+    batch = np.empty(num_samples, dtype=SAMPLE_DTYPE)
+    batch['ms'] = np.arange(num_samples)
+    batch['adc0'], batch['adc1'] = synthetic('noise', num_samples)
+    def polynomial():
+        cal.to_psi(batch['adc0'], sensors[0], 0)
+        cal.to_psi(batch['adc1'], sensors[1], 1)
+    poly_s = min(_time(polynomial) for _ in range(5))
+    lut_s = min(_time(lambda: lut.calibrate(batch, sensors)) for _ in range(5))
+    return num_samples/poly_s, num_samples/lut_s
+
+def _time(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+# replays the same batch num_batches times, then stops the service
+class ReplayDevice():
+
+    def __init__(self, batch, num_batches):
+        self.batch = batch
+        self.remaining = num_batches
+        self.service = None
+
+    def read_block(self):
+        self.remaining -= 1
+        if self.remaining <= 0:
+            self.service.stop()
+        return self.batch
+
+# cost per batch from read_block returning to the main thread holding it, as in gui_live.py
+def handoff_cost(num_batches=20000, batch_size=100):
+    batch = np.zeros(batch_size, dtype=SAMPLE_DTYPE)
+    device = ReplayDevice(batch, num_batches)
+    service = AcquisitionService(device)
+    device.service = service
+    data_queue = BatchHandoff(maxsize=num_batches, policy='block')
+    subscription = service.subscribe(maxsize=num_batches)
+
+    async def forward():
+        async for b in subscription:
+            data_queue.put(b)
+
+    async def run():
+        await asyncio.gather(service.run(), forward())
+
+    received = 0
+    start = time.perf_counter()
+    thread = threading.Thread(target=asyncio.run, args=(run(),))
+    thread.start()
+    while received < num_batches*batch_size:
+        data = data_queue.drain()
+        received += 0 if data is None else len(data)
+    elapsed = time.perf_counter() - start
+    thread.join()
+    return elapsed/num_batches*1e6
+
+# device timestamp to the end of the frame that first shows it, at 1 kHz in real time
+def display_latency(duration=5.0, period_us=1000, update_rate_ms=50, window_size=5000):
+    lut = CalibrationLUT.from_coefficients(filename)
+    fig, ax = plt.subplots()
+    plot = LivePlot(ax)
+    buffer = RingBuffer(window_size, channels=3)
+    data_queue = BatchHandoff()
+    latencies = []
+    with VirtualTeensy('sine', rate=1.0) as sim:
+        teensy = Teensy(verbose=False)
+        teensy.connect(sim.port)
+        service = AcquisitionService(teensy)
+        subscription = service.subscribe(maxsize=16)
+
+        async def forward():
+            async for batch in subscription:
+                await data_queue.put_async(batch)
+
+        async def acquire():
+            await asyncio.gather(service.run(), forward())
+
+        thread = threading.Thread(target=asyncio.run, args=(acquire(),), daemon=True)
+        teensy.serial_handle.write('s {}\n'.format(period_us).encode())
+        thread.start()
+        start = time.monotonic()
+        while time.monotonic() - start < duration:
+            time.sleep(update_rate_ms*1e-3)
+            data = data_queue.drain()
+            if data is None:
+                continue
+            buffer.extend(lut.calibrate(data, sensors))
+            plot.update(buffer.latest()[:, 1:])
+            latencies.append(time.monotonic() - sim.due_time(data['ms'][-1]))
+        service.stop()
+        teensy.serial_handle.write(b's\n')
+        thread.join(timeout=2)
+        teensy.serial_handle.close()
+    plt.close(fig)
+    latencies = np.array(latencies[1:])*1e3         # the first frame does the full draw
+    return np.median(latencies), np.percentile(latencies, 95)
+
+# True if every sample due in duration arrived in time, in order and intact
+def sustains(period_us, binary, duration=1.0):
+    with VirtualTeensy('sine', rate=1.0) as sim:
+        teensy = Teensy(verbose=False)
+        teensy.connect(sim.port)
+        if binary:
+            teensy.set_binary(True)
+        decoder = teensy.decoder
+        teensy.serial_handle.write('s {}\n'.format(period_us).encode())
+        blocks = []
+        start = time.monotonic()
+        while time.monotonic() - start < duration:
+            blocks.append(teensy.read_block())
+        ms = np.concatenate(blocks)['ms']
+        lag = time.monotonic() - sim.due_time(ms[-1]) if len(ms) else np.inf
+        teensy.serial_handle.write(b's\n')
+        teensy.serial_handle.close()
+    expected = duration*1e6/period_us
+    intact = not getattr(decoder, 'malformed', 0) and not getattr(decoder, 'dropped', 0)
+    return intact and len(ms) >= 0.95*expected and np.all(np.diff(ms) >= 0) and lag < 0.05
+
+# highest sample rate sustained, trying shorter periods until one fails
+def max_rate(binary, periods_us=(1000, 500, 200, 100, 50, 20, 10, 5)):
+    best = 0.0
+    for period_us in periods_us:
+        if not sustains(period_us, binary):
+            break
+        best = 1e6/period_us
+    return best
+
+def run_benchmarks():
+    results = {}
+    num_samples = 200000
+    lines, frames = encoded_stream(num_samples, False), encoded_stream(num_samples, True)
+    results['line_decode_rate'] = decode_rate(LineDecoder, lines, num_samples)
+    results['frame_decode_rate'] = decode_rate(FrameDecoder, frames, num_samples)
+    results['teensy_line_read_rate'] = teensy_read_rate(binary=False)
+    results['teensy_frame_read_rate'] = teensy_read_rate(binary=True)
+    results['calibration_polynomial_rate'], results['calibration_lut_rate'] = calibration_rates()
+    results['handoff_per_batch'] = handoff_cost()
+    results['latency_median'], results['latency_p95'] = display_latency()
+    results['max_line_rate'] = max_rate(binary=False)
+    results['max_frame_rate'] = max_rate(binary=True)
+    return {k: float(v) for k, v in results.items()}
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=root, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def load_history(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+# metrics that got worse than tolerance relative to the previous run
+def regressions(results, previous, tolerance):
+    worse = {}
+    for name, value in results.items():
+        old = previous.get(name)
+        if not old or name not in METRICS:
+            continue
+        change = (value - old)/old
+        if METRICS[name][1]:
+            change = -change
+        if change > tolerance:
+            worse[name] = change
+    return worse
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    history_filename = Path(args[0]) if len(args) > 0 else history_filename
+    tolerance = float(args[1]) if len(args) > 1 else 0.2
+    history = load_history(history_filename)
+    previous = history[-1] if history else None
+
+    results = run_benchmarks()
+    worse = regressions(results, previous['results'], tolerance) if previous else {}
+    if previous:
+        print('compared with {} ({})'.format(previous['version'], previous['date']))
+    for name, value in results.items():
+        unit, _ = METRICS[name]
+        old = previous['results'].get(name) if previous else None
+        change = '{:+7.1f}%'.format((value - old)/old*100) if old else ''
+        print('{:28s} {:14.1f} {:10s} {} {}'.format(name, value, unit, change,
+                                                   'REGRESSION' if name in worse else ''))
+
+    if '--no-save' not in sys.argv:
+        history.append({'version': git_version(), 'date': datetime.now().isoformat(timespec='seconds'),
+                        'host': platform.node(), 'python': platform.python_version(),
+                        'numpy': np.__version__, 'results': results})
+        with open(history_filename, 'w') as f:
+            json.dump(history, f, indent=2)
+    sys.exit(1 if worse else 0)
@@ -0,0 +1,45 @@
+'''
+    Compares the per-sample calibration that gui_live.py used to do
+    (DataFrame mask + np.polyval for every sample) with the batched
+    Calibration.to_psi evaluation.
+
+    Usage
+
+        python benchmarks/calibration_benchmark.py [num_samples]
+'''
+
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from teensy import Calibration
+
+filename = Path(__file__).resolve().parents[1] / 'calibration_coefficients.csv'
+coeff = pd.read_csv(filename, index_col=[0])
+
+# the per-sample implementation previously in gui_live.py
+def calculate_psi(counts, sensor, adc, deg=3):
+    coef = coeff.iloc[:, -4:][(coeff['Sensor'] == sensor) & (coeff['ADC'] == adc) &
+                              (coeff['Degree'] == deg) ].to_numpy().flatten()[::-1]
+    return float(np.polyval(coef, counts))
+
+if __name__ == '__main__':
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    counts = np.random.default_rng(0).integers(-25000, 5000, num_samples).astype(np.float64)
+    cal = Calibration(filename)
+
+    # both implementations have to agree before timing means anything
+    expected = np.array([calculate_psi(c, 'A', 0) for c in counts])
+    np.testing.assert_allclose(cal.to_psi(counts, 'A', 0), expected, rtol=1e-12)
+
+    legacy_s = min(timeit.repeat(lambda: [calculate_psi(c, 'A', 0) for c in counts], number=1, repeat=3))
+    batch_s = min(timeit.repeat(lambda: cal.to_psi(counts, 'A', 0), number=10, repeat=5)) / 10
+
+    print('{} samples'.format(num_samples))
+    print('per-sample calculate_psi: {:10.3f} ms ({:8.2f} us/sample)'.format(legacy_s*1e3, legacy_s/num_samples*1e6))
+    print('batched to_psi:           {:10.3f} ms ({:8.4f} us/sample)'.format(batch_s*1e3, batch_s/num_samples*1e6))
+    print('speedup:                  {:10.0f}x'.format(legacy_s/batch_s))
@@ -0,0 +1,68 @@
+'''
+    Times the startup of every pressure.py subcommand, from starting the
+    interpreter to having imported everything the command needs (the
+    --dry-run of pressure.py), against a bare interpreter.
+
+    Every command is also run in-process to list the heavy modules it
+    loaded. acquire and record must not load any of HEAVY_MODULES, or this
+    exits with status 1.
+
+    Usage
+
+        python benchmarks/cli_startup_benchmark.py [repeat]
+'''
+
+import sys
+import json
+import subprocess
+import time
+from pathlib import Path
+
+root = Path(__file__).resolve().parents[1]
+
+HEAVY_MODULES = ['pandas', 'matplotlib', 'PySimpleGUI', 'scipy', 'tkinter']
+COMMANDS = [
+    ['acquire', '20.0', '--no-plot'],
+    ['record', 'recording'],
+    ['live'],
+    ['analyze', 'single', 'test_data'],
+    ['analyze', 'multiple', 'test_data'],
+    ['analyze', 'batch'],
+    ['analyze', 'noise'],
+    ['calibrate', 'test_data'],
+]
+HEADLESS = ('acquire', 'record')
+
+# modules of HEAVY_MODULES loaded by the dry run of a command, in a fresh interpreter
+def heavy_imports(command):
+    code = ('import sys, json, pressure; pressure.main(["pressure.py"] + {!r} + ["--dry-run"]); '
+            'print(json.dumps(sorted({{m.split(".")[0] for m in sys.modules}} & set({!r}))))').format(command, HEAVY_MODULES)
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True)
+    if out.returncode:
+        return None, out.stderr.strip().splitlines()[-1]
+    return json.loads(out.stdout.strip().splitlines()[-1]), None
+
+def startup_ms(args, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=root, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times)//2]*1e3
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    failed = False
+    base = startup_ms(['-c', 'pass'], repeat)
+    print('{:32s} {:8.1f} ms'.format('python -c pass', base))
+    for command in COMMANDS:
+        loaded, error = heavy_imports(command)
+        name = ' '.join(command)
+        if error is not None:
+            print('{:32s} not available here: {}'.format(name, error))
+            continue
+        ms = startup_ms(['pressure.py'] + command + ['--dry-run'], repeat)
+        bad = command[0] in HEADLESS and loaded
+        failed |= bool(bad)
+        print('{:32s} {:8.1f} ms  {}{}'.format(name, ms, ', '.join(loaded) or '-', '  HEAVY IMPORTS' if bad else ''))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,71 @@
+'''
+    Checks that the streaming filters of teensy/filters.py give the same
+    output chunk by chunk as in one go, then times each of them per 10k
+    sample chunk of two channels, like the live path calls them.
+
+    The check feeds a capture from test_data (or noise if there is none) in
+    random chunks of 1 to 5000 samples and compares with the one-shot
+    result, which has to match exactly for the window filters and to
+    rounding for the low-pass.
+
+    Usage
+
+        python benchmarks/filter_benchmark.py [chunk_size] [chunks]
+'''
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(root))
+from teensy.filters import make_filter
+from teensy.loader import load_capture
+
+SPECS = ['mean:10', 'mean:100', 'median:11', 'median:101', 'lowpass:50', 'lowpass:50:8']
+FS = 1000.0
+
+def signal_data(n=100000):
+    files = sorted(root.glob('test_data/calibration_data_sensor_A_10v/*psi.csv'))
+    if files:
+        idx, ts, adc0, adc1 = load_capture(files[0])
+        data = np.column_stack((adc0, adc1))
+    else:
+        data = np.random.default_rng(0).normal(2000, 40, (n, 2))
+    return np.resize(data, (n, 2))
+
+def validate(spec, data):
+    whole = make_filter(spec, FS, channels=2).process(data)
+    filt = make_filter(spec, FS, channels=2)
+    sizes = np.random.default_rng(1).integers(1, 5000, len(data))
+    bounds = np.cumsum(np.concatenate(([0], sizes)))
+    chunks = [filt.process(data[i:j]) for i, j in zip(bounds[:-1], bounds[1:]) if i < len(data)]
+    split = np.concatenate(chunks)
+    if spec.startswith('lowpass'):
+        np.testing.assert_allclose(split, whole, rtol=1e-12, atol=1e-9)
+    else:
+        assert np.array_equal(split, whole), spec
+    one = make_filter(spec, FS).process(data[:, 0])       # one channel gives the same as its column
+    np.testing.assert_allclose(one, whole[:, 0], rtol=1e-12, atol=1e-9)
+
+def timing(spec, data, chunk_size, num_chunks):
+    filt = make_filter(spec, FS, channels=2)
+    chunk = data[:chunk_size]
+    filt.process(chunk)
+    times = []
+    for _ in range(num_chunks):
+        start = time.perf_counter()
+        filt.process(chunk)
+        times.append(time.perf_counter() - start)
+    return np.median(times)*1e3
+
+if __name__ == '__main__':
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    num_chunks = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    data = signal_data(max(100000, chunk_size))
+    for spec in SPECS:
+        validate(spec, data)
+        ms = timing(spec, data, chunk_size, num_chunks)
+        print('{:14s} {:8.3f} ms per {} x 2 chunk  {:12.0f} samples/s'.format(spec, ms, chunk_size, chunk_size/ms*1e3))
@@ -0,0 +1,34 @@
+'''
+    Times LivePlot frames on the Agg backend for a range of window sizes.
+    With decimation the frame time should stay roughly flat as the window
+    grows.
+
+    Usage
+
+        python benchmarks/live_plot_benchmark.py
+'''
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from teensy.live_plot import LivePlot
+
+def time_frames(window_size, frames=50):
+    fig, ax = plt.subplots()
+    plot = LivePlot(ax)
+    rng = np.random.default_rng(0)
+    data = np.cumsum(rng.normal(size=(window_size + frames*100, 2)), axis=0)
+    plot.update(data[:window_size])                 # first frame does the full draw
+    times = [plot.update(data[i*100:i*100 + window_size]) for i in range(1, frames)]
+    plt.close(fig)
+    return np.median(times)
+
+if __name__ == '__main__':
+    for window_size in [1000, 10000, 100000, 1000000]:
+        print('window {:>8d} samples: {:6.2f} ms/frame'.format(window_size, time_frames(window_size)))
@@ -0,0 +1,53 @@
+'''
+    Compares converting a batch of int16 counts to PSI with the polynomial
+    evaluation in Calibration.to_psi and with the lookup tables in
+    CalibrationLUT.to_psi, for every key in calibration_coefficients.csv.
+
+    Before timing, every table entry is checked against the float64
+    polynomial: it has to be exactly the polynomial rounded to float32,
+    and within float32 resolution of it.
+
+    Usage
+
+        python benchmarks/lut_benchmark.py [num_samples]
+'''
+
+import os
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from teensy import Calibration, CalibrationLUT, write_lut
+from teensy.lut import _ALL_COUNTS
+
+filename = Path(__file__).resolve().parents[1] / 'calibration_coefficients.csv'
+
+if __name__ == '__main__':
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    cal = Calibration(filename)
+    with tempfile.TemporaryDirectory() as directory:
+        lut = CalibrationLUT(write_lut(cal, os.path.join(directory, 'calibration_lut.npy')))
+
+        # every possible count, for every key
+        worst = 0.0
+        for key in cal.keys():
+            expected = cal.to_psi(_ALL_COUNTS, *key)
+            table = lut.to_psi(_ALL_COUNTS, *key)
+            assert np.array_equal(table, expected.astype(np.float32)), key
+            np.testing.assert_allclose(table, expected, rtol=np.finfo(np.float32).eps, atol=1e-6)
+            worst = max(worst, np.max(np.abs(table - expected)))
+        print('{} tables match float64 polynomials rounded to float32, worst error {:.2e} psi'.format(
+              len(cal.keys()), worst))
+
+        counts = np.random.default_rng(0).integers(-25000, 5000, num_samples).astype(np.int16)
+        print('{} samples'.format(num_samples))
+        for deg in sorted({k[2] for k in cal.keys()}):
+            poly_s = min(timeit.repeat(lambda: cal.to_psi(counts, 'A', 0, deg), number=5, repeat=5)) / 5
+            lut_s = min(timeit.repeat(lambda: lut.to_psi(counts, 'A', 0, deg), number=5, repeat=5)) / 5
+            print('degree {}: polynomial {:8.3f} ms  lookup {:8.3f} ms  speedup {:5.1f}x'.format(
+                  deg, poly_s*1e3, lut_s*1e3, poly_s/lut_s))
+        del lut     # release the memory map before the directory is removed
@@ -0,0 +1,65 @@
+'''
+    Records a long synthetic capture at 1 kHz with StreamRecorder, then
+    times Recording.envelope for the whole recording and for zooms and pans
+    down to one second, against reading the raw range and decimating it
+    with minmax_decimate like the plotting scripts would.
+
+    Every envelope is checked against the min/max of the raw samples it
+    covers, which it has to contain.
+
+    Usage
+
+        python benchmarks/pyramid_benchmark.py [hours] [width]
+'''
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from teensy import SAMPLE_DTYPE, StreamRecorder, Recording
+from teensy.decimate import minmax_decimate
+
+def record(directory, hours, batch_size=1 << 16):
+    rng = np.random.default_rng(0)
+    num_samples = int(hours*3600*1000)
+    with StreamRecorder(directory, metadata={'period_us': 1000}) as recorder:
+        for start in range(0, num_samples, batch_size):
+            n = min(batch_size, num_samples - start)
+            batch = np.empty(n, dtype=SAMPLE_DTYPE)
+            batch['ms'] = np.arange(start, start + n)
+            batch['adc0'] = np.sin(batch['ms']*2*np.pi/600000)*12000 - 10000 + rng.normal(0, 40, n)
+            batch['adc1'] = rng.normal(-17850, 60, n)
+            recorder.write(batch)
+    return num_samples
+
+def best_ms(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)*1e3
+
+if __name__ == '__main__':
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 1200
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        num_samples = record(directory, hours)
+        print('recorded {} samples ({} h) in {:.1f} s'.format(num_samples, hours, time.perf_counter() - start))
+        recording = Recording(directory)
+        for span_ms in [num_samples, num_samples//10, 3600000, 60000, 1000]:
+            span_ms = min(span_ms, num_samples)
+            start_ms = (num_samples - span_ms)//2      # a pan to the middle of the recording
+            env = recording.envelope(start_ms, start_ms + span_ms, width)
+            raw = recording.read(start_ms, start_ms + span_ms)
+            assert env['adc0_min'].min() <= raw['adc0'].min() and env['adc0_max'].max() >= raw['adc0'].max()
+            env_ms = best_ms(lambda: recording.envelope(start_ms, start_ms + span_ms, width))
+            raw_ms = best_ms(lambda: minmax_decimate(recording.read(start_ms, start_ms + span_ms)['adc0'], width),
+                             repeat=1 if span_ms > 3600000 else 3)
+            print('span {:>10d} ms: envelope {:8.2f} ms  raw + decimate {:10.2f} ms'.format(span_ms, env_ms, raw_ms))
+        del recording, raw      # release the memory maps before the directory is removed
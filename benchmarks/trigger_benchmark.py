@@ -0,0 +1,123 @@
+'''
+    Validates TriggerStage on the sensor_A_1_hz_square_wave_* captures and
+    times it on a long stream built from them.
+
+    For every capture, adc0 is calibrated to PSI (sensor A, degree 3), or
+    used as is for the *_voltage_conversion and 4G captures that hold volts,
+    and the rising, falling and crossing triggers at the middle of the
+    square wave are checked against a plain per-sample Schmitt trigger
+    loop. The events have to be the same whether the capture is fed as one
+    batch or in random batches of 1 to 100 samples, and a 1 Hz square wave
+    has to give rising edges 1 s apart.
+
+    Then the captures are tiled into num_samples samples and fed in batches
+    of 1000 to measure samples/s, with tracemalloc checking that the peak
+    memory doesn't grow with the length of the stream.
+
+    Usage
+
+        python benchmarks/trigger_benchmark.py [num_samples]
+'''
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+root = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(root))
+from teensy import SAMPLE_DTYPE, CalibrationLUT
+from teensy.loader import load_capture
+from teensy.trigger import TriggerStage, Rising, Falling, Crossing
+
+lut = CalibrationLUT.from_coefficients(root / 'calibration_coefficients.csv')
+
+def to_psi(counts):
+    return lut.to_psi(counts, 'A', 0)
+
+VOLTS_DTYPE = np.dtype([('ms', '<i4'), ('adc0', '<f8'), ('adc1', '<f8')])
+
+# samples, and the calibration to apply to adc0 (None for captures already converted to volts)
+def load(filename):
+    idx, ts, adc0, adc1 = load_capture(filename)
+    volts = np.all(np.abs(adc0) < 10)
+    samples = np.empty(len(adc0), dtype=VOLTS_DTYPE if volts else SAMPLE_DTYPE)
+    samples['ms'], samples['adc0'], samples['adc1'] = ts, adc0, adc1
+    return samples, None if volts else to_psi
+
+# trigger indices of a per-sample Schmitt trigger, the reference for the vectorized conditions
+def reference(values, level, hysteresis, direction):
+    out, armed = [], {1: False, -1: False}
+    for i, v in enumerate(values):
+        for d in direction:
+            fire = v >= level if d == 1 else v <= level
+            if fire and armed[d]:
+                out.append(i)
+            if fire:
+                armed[d] = False
+            elif (v < level - hysteresis) if d == 1 else (v > level + hysteresis):
+                armed[d] = True
+    return sorted(set(out))
+
+def run(stage, samples, batch_sizes):
+    events, i = [], 0
+    for n in batch_sizes:
+        events += stage.process(samples[i:i + n])
+        i += n
+    return events
+
+def validate(filename):
+    samples, calibrate = load(filename)
+    psi = calibrate(samples['adc0']) if calibrate else samples['adc0']
+    lo, hi = np.percentile(psi, [5, 95])
+    level, hysteresis = (lo + hi)/2, (hi - lo)/4
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(1, 100, len(samples))
+    for name, condition, direction in [('rising', Rising, [1]), ('falling', Falling, [-1]),
+                                        ('crossing', Crossing, [1, -1])]:
+        def stage():
+            return TriggerStage(condition(level, hysteresis), pre=0, post=1, calibrate=calibrate, dtype=samples.dtype)
+        whole, split = run(stage(), samples, [len(samples)]), run(stage(), samples, sizes)
+        expected = reference(psi, level, hysteresis, direction)
+        assert [e.index for e in whole] == expected, (filename, name)
+        assert [e.index for e in split] == expected, (filename, name)
+        if name == 'rising':
+            period_ms = np.median(np.diff(samples['ms'][expected]))
+            assert abs(period_ms - 1000) < 50, (filename, period_ms)
+        print('{:60s} {:8s} {:3d} events'.format(Path(filename).parent.name, name, len(expected)))
+
+    # windows with pre/post samples come out in order, complete and the same for any batch split
+    whole = run(TriggerStage(Rising(level, hysteresis), pre=200, post=300, calibrate=calibrate, dtype=samples.dtype),
+                samples, [len(samples)])
+    split = run(TriggerStage(Rising(level, hysteresis), pre=200, post=300, calibrate=calibrate, dtype=samples.dtype),
+                samples, sizes)
+    assert all(np.array_equal(a.samples, b.samples) for a, b in zip(whole, split)) and len(whole) == len(split)
+    ms = np.concatenate([e.samples['ms'] for e in whole])
+    assert np.all(np.diff(ms) >= 0)
+    return samples, level, hysteresis
+
+def throughput(samples, level, hysteresis, num_samples, batch_size=1000):
+    stage = TriggerStage(Rising(level, hysteresis), pre=200, post=800, calibrate=to_psi)
+    stream = np.resize(samples, num_samples)
+    stream['ms'] = np.arange(num_samples)
+    tracemalloc.start()
+    peaks = []
+    start = time.perf_counter()
+    for i in range(0, num_samples, batch_size):
+        stage.process(stream[i:i + batch_size])
+        if i % (num_samples//4) < batch_size:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    print('{} samples, {} events: {:.0f} samples/s, peak traced memory {} kB'.format(
+          num_samples, stage.events, num_samples/elapsed, ' '.join(str(p//1024) for p in peaks)))
+
+if __name__ == '__main__':
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    for filename in sorted(root.glob('test_data/sensor_A_1_hz_square_wave_*/*.csv')):
+        samples, level, hysteresis = validate(filename)
+        if samples.dtype == SAMPLE_DTYPE:
+            counts = samples, level, hysteresis
+    throughput(*counts, num_samples)
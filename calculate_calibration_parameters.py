@@ -1,67 +1,133 @@
+'''
+    Fits the pressure calibration polynomials for every sensor and ADC
+    below a directory, for several polynomial degrees at once, without any
+    interactive windows. All fits are one batched least squares solve, see
+    teensy/fit.py.
+
+    Inputs:
+
+        sys.argv[1] - directory to search for calibration_data_sensor_* csv files
+        sys.argv[2:] - polynomial degrees to fit, defaults to 1 2 3
+
+    Outputs (in sys.argv[1]):
+
+        calibration_coefficients.csv - one row per sensor, adc and degree, same
+            columns as the calibration_coefficients.csv used by gui_live.py
+        calibration_residuals.csv - residual and leave-one-out residual
+            report per sensor, adc and degree
+        calibration_lut.npy/.json - counts to PSI lookup tables for every row
+            of calibration_coefficients.csv, see teensy/lut.py
+        calibration_data_sensor_{sensor}_adc{n}_{voltage}_degree_{d}.png next
+            to each data file, only redrawn when its data or fit changed
+
+    Usage
+
+        python calculate_calibration_parameters.py test_data/ 1 3 [--no-figures]
+'''
+
 import sys
 import os
 import re
 from pathlib import Path
 
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 
-# make float printing a little prettier
-np.set_printoptions(formatter={'float': "{0:0.3e}".format})
-
-# build list of files to analyze
-file_list = Path(sys.argv[1]).rglob('*calibration_data*/*calibration_data*.csv')
-degree = int(sys.argv[2])
-
-df = pd.DataFrame(columns=['Data Set Name', 'Sensor', 'ADC', 'Degree', 'C[0]', 'C[1]', 'C[2]', 'C[3]'])
-
-# parse all csv data files
-for f in file_list:
-    try:
-        sensor = re.findall(r'sensor_(.)_', f.name)[0]  # parse out sensor name from filename
-        adc = re.findall(r'adc(\d)', f.name)[0]         # parse out adc from filename
-    except IndexError:
-        continue
-
-    # read data file
-    data = pd.read_csv(f, index_col=[0])
-    pressure = data.loc[data['Window'] == 1]['Pressure']
-    avg_counts = data.loc[data['Window'] == 1]['Average']
-
-    # calculate fit polynomial
-    fit_x = np.linspace(min(avg_counts), max(avg_counts), num=1000)
-    fit_coeffs = np.polyfit(avg_counts, pressure, deg=degree)
-    fit_polynomial = [np.polyval(fit_coeffs, i) for i in fit_x]
-
-    # draw plot
-    base_name = 'calibration_data_sensor_{}_adc{}_10V_degree_{}'.format(sensor, adc, degree)
-    plot_title = base_name.replace('_', ' ')
-    filename = os.path.join(f.parent, base_name)
-    plt.xlabel('ADC Output (counts)')
-    plt.ylabel('Pressure (PSI)')
-    plt.title(plot_title)
-    plt.grid(True)
-    plt.xlim(-25000, 5000)
-    plt.ylim(-3, 43)
-    plt.plot(avg_counts, pressure, 'o')
-    plt.text(-24500, 1, "Coeffs: " + str(fit_coeffs))
-    plt.plot(fit_x, fit_polynomial)
-    plt.tight_layout()
-
-    print('Saving ', filename)
-    plt.savefig(filename)
-    plt.show()
-
-    # add data to dataframe
-    stats = [f.name, sensor, adc, degree]
-    for c in fit_coeffs[::-1]:  # coeeficients get reversed so they now come low to high
-        stats.append(c)
-    while len(stats) < len(df.columns):     # pad 0s for extra (missing high order) coefficients
-        stats.append(0)
-    df = df.append(pd.Series(stats, index=df.columns), ignore_index=True)
-
-filename = os.path.join(Path(sys.argv[1]), 'calibration_coefficients_degree_{}.csv'.format(degree))
-print(df)
-print('Saving as ', filename)
-df.to_csv(filename)
+from teensy import Calibration, write_lut
+from teensy.fit import fit_polynomials
+from teensy.figures import FigureJob, render_figures
+
+
+# draws the calibration points and fit of one sensor, adc and degree, runs in a figure worker process
+def plot_fit(fig, inputs, params):
+    data = pd.read_csv(inputs[0], index_col=[0])
+    data = data.loc[data['Window'] == 1]
+    coeffs = np.array(params['coeffs'])
+    fit_x = np.linspace(data['Average'].min(), data['Average'].max(), num=1000)
+
+    ax = fig.add_subplot(1, 1, 1)
+    ax.set_xlabel('ADC Output (counts)')
+    ax.set_ylabel('Pressure (PSI)')
+    ax.set_title(params['title'])
+    ax.grid(True)
+    ax.set_xlim(-25000, 5000)
+    ax.set_ylim(-3, 43)
+    ax.plot(data['Average'], data['Pressure'], 'o')
+    ax.text(-24500, 1, "Coeffs: " + np.array2string(coeffs[::-1], formatter={'float': "{0:0.3e}".format}))
+    ax.plot(fit_x, np.polyval(coeffs[::-1], fit_x))
+    fig.tight_layout()
+
+# (filename, sensor, adc, voltage, counts, pressure) for every calibration data file below root
+def load_calibration_data(root):
+    found = []
+    for f in sorted(Path(root).rglob('*calibration_data*/*calibration_data*.csv')):
+        try:
+            sensor = re.findall(r'sensor_(.)_', f.name)[0]      # parse out sensor name from filename
+            adc = int(re.findall(r'adc(\d)', f.name)[0])        # parse out adc from filename
+        except IndexError:
+            continue
+        voltage = (re.findall(r'_(\d+(?:\.\d+)?V)', f.name) or ['10V'])[0]
+        data = pd.read_csv(f, index_col=[0])
+        data = data.loc[data['Window'] == 1]
+        found.append((f, sensor, adc, voltage, data['Average'].to_numpy(), data['Pressure'].to_numpy()))
+    return found
+
+def calibrate(root, degrees=(1, 2, 3), figures=True):
+    degrees = sorted(set(degrees))
+    found = load_calibration_data(root)
+    if not found:
+        raise FileNotFoundError('No calibration_data_sensor_* files below {}'.format(root))
+    coeffs, residuals, loo = fit_polynomials([d[4] for d in found], [d[5] for d in found], degrees)
+
+    coeff_columns = ['C[{}]'.format(i) for i in range(max(3, max(degrees)) + 1)]
+    rows, report, jobs = [], [], []
+    for j, degree in enumerate(degrees):        # grouped by degree like calibration_coefficients.csv
+        for i, (f, sensor, adc, voltage, counts, pressure) in enumerate(found):
+            c = np.zeros(len(coeff_columns))
+            c[:degree + 1] = coeffs[i, j, :degree + 1]
+            rows.append([f.name, sensor, adc, degree] + list(c))
+
+            n = len(counts)
+            report.append({
+                'Data Set Name': f.name, 'Sensor': sensor, 'ADC': adc, 'Degree': degree, 'Points': n,
+                'RMS Residual': np.sqrt(np.mean(residuals[i, j, :n]**2)),
+                'Max Residual': np.max(np.abs(residuals[i, j, :n])),
+                'LOO RMS Residual': np.sqrt(np.mean(loo[i, j, :n]**2)),
+                'LOO Max Residual': np.max(np.abs(loo[i, j, :n])),
+            })
+
+            base_name = 'calibration_data_sensor_{}_adc{}_{}_degree_{}'.format(sensor, adc, voltage, degree)
+            jobs.append(FigureJob(os.path.join(f.parent, base_name + '.png'), plot_fit, [str(f)],
+                                  {'coeffs': list(c[:degree + 1]), 'title': base_name.replace('_', ' ')}))
+
+    df = pd.DataFrame(rows, columns=['Data Set Name', 'Sensor', 'ADC', 'Degree'] + coeff_columns)
+    residual_df = pd.DataFrame(report)
+    if figures:
+        render_figures(jobs)
+    return df, residual_df
+
+def main(argv):
+    # make float printing a little prettier
+    pd.set_option('display.float_format', '{:0.4g}'.format)
+
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    root = Path(args[0])
+    degrees = [int(d) for d in args[1:]] or [1, 2, 3]
+    df, residual_df = calibrate(root, degrees, figures='--no-figures' not in argv)
+
+    print(df)
+    print(residual_df.drop(columns='Data Set Name'))
+    best = residual_df.loc[residual_df.groupby(['Sensor', 'ADC'])['LOO RMS Residual'].idxmin()]
+    print('Lowest leave-one-out RMS residual:')
+    print(best[['Sensor', 'ADC', 'Degree', 'LOO RMS Residual']].to_string(index=False))
+
+    for name, table in (('calibration_coefficients.csv', df), ('calibration_residuals.csv', residual_df)):
+        filename = os.path.join(root, name)
+        print('Saving as ', filename)
+        table.to_csv(filename)
+    filename = write_lut(Calibration(os.path.join(root, 'calibration_coefficients.csv')),
+                         os.path.join(root, 'calibration_lut.npy'))
+    print('Saving as ', filename)
+
+if __name__ == '__main__':
+    main(sys.argv)
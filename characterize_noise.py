@@ -0,0 +1,56 @@
+'''
+    Noise and frequency response of every capture below a root directory,
+    see teensy/noise.py. Directories are characterized in parallel, one per
+    worker process, and results of captures that haven't changed come from
+    the <name>.csv.noise.json caches.
+
+    Inputs:
+
+        sys.argv[1] - root directory to search, defaults to test_data
+        sys.argv[2] - number of worker processes, defaults to one per core
+
+    Outputs:
+
+        noise_summary.csv in the root directory, one row per capture sorted
+        by gain, and the mean rms noise, input referred noise, ENOB, noise
+        density, rise time and measured gain of every gain setting printed
+
+    Usage
+
+        python characterize_noise.py test_data/ [workers] [--no-cache]
+'''
+
+import os
+import sys
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from teensy.noise import characterize_directory, find_capture_directories, summarize
+
+
+def run(root, workers=None, cache=True):
+    start = time.perf_counter()
+    directories = find_capture_directories(root)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = [row for result in pool.map(characterize_directory, directories, [cache]*len(directories))
+                for row in result]
+    table, by_gain = summarize(rows)
+    filename = str(Path(root) / 'noise_summary.csv')
+    table.to_csv(filename, index=False)
+    print('Characterized {} captures from {} directories in {:.1f} s, wrote {}'.format(
+          len(table), len(directories), time.perf_counter() - start, filename))
+    return table, by_gain
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith('--')]
+    root = args[0] if args else 'test_data'
+    workers = int(args[1]) if len(args) > 1 else os.cpu_count()
+    table, by_gain = run(root, workers, cache='--no-cache' not in argv)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20, 'display.float_format', '{:.4g}'.format):
+        print(by_gain)
+
+if __name__ == '__main__':
+    main(sys.argv)
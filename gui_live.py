@@ -2,55 +2,66 @@
 Imbed a live animation into a PySimpleGUI frontend, with extra plotting
 and sensor control.
 
-Live sensor data gets read from a separate thread and is converted to
-PSI using calibration coefficients from a file.
+The Teensy is read by a separate acquisition process (teensy/shm.py)
+that publishes the samples through shared memory, so redraws never hold
+up the serial port. A thread hands them to the GUI, where they are
+converted to PSI in batches with the lookup tables written by
+calculate_calibration_parameters.py (built from the calibration
+coefficients file if there are none).
 
-The animation fires on a timer callback from matplotlib and renders to
-a PySimpleGUI canvas (which is really just a wrapped tk canvas).
+The plot is redrawn from the GUI event loop on every tick. It is blitted
+onto a PySimpleGUI canvas (which is really just a wrapped tk canvas) and
+long windows are decimated to the canvas width, see teensy/live_plot.py.
+Mean and SDev of each channel over the window are kept by streaming
+accumulators, see teensy/running.py. The Filter box smooths both channels
+after calibration with a streaming filter, see teensy/filters.py; the
+recording always keeps the raw counts.
+
+Any argument runs it against a virtual Teensy (teensy/simulator.py)
+instead of the hardware, replaying the capture file or waveform given
+(Unix only, it needs a pseudo terminal):
+
+    python gui_live.py test_data/.../test_16G_35.20psi.csv
+    python gui_live.py sine
+
+Importing the module does nothing, main() loads the calibration, the GUI
+toolkit and matplotlib and starts the acquisition. Also run by
+pressure.py live. The name of the shared memory ring is printed, other
+processes can read along with teensy.shm.SharedRing.attach(name).
 
 '''
 
+import os
 import sys
-import time
-import queue
-import random
+import asyncio
 import threading
 from datetime import datetime
 import numpy as np
-import pandas as pd
-import PySimpleGUI as sg
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-matplotlib.use('TkAgg')
 
-from teensy import Teensy
+from teensy import CalibrationLUT, RingBuffer, AcquisitionService, StreamRecorder, RecorderThread, BatchHandoff
+from teensy.live_plot import LivePlot
+from teensy.running import WindowedStats
+from teensy.filters import make_filter
+from teensy.shm import AcquisitionProcess
 
-# file to read calibration data from
+# files to read calibration data from
 filename = 'calibration_coefficients.csv'
-coeff = pd.read_csv(filename, index_col=[0])
-fig = plt.figure()
-ax = fig.add_subplot(1, 1, 1)
-animation_queue = queue.Queue()     # to pass GUI events to animation
-raw_data_queue = queue.Queue()      # to pass raw data to main thread
+lut_filename = 'calibration_lut.npy'
+calibration = None                  # loaded by main()
+acquisition = None
+window = None
+raw_data_queue = BatchHandoff(maxsize=256, policy='drop_oldest')    # to pass batches of raw data to main thread
 update_rate_ms = 50                 # refresh time in ms
-ts, adc0, adc1 = [], [], []         # live data containers
+period_us = 100000                  # sampling period
+live_data = RingBuffer(100, channels=3)    # timestamp, adc0 psi, adc1 psi
+live_stats = WindowedStats(100, channels=2)     # adc0 psi, adc1 psi
+live_filter = [None, None]          # spec and filter of both psi channels, see teensy/filters.py
+FILTER_SPECS = ['none', 'mean:10', 'median:11', 'lowpass:1', 'lowpass:0.2']
 
-# serial communication with Teensy
-dev = False
-if len(sys.argv) > 1:
-    dev = True  # for development, ignores Teensy input
-
-if not dev: 
-    teensy_handle = Teensy()
-    teensy_handle.connect()
-
-# read fit coeffiecients and calculate PSI
-def calculate_psi(counts, sensor, adc, deg=3):
-    coef = coeff.iloc[:, -4:][(coeff['Sensor'] == sensor) & (coeff['ADC'] == adc) &
-                              (coeff['Degree'] == deg) ].to_numpy().flatten()[::-1]
-    return float(np.polyval(coef, counts))
+def load_calibration():
+    if os.path.exists(lut_filename) and os.path.getmtime(lut_filename) >= os.path.getmtime(filename):
+        return CalibrationLUT(lut_filename)
+    return CalibrationLUT.from_coefficients(filename)
 
 # read the currently selected sensors from the GUI message
 def get_sensors(msg):
@@ -59,139 +70,190 @@ def get_sensors(msg):
     s1 = [msg[6], msg[7], msg[8]]       # adc1 sensor
     return(names[s0][0], names[s1][0])  # boolean index to the names
 
-# thread to continuously poll data from sensors
-def data_collection_thread(data_queue, falsify=False):
-    try:
-        if falsify: # simulate some data for development
-            t = 0
-            while True:
-                t += 1
-                x = np.sin(np.pi*t/112)*12000-10000
-                y = random.randrange(-23000, 3000)
-                line = '{}:{}:{}'.format(t, x, y)
-                data_queue.put(line)
-                time.sleep(0.001)
-        else:       # read real data
-            while True:
-                line = teensy_handle.receive()
-                print(time.time(), line)
-                data_queue.put(line)
-    except (AttributeError, serial.serialutil.SerialException):
-        pass # ignore attribute error
+# hands every batch published by the acquisition service to the main thread
+async def forward_batches(subscription, data_queue):
+    async for batch in subscription:
+        await data_queue.put_async(batch)
+
+async def acquire(service, data_queue):
+    gui_batches = service.subscribe()
+    await asyncio.gather(service.run(), forward_batches(gui_batches, data_queue))
+
+# thread to continuously poll data from sensors, until service.stop()
+def data_collection_thread(service, data_queue):
+    asyncio.run(acquire(service, data_queue))
+
+# the filter of the spec selected in the GUI, a new one (fresh state) when the selection changes
+def get_filter(msg):
+    spec = msg.get('-FILTER-', 'none')
+    if spec != live_filter[0]:
+        live_filter[:] = [spec, make_filter(spec, fs=1e6/period_us, channels=2)]
+    return live_filter[1]
+
+# the selected filter starts over, when the stream it smooths is interrupted or the window starts over
+def reset_filter():
+    if live_filter[1] is not None:
+        live_filter[1].reset()
 
 # process all data on queue from the data collection thread
-def process_data(data_queue, message, t, x, y):
+def process_data(data_queue, message, buffer, stats=None):
     s = get_sensors(message)
-    while not data_queue.empty():
-        line = data_queue.get()
-        try:
-            t0, v0, v1 = line.split(':')
-            t.append(float(t0))
-            x.append(calculate_psi(float(v0), sensor=s[0], adc=0))
-            y.append(calculate_psi(float(v1), sensor=s[1], adc=1))
-        except ValueError:
-            pass # ignore bad data
-        data_queue.task_done()
-    try:                        # truncate to appropriate window size
+    filt = get_filter(message)
+    try:                        # keep the buffer and stats as long as the window
         n = int(message[0])
-        return t[-n:], x[-n:], y[-n:]
+        if n > 0 and n != buffer.capacity:
+            buffer.resize(n)
+            reset_filter()
+        if stats is not None and n > 0 and n != stats.window:
+            stats.resize(n)
+            reset_filter()
     except (ValueError, TypeError):
-        return t, x, y  # don't truncate if there is a bad window size
-
-# draws live plot on a timer callback
-def animate(_, q):
-    # get last message on event queue
-    message = None
-    while not q.empty():
-        message = q.get_nowait()
-        q.task_done()
+        pass    # don't resize if there is a bad window size
+    data = data_queue.drain()
+    if data is not None:        # calibrate everything that arrived at once
+        psi = calibration.calibrate(data, sensors=s)     # one table lookup per adc
+        if filt is not None:
+            psi[:, 1:] = filt.process(psi[:, 1:])
+        buffer.extend(psi)
+        if stats is not None:
+            stats.update(psi[:, 1:])
 
+# draws live plot, called from the GUI event loop
+def animate(plot, message):
     # plot last n datapoints
     try:
         n = int(message[1][0])  # parse window size
-        adc0_window = adc0[-n:]
-        adc1_window = adc1[-n:]
-        ts_window = [i for i in range(len(adc0_window))]
-        ax.clear()
-        if message[1][1]:       # if adc0 enable checkbox is checked
-            ax.plot(ts_window, adc0_window, 'C0', label='adc0')
-            ax.legend(loc='lower right')
-        if message[1][5]:       # if adc0 enable checkbox is checked
-            ax.plot(ts_window, adc1_window, 'C1', label='adc1')
-            ax.legend(loc='lower right')
-        ax.set_title('Live Sensor Readings')
-        ax.set_xlabel('Time (ms)')
-        ax.set_ylabel('Pressure (psi)')
+        window_data = live_data.latest(n)   # view, no copy
+        # only redraws the lines, adc0/adc1 enable checkboxes toggle them
+        plot.update(window_data[:, 1:], enabled=(message[1][1], message[1][5]))
+        stats = live_stats.stats()
+        continuity = acquisition.ring.continuity
+        window['-STATS-'].update('adc0: {:8.3f} psi  SDev {:6.3f}    adc1: {:8.3f} psi  SDev {:6.3f}    '
+                                 'gaps {} ({} missing)  duplicates {}  outliers {}'.format(
+                                 stats.mean[0], stats.sdev[0], stats.mean[1], stats.sdev[1],
+                                 continuity.gaps, continuity.missing, continuity.duplicates, continuity.outliers))
 
         # save displayed data
         if message[0] == 'Save':
             basename = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-            data = pd.DataFrame({'timestamp': ts_window, 'adc0': adc0_window, 'adc1': adc1_window})
+            import pandas as pd     # only needed to save
+            data = pd.DataFrame({'timestamp': np.arange(len(window_data)),
+                                 'adc0': window_data[:, 1], 'adc1': window_data[:, 2]})
             data.to_csv(basename + '.csv')
-            plt.savefig(basename + '.png')
+            plot.savefig(basename + '.png')
     except (ValueError, TypeError):
         pass    # ignore poorly formatted messages from the GUI
 
-layout = [
-    [   # row 1, some control buttons
-        sg.Text('Window Size (ms):'),
-        sg.Input(size=(5, 0), default_text=100),
-        sg.Button('Start'),
-        sg.Button('Pause'),
-        sg.Button('Save'),
-        sg.Button('Exit')
-    ],
-    [   # row 2, the animation
-        sg.Canvas(key='-CANVAS-')
-    ],
-    [  # row 3, some frames for the ADC options
-        sg.Frame(title='ADC 0', relief=sg.RELIEF_SUNKEN,
-                 layout=[[sg.Checkbox('Enabled', default=True)],
-                         [sg.Radio('Sensor A', 1, default=True),
-                          sg.Radio('Sensor B', 1),
-                          sg.Radio('Sensor C', 1)]]),
-        sg.Frame(title='ADC 1', relief=sg.RELIEF_SUNKEN,
-                 layout=[[sg.Checkbox('Enabled', default=True)],
-                         [sg.Radio('Sensor A', 2),
-                          sg.Radio('Sensor B', 2, default=True),
-                          sg.Radio('Sensor C', 2)]])
+def main(argv):
+    global calibration, acquisition, window
+    import PySimpleGUI as sg
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+    calibration = load_calibration()
+    fig = plt.figure()
+    ax = fig.add_subplot(1, 1, 1)
+
+    # serial communication with Teensy, in its own process writing to a shared memory ring
+    port = None
+    if len(argv) > 1:   # for development, reads from a virtual Teensy replaying a capture or waveform instead
+        from teensy.simulator import VirtualTeensy, WAVEFORMS
+        simulator = VirtualTeensy(argv[1] if argv[1] in WAVEFORMS or argv[1].endswith('.csv') else 'sine')
+        try:
+            port = simulator.start().port
+        except RuntimeError as e:
+            sys.exit('{}, run gui_live.py without arguments to use the Teensy'.format(e))
+    acquisition = AcquisitionProcess(port=port, period_us=period_us)
+
+    layout = [
+        [   # row 1, some control buttons
+            sg.Text('Window Size (ms):'),
+            sg.Input(size=(5, 0), default_text=100),
+            sg.Text('Filter:'),
+            sg.Combo(FILTER_SPECS, default_value='none', key='-FILTER-', readonly=True),
+            sg.Button('Start'),
+            sg.Button('Pause'),
+            sg.Button('Save'),
+            sg.Button('Record'),
+            sg.Button('Exit')
+        ],
+        [   # row 2, the animation
+            sg.Canvas(key='-CANVAS-')
+        ],
+        [   # live mean and standard deviation of the window
+            sg.Text(size=(108, 1), key='-STATS-')
+        ],
+        [  # row 3, some frames for the ADC options
+            sg.Frame(title='ADC 0', relief=sg.RELIEF_SUNKEN,
+                     layout=[[sg.Checkbox('Enabled', default=True)],
+                             [sg.Radio('Sensor A', 1, default=True),
+                              sg.Radio('Sensor B', 1),
+                              sg.Radio('Sensor C', 1)]]),
+            sg.Frame(title='ADC 1', relief=sg.RELIEF_SUNKEN,
+                     layout=[[sg.Checkbox('Enabled', default=True)],
+                             [sg.Radio('Sensor A', 2),
+                              sg.Radio('Sensor B', 2, default=True),
+                              sg.Radio('Sensor C', 2)]])
+        ]
     ]
-]
-
-# MUST maintain this order: define animation, plt.draw(), setup window
-# with finalize=True, then create, draw and pack the TkAgg canvas
-ani = animation.FuncAnimation(fig, animate, interval=update_rate_ms, fargs=(animation_queue,))
-plt.draw()  # must call plot.draw() to start the animation
-window = sg.Window('Read Pressure Sensors', layout, finalize=True, element_justification='center',
-                   font='18')
-
-# tie matplotlib renderer to pySimpleGui canvas
-canvas = FigureCanvasTkAgg(fig, window['-CANVAS-'].TKCanvas)
-canvas.draw()
-canvas.get_tk_widget().pack(side='top', fill='both', expand=1)
-
-if not dev:
-    teensy_handle.send("s 100000")   # start sampling
-threading.Thread(target=data_collection_thread, args=(raw_data_queue, dev), daemon=True).start()
-data_collection_enable = True
-
-while True: # main event loop for GUI
-    event, values = window.read(timeout=update_rate_ms)
-    # check for button events
-    if event in ('Exit', None):
-        break
-    if event == 'Start':
-        data_collection_enable = True
-    if event == 'Pause':
-        data_collection_enable = False
-    # send GUI events to animation
-    animation_queue.put_nowait((event, values))
-    # process data when not paused
-    if data_collection_enable:
-        ts, adc0, adc1 = process_data(raw_data_queue, values, ts, adc0, adc1)
-    else:   # if paused, throw away live data
-        while not raw_data_queue.empty():
-            raw_data_queue.get()
-            raw_data_queue.task_done()
-
-window.close()
+
+    # MUST maintain this order: setup window with finalize=True, then create,
+    # draw and pack the TkAgg canvas, then attach the live plot to it
+    window = sg.Window('Read Pressure Sensors', layout, finalize=True, element_justification='center',
+                       font='18')
+
+    # tie matplotlib renderer to pySimpleGui canvas
+    canvas = FigureCanvasTkAgg(fig, window['-CANVAS-'].TKCanvas)
+    canvas.draw()
+    canvas.get_tk_widget().pack(side='top', fill='both', expand=1)
+    live_plot = LivePlot(ax)
+
+    acquisition.start()     # start sampling
+    print('Shared ring {}, attach with SharedRing.attach({!r})'.format(acquisition.ring.name, acquisition.ring.name))
+    service = AcquisitionService(acquisition.reader())
+    collector = threading.Thread(target=data_collection_thread, args=(service, raw_data_queue), daemon=True)
+    collector.start()
+    data_collection_enable = True
+    recorder = None
+
+    try:
+        while True: # main event loop for GUI
+            event, values = window.read(timeout=update_rate_ms)
+            # check for button events
+            if event in ('Exit', None):
+                break
+            if event == 'Record':   # toggle streaming all raw data to disk
+                if recorder is None:    # its own reader of the ring, the GUI queue may drop batches
+                    directory = 'recording_' + datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
+                    recorder = RecorderThread(StreamRecorder(directory, period_us=period_us), acquisition.reader()).start()
+                    window['Record'].update('Stop Recording')
+                else:
+                    recorder.close()
+                    recorder = None
+                    window['Record'].update('Record')
+            if event == 'Start':
+                data_collection_enable = True
+                live_stats.clear()
+                reset_filter()
+            if event == 'Pause':    # what arrives meanwhile is thrown away, the filter state would be stale
+                data_collection_enable = False
+                reset_filter()
+            # process data when not paused
+            if data_collection_enable:
+                process_data(raw_data_queue, values, live_data, live_stats)
+            else:   # if paused, throw away live data
+                raw_data_queue.clear()
+            # redraw the plot with the latest data
+            animate(live_plot, (event, values))
+    finally:    # nothing may read the ring once the acquisition closes it
+        service.stop()
+        collector.join()
+        if recorder is not None:
+            recorder.close()
+        window.close()
+        acquisition.stop()
+
+if __name__ == '__main__':
+    main(sys.argv)
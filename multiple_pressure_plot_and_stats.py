@@ -16,123 +16,134 @@
 
         One plot for each window size, containing all data for each
         pressure point and detailed statistics for each pressure point
-        and window size combination.
+        and window size combination. Plots whose input files and
+        parameters haven't changed since the last run are not redrawn
+        (see teensy/figures.py).
 
     Usage
 
         python multiple_pressure_plot_and_stats.py path_to_data_files/ 'name_of_sensor' 'supply_voltage'
+
+    batch_analysis.py runs analyze_directory for every data directory in parallel.
+
+    Statistics of files larger than STREAM_BYTES are accumulated chunk by
+    chunk instead of loading the whole file (see teensy/running.py).
 '''
 
+import os
 import sys
-import csv
 import glob
 import re
-import statistics
 
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
+from teensy.loader import load_capture, iter_capture
+from teensy.running import chunked_window_stats, accumulated_window_stats
+from teensy.stats import WINDOW_SIZES, rolling_means, window_stats
+from teensy.decimate import minmax_decimate
+from teensy.figures import MAX_POINTS, FigureJob, render_figures
 
-def parse_and_sanitize_input_data(filename):
-    data = []
-    with open(filename) as csvfile:
-        data = list(csv.reader(csvfile))
-    col0, col1, col2, col3 = [], [], [], []
-    for row in data:
-        try:
-            float(row[0]), float(row[1]), float(row[2]), float(row[3])
-        except ValueError:
-            continue        # skip rows that have non numerical data
-        col0.append(float(row[0]))
-        col1.append(float(row[1]))
-        col2.append(float(row[2]))
-        col3.append(float(row[3]))
-    return col0, col1, col2, col3
-
-def rolling_average(data, window_size):
-    rolling_sum, result = [0], []
-    for i, x in enumerate(data, 1):
-        rolling_sum.append(rolling_sum[i-1] + x)
-        if i >= window_size:
-            curr_average = (rolling_sum[i] - rolling_sum[i-window_size])/window_size
-            result.append(curr_average)
-    return result
-
-def make_figure(data, window_size, filename, title='Figure'):
-    plt.xlabel('Time (ms)')
-    plt.ylabel('ADC Output (raw, uncalibrated)')
-    plt.ylim(-25000, 5000)
-    plt.xlim(0, 13000)
-    plt.title(title)
-    plt.grid(True)
-
-    for i, _ in enumerate(data):
-        pressure = data[i]['pressure']
-        idx = data[i]['time']
-        averaged_data = data[i]['averaged']
-        plt.plot(idx[window_size-1:], averaged_data, label=pressure)
-
-    plt.tight_layout()
-    # filename = filename.replace('.csv', '') + '_' + title.replace(' ', '_').lower() + '.png'
-    print('Saving ', filename)
-    plt.legend(loc='upper right', title='Pressure (PSI)')
-    # plt.show()
-    plt.savefig(filename)
-    plt.clf()
+STREAM_BYTES = 1 << 30      # files larger than this are never loaded whole for the statistics
+
+
+# draws one window size of every pressure reading, runs in a figure worker process
+def plot_averages(fig, inputs, params):
+    ax = fig.add_subplot(1, 1, 1)
+    ax.set_xlabel('Time (ms)')
+    ax.set_ylabel('ADC Output (raw, uncalibrated)')
+    ax.set_ylim(-25000, 5000)
+    ax.set_xlim(0, 13000)
+    ax.set_title(params['title'])
+    ax.grid(True)
+
+    window_size = params['window']
+    for f, pressure in zip(inputs, params['pressures']):
+        idx, ts, adc0, adc1 = load_capture(f)
+        averaged_data = rolling_means((adc0, adc1)[params['adc']], [window_size])[window_size][0]
+        x, y = minmax_decimate(averaged_data, MAX_POINTS, x=idx[window_size-1:])
+        ax.plot(x, y, label=pressure)
+
+    fig.tight_layout()
+    ax.legend(loc='upper right', title='Pressure (PSI)')
 
 def natural_sort(s):
     _natural_sort_regex = re.compile(r'([0-9]+)')
     return [int(text) if text.isdigit() else text.lower() for text in re.split(_natural_sort_regex, s)]
 
-# structure to hold all data
-raw_data = []
-raw_data.append([]) # adc0
-raw_data.append([]) # adc1
-
-# build list of files to analyze
-file_list = glob.glob(sys.argv[1]+'/*.csv')
-file_list.sort(key=natural_sort)
-
-# parse all csv data files
-for f in file_list:
-    try:
-        gain = int(re.findall(r'(\d+)G', f)[0])                 # parse out gain from filename
-        pressure = float(re.findall(r'_(\d+\.\d+)psi', f)[0])   # parse out gain from filename
-    except IndexError:
-        continue            # skip analysis for files that don't have gain in the name
-
-    idx, ts, adc0, adc1 = parse_and_sanitize_input_data(f)      # parse data from file
-    raw_data[0].append({'datafile': f, 'pressure': pressure, 'time': idx, 'raw': adc0})
-    raw_data[1].append({'datafile': f, 'pressure': pressure, 'time': idx, 'raw': adc1})
-
-sensor = sys.argv[2]
-voltage = sys.argv[3]
-
-# calculate stats and make plots for each adc
-for adc, _ in enumerate(raw_data):
-    df = pd.DataFrame(columns=['Data Set Name', 'Pressure', '# Samples', 'Window', 'Min', 'Max', 'Average', 'SDev'])
-
-    # try different averages
-    for window_size in [1, 5, 10, 50, 100, 500]:
-
-        # for each pressure measurement
-        for i, _ in enumerate(raw_data[adc]):
-            pressure = raw_data[adc][i]['pressure']
-            raw = raw_data[adc][i]['raw']
-            idx = raw_data[adc][i]['time']
-            f = raw_data[adc][i]['datafile']
-
-            # calculate stats we care about for this data set
-            raw_data[adc][i]['averaged'] = rolling_average(raw, window_size)
-            raw = raw_data[adc][i]['averaged']
-            stats = [f.split('\\')[-1], float(pressure), len(raw), window_size, min(raw), max(raw), statistics.mean(raw), statistics.stdev(raw)]
-            df = df.append(pd.Series(stats, index=df.columns), ignore_index=True)
-
-        # overlay each pressure reading on one plot
+# parse all csv data files in a directory, returns the data for each adc and the gain
+def load_pressure_data(directory, windows=WINDOW_SIZES):
+    # structure to hold all data
+    raw_data = []
+    raw_data.append([]) # adc0
+    raw_data.append([]) # adc1
+    gain = None
+
+    # build list of files to analyze
+    file_list = glob.glob(os.path.join(directory, '*.csv'))
+    file_list.sort(key=natural_sort)
+
+    for f in file_list:
+        try:
+            gain = int(re.findall(r'(\d+)G', f)[0])                 # parse out gain from filename
+            pressure = float(re.findall(r'_(\d+\.\d+)psi', f)[0])   # parse out gain from filename
+        except IndexError:
+            continue            # skip analysis for files that don't have gain in the name
+
+        name = f.split('\\')[-1]
+        if os.path.getsize(f) > STREAM_BYTES:
+            # running stats of the rolling averages, one chunk of the file in memory at a time
+            chunks = (np.column_stack((adc0, adc1)) for idx, ts, adc0, adc1 in iter_capture(f))
+            stats = accumulated_window_stats(chunked_window_stats(chunks, windows, channels=2), name, pressure)
+        else:
+            idx, ts, adc0, adc1 = load_capture(f)      # parse data from file
+
+            # rolling averages and stats for every window size and both adcs at once
+            averages = rolling_means(np.vstack((adc0, adc1)), windows)
+            stats = window_stats(None, name=name, pressure=pressure, means=averages)
+        for adc in (0, 1):
+            raw_data[adc].append({'datafile': f, 'pressure': pressure, 'stats': stats[adc]})
+    return raw_data, gain
+
+# collect stats and make plots for one adc, returns the name of the csv written and the figure jobs
+def analyze_adc(directory, sensor, voltage, adc, raw_data=None, gain=None, figures=True, workers=None):
+    if raw_data is None:
+        raw_data, gain = load_pressure_data(directory)
+    data = raw_data[adc]
+    if not data:
+        return None, []
+
+    # one row per file and window, numbered window by window
+    columns = {c: np.concatenate([d['stats'][c] for d in data]) for c in data[0]['stats']}
+    windows = data[0]['stats']['Window']
+    file_number, window_number = np.divmod(np.arange(len(columns['Window'])), len(windows))
+    df = pd.DataFrame(columns, index=window_number*len(data) + file_number)
+
+    # overlay each pressure reading on one plot, only redrawn when its inputs changed
+    jobs = []
+    for window_size in windows:
         title_text = 'Sensor {}, ADC {}, {}V supply, Gain={}, Window size={}'.format(sensor, adc, voltage, gain, window_size)
-        figure_filename = sys.argv[1] + 'sensor_{}_{}V_adc{}_{}_averages.png'.format(sensor, voltage, adc, window_size)
-        make_figure(raw_data[adc], window_size, figure_filename, title_text)
+        figure_filename = os.path.join(directory, 'sensor_{}_{}V_adc{}_{}_averages.png'.format(sensor, voltage, adc, window_size))
+        params = {'adc': adc, 'window': int(window_size), 'title': title_text, 'pressures': [d['pressure'] for d in data]}
+        jobs.append(FigureJob(figure_filename, plot_averages, [d['datafile'] for d in data], params))
+    if figures:
+        render_figures(jobs, workers)
 
     df = df.sort_values(['Pressure', 'Window'])
     print(df.round(2))
-    df.to_csv(sys.argv[1] + '/calibration_data_sensor_{}_adc{}_{}V.csv'.format(sensor, adc, voltage))
+    filename = os.path.join(directory, 'calibration_data_sensor_{}_adc{}_{}V.csv'.format(sensor, adc, voltage))
+    df.to_csv(filename)
+    return filename, jobs
+
+# loads the captures of a directory once and analyzes every adc, one (csv written, figure jobs) per adc
+def analyze_directory(directory, sensor, voltage, figures=True, workers=None):
+    raw_data, gain = load_pressure_data(directory)
+    return [analyze_adc(directory, sensor, voltage, adc, raw_data, gain, figures, workers)
+            for adc in range(len(raw_data))]
+
+def main(argv):
+    directory, sensor, voltage = argv[1], argv[2], argv[3]
+    analyze_directory(directory, sensor, voltage)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,82 @@
+'''
+    One command for the whole workflow, from capturing to calibrating.
+    Every subcommand runs the main() of the script that has always done the
+    job, and that script is only imported when its subcommand runs, so
+    pandas, matplotlib and PySimpleGUI are never loaded by a command that
+    doesn't use them. acquire --no-plot and record import nothing but the
+    serial and NumPy layers (teensy/ and read_pressure_sensors.py), need no
+    display and start in a fraction of a second.
+
+        acquire <pressure> [points] [--gain=16] [--port=PORT] [--no-plot]
+                                            capture to csv, read_pressure_sensors.py
+        record <directory> [period_us] [--port=PORT]
+                                            stream to disk until Ctrl-C, read_pressure_sensors.py --record
+        live [capture.csv | waveform]       live plot, gui_live.py
+        analyze single <directory> <sensor> <voltage> [filter]
+                                            single_pressure_plot_and_stats.py
+        analyze multiple <directory> <sensor> <voltage>
+                                            multiple_pressure_plot_and_stats.py
+        analyze batch [root] [workers] [--no-figures]
+                                            batch_analysis.py
+        analyze noise [root] [workers] [--no-cache]
+                                            characterize_noise.py
+        calibrate <directory> [degrees...] [--no-figures]
+                                            calculate_calibration_parameters.py
+
+    --dry-run imports what the command needs and stops before running it,
+    benchmarks/cli_startup_benchmark.py uses it to time every subcommand.
+
+    Usage
+
+        python pressure.py acquire 20.0 --no-plot
+        python pressure.py record recording_1 1000
+        python pressure.py analyze noise test_data
+        python pressure.py calibrate test_data/ 1 3
+'''
+
+import sys
+import importlib
+
+# subcommand -> (module, arguments put in front of the ones given)
+COMMANDS = {
+    'acquire':   ('read_pressure_sensors', []),
+    'record':    ('read_pressure_sensors', ['--record']),
+    'live':      ('gui_live', []),
+    'calibrate': ('calculate_calibration_parameters', []),
+}
+ANALYSES = {
+    'single':   'single_pressure_plot_and_stats',
+    'multiple': 'multiple_pressure_plot_and_stats',
+    'batch':    'batch_analysis',
+    'noise':    'characterize_noise',
+}
+
+# the module that runs a command line and the argv its main() gets
+def resolve(args):
+    command, args = args[0], args[1:]
+    if command == 'analyze':
+        if not args or args[0] not in ANALYSES:
+            raise ValueError('analyze needs one of {}'.format(', '.join(ANALYSES)))
+        module, args = ANALYSES[args[0]], args[1:]
+    elif command in COMMANDS:
+        module, prefix = COMMANDS[command]
+        args = prefix + args
+    else:
+        raise ValueError('Unknown command {}, use one of {}'.format(command, ', '.join(list(COMMANDS) + ['analyze'])))
+    return module, [module + '.py'] + args
+
+def main(argv):
+    args = [a for a in argv[1:] if a != '--dry-run']
+    if not args or args[0] in ('-h', '--help', 'help'):
+        print(__doc__)
+        return
+    try:
+        name, module_argv = resolve(args)
+    except ValueError as e:
+        sys.exit(e)
+    module = importlib.import_module(name)
+    if '--dry-run' not in argv:
+        module.main(module_argv)
+
+if __name__ == '__main__':
+    main(sys.argv)
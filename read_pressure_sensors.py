@@ -6,48 +6,90 @@
 
     Outputs:
 
-        One csv file with the polled data.
+        One csv file with the polled data, and a plot of it unless
+        --no-plot is given.
+
+        With --record, a directory of chunked binary segments that grows
+        until Ctrl-C, using constant memory (see teensy/recorder.py).
+
+    Only the serial and NumPy layers are imported up front, matplotlib is
+    loaded for the plot, so headless captures and recordings start fast
+    and need no display. Also run by pressure.py acquire and record.
 
     Usage
 
-        python read_pressure_sensors.py
+        python read_pressure_sensors.py pressure [points] [--gain=16] [--no-plot]
+        python read_pressure_sensors.py --record directory [period_us]
 '''
 
 import sys
+import asyncio
 from datetime import datetime
-import matplotlib.pyplot as plt
-import pandas as pd
-from teensy import Teensy
 
-def show_figure(x, y):
+import numpy as np
+
+from teensy import Teensy, AcquisitionService, StreamRecorder
+
+def test_name(gain, pressure):
+    return 'test_{}_{}G_{}psi'.format(datetime.now().strftime('%Y-%m-%d_%H-%M-%S'), gain, pressure)
+
+def show_figure(x, y, gain, pressure):
+    import matplotlib.pyplot as plt     # only needed for the plot
     plt.xlabel('Time (us)')
     plt.ylabel('Pressure (counts)')
     plt.title('Uncalibrated Pressure Readings Gain={}, {} PSI'.format(gain, pressure))
     plt.grid(True)
     plt.plot(x, y)
     plt.tight_layout()
-    test_name = 'test_{}_{}G_{}psi'.format(datetime.now().strftime('%Y-%m-%d_%H-%M-%S'), gain, pressure)
-    plt.savefig(test_name + '.png')
+    plt.savefig(test_name(gain, pressure) + '.png')
     plt.show()
 
-def save_data(time, adc0, adc1,):
-    test_name = 'test_{}_{}G_{}psi'.format(datetime.now().strftime('%Y-%m-%d_%H-%M-%S'), gain, pressure)
-    df = pd.DataFrame({
-        'us'  : time,
-        'adc0': adc0,
-        'adc1': adc1
-    })
-    df.to_csv(test_name + '.csv')
+# same layout as the pandas csv files in test_data: ,us,adc0,adc1 with a row index
+def save_data(time, adc0, adc1, gain, pressure):
+    filename = test_name(gain, pressure) + '.csv'
+    rows = np.column_stack((np.arange(len(time)), time, adc0, adc1))
+    np.savetxt(filename, rows, fmt='%d', delimiter=',', header=',us,adc0,adc1', comments='')
+    return filename
 
-if __name__ == '__main__':
+# stream everything to disk until interrupted
+async def record(t, directory, period_us=1000):
+    service = AcquisitionService(t)
+    metadata = {'period_us': period_us, 'port': t.serial_handle.port}
+    with StreamRecorder(directory, metadata=metadata) as recorder:
+        batches = service.subscribe(maxsize=1024)
+        t.send("s {}".format(period_us))    # set sampling period and begin sampling
+        try:
+            await asyncio.gather(service.run(), recorder.consume(batches))
+        finally:
+            print('Recorded {} samples to {}'.format(recorder.samples, directory))
+
+def main(argv):
+    args = [a for a in argv[1:] if not a.startswith('--') or a == '--record']
+    options = dict(a[2:].partition('=')[::2] for a in argv[1:] if a.startswith('--'))
+    if not args or args == ['--record']:
+        sys.exit(__doc__)   # nothing to capture, usage and exit status 1 before opening the port
 
     t = Teensy(verbose=False)
-    t.connect()
+    t.connect(options.get('port'))
+
+    if args[0] == '--record':
+        period_us = int(args[2]) if len(args) > 2 else 1000
+        try:
+            asyncio.run(record(t, args[1], period_us))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            t.send("s")     # stop the data collection
+        return
 
-    gain = 16
-    pressure = sys.argv[1]
-    points_to_acquire = 10000
+    gain = int(options.get('gain') or 16)
+    pressure = args[0]
+    points_to_acquire = int(args[1]) if len(args) > 1 else 10000
 
     timestamps, data0, data1 = t.sample(points_to_acquire)
-    show_figure(timestamps, data0)
-    save_data(timestamps, data0, data1)
+    print('Saved', save_data(timestamps, data0, data1, gain, pressure))
+    if 'no-plot' not in options:
+        show_figure(timestamps, data0, gain, pressure)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -8,97 +8,107 @@
         sys.argv[1] - directory containing raw data. Generated images also save here
         sys.argv[2] - name of the sensor being tested. Gets appended to generated file names
         sys.argv[3] - supply voltage for sensor. Gets appended to generated file names
+        sys.argv[4] - optional filter applied to adc0 before the statistics and plots,
+                      e.g. median:11 or lowpass:50 (see teensy/filters.py)
 
     Outputs:
 
-        One plot for each data point and window size
+        One plot for each data point and window size, only redrawn when
+        the data file changed (see teensy/figures.py)
         Detailed statistics for each pressure point and window size
 
     Usage
 
         python single_pressure_plot_and_stats.py path_to_data_files/ 'name_of_sensor' 'supply_voltage'
+        python single_pressure_plot_and_stats.py path_to_data_files/ 'name_of_sensor' 'supply_voltage' median:11
 '''
 
+import os
 import sys
-import csv
 import glob
 import re
-import statistics
 
 import pandas as pd
-import matplotlib.pyplot as plt
 
-
-def parse_and_sanitize_input_data(filename):
-    data = []
-    with open(filename) as csvfile:
-        data = list(csv.reader(csvfile))
-    col0, col1, col2, col3 = [], [], [], []
-    for row in data:
-        try:
-            float(row[0]), float(row[1]), float(row[2]), float(row[3])
-        except ValueError:
-            continue        # skip rows that have non numerical data
-        col0.append(float(row[0]))
-        col1.append(float(row[1]))
-        col2.append(float(row[2]))
-        col3.append(float(row[3]))
-    return col0, col1, col2, col3
-
-def rolling_average(data, window_size):
-    rolling_sum, result = [0], []
-    for i, x in enumerate(data, 1):
-        rolling_sum.append(rolling_sum[i-1] + x)
-        if i >= window_size:
-            curr_average = (rolling_sum[i] - rolling_sum[i-window_size])/window_size
-            result.append(curr_average)
-    return result
-
-def make_figure(x, y, filename, title='Figure'):
-    plt.xlabel('Time (ms)')
-    plt.ylabel('Adc Output (raw, uncalibrated)')
-    plt.ylim(-25000, 3000)
-    plt.title(title)
-    plt.grid(True)
-    # for i in y:
-    #     plt.plot(x, i, label=pressure)
-    plt.plot(x, y)
-    plt.tight_layout()
-    filename = filename.replace('.csv', '') + '_' + title.replace(' ', '_').lower() + '.png'
-    print("Saving ", filename)
-    plt.savefig(filename)
-    plt.clf()
-    # plt.show()
+from teensy.loader import load_capture, iter_capture
+from teensy.running import chunked_window_stats, accumulated_window_stats
+from teensy.stats import STATS_COLUMNS, WINDOW_SIZES, rolling_means, window_stats
+from teensy.decimate import minmax_decimate
+from teensy.figures import MAX_POINTS, FigureJob, render_figures
+from teensy.filters import make_filter, filter_chunks
+
+STREAM_BYTES = 1 << 30      # files larger than this are never loaded whole for the statistics
+SAMPLE_RATE_HZ = 1000.0     # captures are sampled every ms
+
+
+# draws one window size of adc0 for one data file, runs in a figure worker process
+def plot_window(fig, inputs, params):
+    ax = fig.add_subplot(1, 1, 1)
+    ax.set_xlabel('Time (ms)')
+    ax.set_ylabel('Adc Output (raw, uncalibrated)')
+    ax.set_ylim(-25000, 3000)
+    ax.set_title(params['title'])
+    ax.grid(True)
+    window_size = params['window']
+    idx, ts, adc0, adc1 = load_capture(inputs[0])
+    filt = make_filter(params['filter'], SAMPLE_RATE_HZ)
+    if filt is not None:
+        adc0 = filt.process(adc0)
+    averaged_data = rolling_means(adc0, [window_size])[window_size][0]
+    ax.plot(*minmax_decimate(averaged_data, MAX_POINTS, x=idx[window_size-1:]))
+    fig.tight_layout()
 
 def natural_sort(s):
     _natural_sort_regex = re.compile(r'([0-9]+)')
     return [int(text) if text.isdigit() else text.lower() for text in re.split(_natural_sort_regex, s)]
 
-# build list of files to analyze
-file_list = glob.glob(sys.argv[1]+"/*.csv")
-file_list.sort(key=natural_sort)
-
-# dataframe to hold results
-df = pd.DataFrame(columns=["Data Set Name", "Pressure", "# Samples", "Min", "Max", "Average", "SDev"])
-
-# parse and do calculations for each file
-for f in file_list:
-    try:
-        gain = int(re.findall(r'(\d+)G', f)[0])                 # parse out gain from filename
-        pressure = float(re.findall(r'_(\d+\.\d+)psi', f)[0])   # parse out gain from filename
-    except IndexError:
-        continue            # skip analysis for files that don't have gain in the name
+def main(argv):
+    # build list of files to analyze
+    file_list = glob.glob(argv[1]+"/*.csv")
+    file_list.sort(key=natural_sort)
+    filter_spec = argv[4] if len(argv) > 4 else None
+    make_filter(filter_spec)        # fail on a bad spec before any work is done
 
-    idx, ts, adc0, adc1 = parse_and_sanitize_input_data(f)   # parse data from file
+    # columns of the results, one entry per file
+    results = {c: [] for c in STATS_COLUMNS if c != 'Window'}
+    jobs = []
 
-    # calculate stats we care about for this data set
-    data = [f.split("\\")[-1], pressure, len(adc0), min(adc0), max(adc0), statistics.mean(adc0), statistics.stdev(adc0)]
-    df = df.append(pd.Series(data, index=df.columns), ignore_index=True)
-
-    # # try different averages and make figures
-    for window_size in [1, 5, 10, 50, 100, 500]:
-        averaged_data = rolling_average(adc0, window_size)
-        make_figure(idx[window_size-1:], averaged_data, f, "Pressure={} psi Gain={} Window size={}".format(pressure, gain, window_size))
-
-print(df)
-df.to_csv(sys.argv[1] + "/calibration_data.csv")
+    # parse and do calculations for each file
+    for f in file_list:
+        try:
+            gain = int(re.findall(r'(\d+)G', f)[0])                 # parse out gain from filename
+            pressure = float(re.findall(r'_(\d+\.\d+)psi', f)[0])   # parse out gain from filename
+        except IndexError:
+            continue            # skip analysis for files that don't have gain in the name
+
+        # calculate stats we care about for this data set, the raw data is the window of 1
+        name = f.split("\\")[-1]
+        filt = make_filter(filter_spec, SAMPLE_RATE_HZ)     # fresh state for every file
+        if os.path.getsize(f) > STREAM_BYTES:
+            chunks = (adc0 for idx, ts, adc0, adc1 in iter_capture(f))     # one chunk in memory at a time
+            if filt is not None:
+                chunks = filter_chunks(chunks, filt)
+            stats = accumulated_window_stats(chunked_window_stats(chunks, windows=[1]), name, pressure)[0]
+        else:
+            idx, ts, adc0, adc1 = load_capture(f)   # parse data from file
+            if filt is not None:
+                adc0 = filt.process(adc0)
+            stats = window_stats(adc0, windows=[1], name=name, pressure=pressure)[0]
+        for c in results:
+            results[c].append(stats[c][0])
+
+        # # try different averages and make figures
+        for window_size in WINDOW_SIZES:
+            title = "Pressure={} psi Gain={} Window size={}".format(pressure, gain, window_size)
+            filename = f.replace('.csv', '') + '_' + title.replace(' ', '_').lower() + '.png'
+            params = {'window': window_size, 'title': title, 'filter': filter_spec}
+            jobs.append(FigureJob(filename, plot_window, [f], params))
+
+    render_figures(jobs)
+
+    df = pd.DataFrame(results)
+    print(df)
+    df.to_csv(argv[1] + "/calibration_data.csv")
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1 +1,15 @@
 from .teensy import Teensy
+from .calibration import Calibration
+from .lut import CalibrationLUT, write_lut
+from .decode import SAMPLE_DTYPE, FrameDecoder, LineDecoder
+from .ringbuffer import RingBuffer
+from .running import RunningStats, WindowedStats
+from .acquisition import AcquisitionService
+from .pool import TeensyPool
+from .recorder import StreamRecorder, RecorderThread, Recording
+from .continuity import ContinuityTracker, GAP_DTYPE, gap_mask, interpolate_gaps
+from .handoff import BatchHandoff
+from .pyramid import PyramidWriter, Pyramid
+from .trigger import TriggerStage, Rising, Falling, Crossing, Slope, OutOfBand
+from .filters import MovingAverage, RunningMedian, LowPass, make_filter
+from .noise import characterize, characterize_directory
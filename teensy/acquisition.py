@@ -0,0 +1,99 @@
+'''
+    asyncio acquisition service. One reader pulls everything waiting on the
+    serial port in bulk (in a worker thread, pyserial is blocking), decodes
+    it and publishes each batch of samples to every subscriber.
+
+    Each subscriber gets its own bounded queue. When a subscriber falls
+    behind, its oldest batch is dropped and counted, so a slow consumer
+    never stalls the reader or the other subscribers.
+
+    Usage
+
+        service = AcquisitionService(teensy)
+        plot_batches = service.subscribe(maxsize=16)
+
+        async def plot():
+            async for batch in plot_batches:    # structured SAMPLE_DTYPE arrays
+                ...
+
+        await asyncio.gather(service.run(), plot())
+'''
+
+import asyncio
+import threading
+import concurrent.futures
+
+
+class Subscription():
+
+    def __init__(self, service, maxsize):
+        self.service = service
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0            # batches discarded because this subscriber fell behind
+        self.dropped_samples = 0
+        self.closed = False
+
+    def _put(self, batch):
+        if self.queue.full():
+            old = self.queue.get_nowait()
+            if old is not None:
+                self.dropped += 1
+                self.dropped_samples += len(old)
+        self.queue.put_nowait(batch)
+
+    async def get(self):
+        return await self.queue.get()       # None once the service has stopped
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        batch = await self.queue.get()
+        if batch is None:
+            raise StopAsyncIteration
+        return batch
+
+    def close(self):
+        self.service.unsubscribe(self)
+
+
+class AcquisitionService():
+
+    def __init__(self, device):
+        self.device = device                # anything with a read_block() method, e.g. Teensy
+        self.subscribers = []
+        self.batches = 0
+        self.samples = 0
+        self._stop = threading.Event()     # set by stop(), from any thread, also before run() got going
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='serial-reader')
+
+    def subscribe(self, maxsize=64):
+        sub = Subscription(self, maxsize)
+        self.subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        if sub in self.subscribers:
+            self.subscribers.remove(sub)
+        sub.closed = True
+
+    def publish(self, batch):
+        self.batches += 1
+        self.samples += len(batch)
+        for sub in self.subscribers:
+            sub._put(batch)
+
+    def stop(self):
+        self._stop.set()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while not self._stop.is_set():
+                batch = await loop.run_in_executor(self._executor, self.device.read_block)
+                if len(batch):
+                    self.publish(batch)
+        finally:
+            self._executor.shutdown(wait=False)     # its worker isn't a daemon, it finishes a read still under way
+            for sub in self.subscribers:
+                sub._put(None)              # end of stream
@@ -0,0 +1,56 @@
+'''
+    Converts raw ADC counts to PSI using the fit coefficients written by
+    calculate_calibration_parameters.py. Assumes a coefficient table with
+    the columns:
+
+        Data Set Name, Sensor, ADC, Degree, C[0], C[1], ...
+
+    where C[i] multiplies counts**i. The table is read once and kept as a
+    (sensor, adc, degree) keyed map of coefficient arrays, so whole batches
+    of counts can be converted with one vectorized polynomial evaluation.
+
+    Usage
+
+        cal = Calibration('calibration_coefficients.csv')
+        psi = cal.to_psi(counts, sensor='A', adc=0, deg=3)
+'''
+
+import csv
+import re
+
+import numpy as np
+
+
+class Calibration():
+
+    def __init__(self, filename='calibration_coefficients.csv'):
+        self.filename = filename
+        self.coefficients = {}
+        with open(filename, newline='') as csvfile:
+            reader = csv.DictReader(csvfile)
+            coeff_columns = sorted((c for c in reader.fieldnames if re.fullmatch(r'C\[\d+\]', c)),
+                                   key=lambda c: int(c[2:-1]))
+            for row in reader:
+                key = (row['Sensor'], int(row['ADC']), int(row['Degree']))
+                coeffs = np.array([float(row[c]) for c in coeff_columns])
+                self.coefficients[key] = np.trim_zeros(coeffs, 'b')     # drop padded high order 0s
+
+    def keys(self):
+        return self.coefficients.keys()
+
+    def coeffs(self, sensor, adc, deg=3):
+        try:
+            return self.coefficients[(sensor, int(adc), int(deg))]
+        except KeyError:
+            raise KeyError('No calibration for sensor {} adc {} degree {} in {}'.format(
+                           sensor, adc, deg, self.filename)) from None
+
+    # evaluate the fit polynomial for a whole batch of counts using Horner's method
+    def to_psi(self, counts, sensor, adc, deg=3):
+        coeffs = self.coeffs(sensor, adc, deg)
+        x = np.asarray(counts, dtype=np.float64)
+        psi = np.full(x.shape, coeffs[-1] if len(coeffs) else 0.0)
+        for c in coeffs[-2::-1]:
+            psi *= x
+            psi += c
+        return psi
@@ -0,0 +1,193 @@
+'''
+    Timestamp continuity of the sample stream. Every sample carries the
+    firmware's ms_since_start, so with the configured period each interval
+    between consecutive samples should be period_us long, give or take the
+    1 ms resolution of the timestamps. ContinuityTracker checks whole
+    batches at once and counts
+
+        gaps        intervals longer than the period rounded up to whole ms,
+                    with the number of samples missing in them
+        duplicates  timestamps that repeat (for periods >= 1 ms) or go back
+        outliers    corrupted timestamps, runs of up to OUTLIER_RUN samples
+                    outside the range of the samples around them, stepped
+                    into and back out of in opposite directions while the
+                    samples around them stay in order. Their timestamps are
+                    taken as one period after another and the intervals are
+                    checked again, so a real gap next to them counts once
+        jitter      RunningStats of interval - period_us in us, over the
+                    intervals that are none of them, so it includes the
+                    +-1 ms quantization of the timestamps
+
+    Samples that arrive after an interval that is off can only be told
+    from outliers by the samples after them, so when they are among the
+    last OUTLIER_RUN of a batch they are checked with the next batch, or
+    by finish() once the stream has ended.
+
+    Every gap is also appended to an index of GAP_DTYPE records:
+
+        index       position of the first sample after the gap
+        before_ms   timestamp of the last sample before the gap
+        after_ms    timestamp of the first sample after the gap
+        missing     estimated number of samples lost
+
+    StreamRecorder stores the index next to its segments (gaps.bin), and
+    gap_mask / interpolate_gaps use it to exclude or fill the gaps.
+
+    Usage
+
+        tracker = ContinuityTracker(period_us=1000)
+        result = tracker.update(batch['ms'])     # BatchContinuity of this batch
+        tracker.finish()                        # end of the stream, checks the samples held back
+        tracker.gaps, tracker.missing, tracker.duplicates, tracker.outliers, tracker.jitter.sdev
+
+        keep = gap_mask(len(samples), Recording('recording').gaps(), margin=10)
+        filled = interpolate_gaps(samples, Recording('recording').gaps())
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+from .running import RunningStats
+
+OUTLIER_RUN = 3         # most consecutive corrupted timestamps told from a gap, one bad line can give two
+
+GAP_DTYPE = np.dtype([('index', '<i8'), ('before_ms', '<i8'), ('after_ms', '<i8'), ('missing', '<i8')])
+
+BatchContinuity = namedtuple('BatchContinuity', ['samples', 'gaps', 'missing', 'duplicates', 'max_jitter_us',
+                                                 'outliers'])
+
+
+# gap and duplicate flags of intervals in us that should be period_us long, with 1 ms timestamps
+def _check(step_us, period_us):
+    gap = step_us > -(-period_us//1000)*1000       # a period can span one more ms than it is long
+    duplicate = (step_us < 0) | ((step_us == 0) & (period_us >= 1000))
+    return gap, duplicate
+
+
+class ContinuityTracker():
+
+    def __init__(self, period_us=1000):
+        self.period_us = int(period_us)
+        self.reset()
+
+    # starts over, e.g. after the sampling period changed
+    def reset(self, period_us=None):
+        if period_us is not None:
+            self.period_us = int(period_us)
+        self.samples = 0
+        self.gaps = 0
+        self.missing = 0
+        self.duplicates = 0
+        self.outliers = 0
+        self.jitter = RunningStats()
+        self.index = np.empty(0, dtype=GAP_DTYPE)
+        self._last_ms = None        # last sample whose interval has been checked
+        self._held = np.empty(0, dtype=np.int64)     # samples after it that wait for the next batch
+
+    # final: no samples follow, the ones held back are checked too
+    def update(self, ms, final=False):
+        ms = np.asarray(ms, dtype=np.int64)
+        if not (len(ms) or final and len(self._held)) or self.period_us <= 0:
+            self.samples += len(ms)
+            return BatchContinuity(len(ms), 0, 0, 0, 0.0, 0)
+        # stream position of the first of ms_before, the first sample has nothing to compare with
+        first = self.samples - len(self._held) - (self._last_ms is not None)
+        last = [] if self._last_ms is None else [self._last_ms]
+        ms_before = np.concatenate((last, self._held, ms)).astype(np.int64)
+        step_us = np.diff(ms_before)*1000
+        gap, duplicate = _check(step_us, self.period_us)
+        off = gap | duplicate
+
+        # outliers: runs outside the range of the samples around them, off into them and back out
+        outlier = np.zeros(len(ms_before), dtype=bool)
+        ms_step = -(-self.period_us//1000)      # one period in whole ms
+        runs = min(OUTLIER_RUN, len(ms_before) - 2) if off.any() else 0     # nothing to find in a clean batch
+        for run in range(1, runs + 1):
+            before, after = ms_before[:-run - 1], ms_before[run + 1:]       # around the runs starting at 1...
+            samples = np.lib.stride_tricks.sliding_window_view(ms_before[1:-1], run)
+            outside = np.all((samples < before[:, None]) | (samples > after[:, None]), axis=1)
+            turns = np.sign(step_us[:-run])*np.sign(step_us[run:]) < 0      # signs, the steps can be huge
+            backwards = _check((after - before)*1000, (run + 1)*self.period_us)[1]
+            start = 1 + np.flatnonzero(off[:-run] & off[run:] & turns & outside & ~backwards)
+            start = start[np.diff(start, prepend=-run - 1) > run]     # overlapping runs
+            if not len(start):
+                continue
+            for j in range(run):
+                ms_before[start + j] = np.minimum(ms_before[start - 1] + (j + 1)*ms_step, ms_before[start + run])
+                outlier[start + j] = True
+            step_us = np.diff(ms_before)*1000
+            gap, duplicate = _check(step_us, self.period_us)
+            off = gap | duplicate
+
+        # samples after an interval that is off near the end wait for the ones after them
+        tail = max(len(step_us) - OUTLIER_RUN, 0)
+        trailing = np.flatnonzero(off[tail:])
+        held = tail + trailing[0] + 1 if len(trailing) and not final else len(ms_before)   # first sample held back
+        checked = np.arange(len(step_us)) < held - 1
+        gap &= checked
+        duplicate &= checked
+        estimated = outlier[:-1] | outlier[1:]      # intervals to or from an estimated timestamp
+        error = step_us[checked & ~off & ~estimated] - self.period_us
+
+        where = np.flatnonzero(gap)
+        gaps = np.empty(len(where), dtype=GAP_DTYPE)
+        gaps['index'] = first + 1 + where
+        gaps['before_ms'] = ms_before[where]
+        gaps['after_ms'] = ms_before[where + 1]
+        gaps['missing'] = np.maximum(np.rint(step_us[where]/self.period_us).astype(np.int64) - 1, 1)
+        if len(gaps):
+            self.index = np.concatenate((self.index, gaps))
+
+        self.samples += len(ms)
+        self.gaps += len(gaps)
+        self.missing += int(gaps['missing'].sum())
+        self.duplicates += int(np.count_nonzero(duplicate))
+        self.outliers += int(np.count_nonzero(outlier))
+        self.jitter.update(error)
+        self._last_ms = int(ms_before[held - 1])
+        self._held = ms_before[held:].copy()
+        return BatchContinuity(len(ms), len(gaps), int(gaps['missing'].sum()), int(np.count_nonzero(duplicate)),
+                               float(np.abs(error).max()) if len(error) else 0.0, int(np.count_nonzero(outlier)))
+
+    # checks the samples still held back, at the end of the stream
+    def finish(self):
+        return self.update([], final=True)
+
+    # gap records added since the last call, for appending to a file
+    def take_index(self):
+        index, self.index = self.index, np.empty(0, dtype=GAP_DTYPE)
+        return index
+
+    def to_dict(self):
+        return {'period_us': self.period_us, 'samples': self.samples, 'gaps': self.gaps,
+                'missing': self.missing, 'duplicates': self.duplicates, 'outliers': self.outliers,
+                'jitter_us': self.jitter.to_dict()}
+
+
+# False for the two samples bordering each gap and margin more on either side
+def gap_mask(num_samples, gaps, margin=0):
+    keep = np.ones(num_samples, dtype=bool)
+    starts = np.clip(np.asarray(gaps['index']) - 1 - margin, 0, num_samples)
+    stops = np.clip(np.asarray(gaps['index']) + 1 + margin, 0, num_samples)
+    change = np.zeros(num_samples + 1, dtype=np.int64)
+    np.add.at(change, starts, 1)
+    np.add.at(change, stops, -1)
+    keep[np.cumsum(change[:-1]) > 0] = False
+    return keep
+
+# samples with the missing ones put back, every field linearly interpolated across the gaps;
+# samples has to start at index 0 of the gap index, e.g. a whole Recording.read()
+def interpolate_gaps(samples, gaps):
+    gaps = gaps[(gaps['index'] > 0) & (gaps['index'] < len(samples))]
+    if not len(gaps):
+        return samples.copy()
+    inserted = np.zeros(len(samples), dtype=np.int64)
+    inserted[gaps['index']] = gaps['missing']
+    position = np.arange(len(samples)) + np.cumsum(inserted)     # where every sample lands
+    grid = np.arange(position[-1] + 1)
+    out = np.empty(len(grid), dtype=samples.dtype)
+    for name in samples.dtype.names:
+        values = np.interp(grid, position, samples[name].astype(np.float64))
+        out[name] = np.rint(values) if np.issubdtype(samples.dtype[name], np.integer) else values
+    return out
@@ -0,0 +1,31 @@
+'''
+    Min/max decimation for plotting long traces. Each output column keeps the
+    minimum and maximum of the samples that fall into it, so spikes stay
+    visible and a trace drawn at one column per pixel looks the same as the
+    full resolution one while costing only 2*columns points to draw.
+'''
+
+import numpy as np
+
+
+# reduce y (shape (n,) or (n, channels)) to at most 2*columns points per channel
+def minmax_decimate(y, columns, x=None):
+    y = np.asarray(y)
+    n = len(y)
+    if x is None:
+        x = np.arange(n)
+    columns = int(columns)
+    if columns < 1 or n <= 2*columns:
+        return np.asarray(x), y             # already cheap enough to draw as is
+    edges = np.linspace(0, n, columns + 1).astype(np.intp)
+    starts = edges[:-1]
+    lo = np.minimum.reduceat(y, starts, axis=0)
+    hi = np.maximum.reduceat(y, starts, axis=0)
+    out_y = np.empty((2*columns,) + y.shape[1:], dtype=y.dtype)
+    out_y[0::2] = lo
+    out_y[1::2] = hi
+    x = np.asarray(x)
+    out_x = np.empty(2*columns, dtype=x.dtype)
+    out_x[0::2] = x[starts]
+    out_x[1::2] = x[edges[1:] - 1]
+    return out_x, out_y
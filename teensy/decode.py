@@ -0,0 +1,170 @@
+'''
+    Decoders for the data streamed by dual_diff_read_with_interval_timer.ino.
+    Every decoder takes raw serial bytes in arbitrary chunks, keeps partial
+    lines/frames for the next chunk and returns a structured array of samples:
+
+        ms    - int32, ms_since_start on the Teensy
+        adc0  - int16, raw differential counts
+        adc1  - int16, raw differential counts
+
+    ASCII lines are <ms>:<adc0>:<adc1> terminated by \r\n. Lines that don't
+    match, or hold a value that doesn't fit its field, are counted as
+    malformed and skipped.
+
+    Binary frames are 14 packed little-endian bytes:
+
+        <sync:u16 = 0xA55A><seq:u16><ms:u32><adc0:i16><adc1:i16><checksum:u16>
+
+    The checksum is CRC-16/CCITT (poly 0x1021, init 0xFFFF) over the 10 bytes
+    between sync and checksum.
+    A frame is only accepted if the sync word and the checksum match, so the
+    decoder resynchronizes on its own after dropped or corrupted bytes.
+'''
+
+import re
+
+import numpy as np
+
+SAMPLE_DTYPE = np.dtype([('ms', '<i4'), ('adc0', '<i2'), ('adc1', '<i2')])
+
+FRAME_SYNC = 0xA55A
+FRAME_DTYPE = np.dtype([('sync', '<u2'), ('seq', '<u2'), ('ms', '<u4'),
+                        ('adc0', '<i2'), ('adc1', '<i2'), ('checksum', '<u2')])
+FRAME_SIZE = FRAME_DTYPE.itemsize
+
+_SYNC_BYTES = np.frombuffer(np.array(FRAME_SYNC, dtype='<u2').tobytes(), dtype=np.uint8)
+_PAYLOAD = slice(2, FRAME_SIZE - 2)
+
+_LINE = re.compile(rb'^-?\d{1,10}:-?\d{1,5}:-?\d{1,5}\r?$', re.M)
+
+def _crc16_table(poly=0x1021):
+    table = np.zeros(256, dtype=np.uint16)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ poly) if crc & 0x8000 else (crc << 1)
+        table[i] = crc & 0xFFFF
+    return table
+
+_CRC16_TABLE = _crc16_table()
+
+
+# CRC-16/CCITT of each row of an (n, k) uint8 array, one byte column at a time
+def crc16(rows):
+    crc = np.full(len(rows), 0xFFFF, dtype=np.uint16)
+    for column in rows.T:
+        crc = (crc << 8) ^ _CRC16_TABLE[(crc >> 8) ^ column]
+    return crc
+
+# pack samples into binary frames, the same way the firmware does
+def encode_frames(ms, adc0, adc1, seq_start=0):
+    frames = np.zeros(len(ms), dtype=FRAME_DTYPE)
+    frames['sync'] = FRAME_SYNC
+    frames['seq'] = (seq_start + np.arange(len(ms))) & 0xFFFF
+    frames['ms'] = ms
+    frames['adc0'] = adc0
+    frames['adc1'] = adc1
+    raw = frames.view(np.uint8).reshape(-1, FRAME_SIZE)
+    frames['checksum'] = crc16(raw[:, _PAYLOAD])
+    return frames.tobytes()
+
+
+class FrameDecoder():
+
+    def __init__(self):
+        self._pending = b''         # bytes that may still become part of a frame
+        self._last_seq = None
+        self.frames = 0             # frames accepted
+        self.dropped = 0            # frames missing according to the sequence counter
+        self.skipped_bytes = 0      # bytes discarded while looking for a valid frame
+        self.resyncs = 0            # number of times the stream had to be realigned
+
+    def reset(self):
+        self.__init__()
+
+    def feed(self, data):
+        buf = self._pending + bytes(data)
+        raw = np.frombuffer(buf, dtype=np.uint8)
+        last_start = len(raw) - FRAME_SIZE      # last offset that can hold a whole frame
+        if last_start < 0:
+            self._pending = buf
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+
+        # every offset where the sync word appears is a candidate frame
+        starts = np.flatnonzero((raw[:last_start + 1] == _SYNC_BYTES[0]) &
+                                (raw[1:last_start + 2] == _SYNC_BYTES[1]))
+        candidates = raw[starts[:, None] + np.arange(FRAME_SIZE)]
+        checksums = candidates[:, -2].astype(np.uint16) | (candidates[:, -1].astype(np.uint16) << 8)
+        valid = checksums == crc16(candidates[:, _PAYLOAD])
+        starts, candidates = starts[valid], candidates[valid]
+
+        # a sync word inside another frame can pass the checksum by chance, keep the first of any overlap
+        if np.any(np.diff(starts) < FRAME_SIZE):
+            keep, end = [], 0
+            for i, s in enumerate(starts):
+                if s >= end:
+                    keep.append(i)
+                    end = s + FRAME_SIZE
+            starts, candidates = starts[keep], candidates[keep]
+
+        end = starts[-1] + FRAME_SIZE if len(starts) else 0
+        consumed = max(end, last_start + 1)
+        self._pending = buf[consumed:]
+        self.skipped_bytes += consumed - len(starts) * FRAME_SIZE
+        self.resyncs += int(np.count_nonzero(np.diff(starts, prepend=-FRAME_SIZE) != FRAME_SIZE))
+        self.frames += len(starts)
+
+        frames = np.ascontiguousarray(candidates).view(FRAME_DTYPE).ravel()
+        self._count_dropped(frames['seq'])
+        samples = np.empty(len(frames), dtype=SAMPLE_DTYPE)
+        samples['ms'] = frames['ms']
+        samples['adc0'] = frames['adc0']
+        samples['adc1'] = frames['adc1']
+        return samples
+
+    def _count_dropped(self, seq):
+        if len(seq) == 0:
+            return
+        if self._last_seq is not None:
+            seq = np.concatenate(([self._last_seq], seq))
+        gaps = (np.diff(seq.astype(np.int64)) - 1) % 0x10000
+        self.dropped += int(gaps.sum())
+        self._last_seq = seq[-1]
+
+
+# True where the values fit the integer type, not wrapping around when cast
+def _fits(values, dtype):
+    info = np.iinfo(dtype)
+    return (values >= info.min) & (values <= info.max)
+
+
+class LineDecoder():
+
+    def __init__(self):
+        self._pending = b''         # trailing partial line
+        self.lines = 0              # complete lines seen
+        self.malformed = 0          # complete lines that could not be parsed
+
+    def reset(self):
+        self.__init__()
+
+    def feed(self, data):
+        body, _, self._pending = (self._pending + bytes(data)).rpartition(b'\n')
+        num_lines = body.count(b'\n') + 1 if body else 0
+        good = _LINE.findall(body)
+        if len(good) != num_lines:          # only rebuild the chunk when something is wrong with it
+            body = b'\n'.join(good)
+        self.lines += num_lines
+        self.malformed += num_lines - len(good)
+
+        # the whole chunk is parsed by numpy, whitespace (\r, \n) separates values just like ' '
+        values = np.fromstring(body.replace(b':', b' '), dtype=np.int64, sep=' ').reshape(-1, 3)
+        fits = _fits(values[:, 0], 'i4') & _fits(values[:, 1], 'i2') & _fits(values[:, 2], 'i2')
+        if not fits.all():                  # e.g. 40000 counts, which would wrap around in int16
+            self.malformed += int(np.count_nonzero(~fits))
+            values = values[fits]
+        samples = np.empty(len(values), dtype=SAMPLE_DTYPE)
+        samples['ms'] = values[:, 0]
+        samples['adc0'] = values[:, 1]
+        samples['adc1'] = values[:, 2]
+        return samples
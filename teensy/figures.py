@@ -0,0 +1,115 @@
+'''
+    Incremental, headless figure pipeline for the stats scripts.
+
+    A figure is described by a FigureJob: the png to write, a module level
+    plot function, the input files it reads and its plot parameters. The
+    job's key is a hash of the plot function name, the content of every
+    input file and the parameters. A plot function of a script run directly
+    (module __main__) is named after the script, so running it directly or
+    through pressure.py gives the same keys. A manifest next to the figures stores
+    the key each png was rendered with, and a job whose key matches (and
+    whose png still exists) is skipped. Changing one capture file only
+    re-renders the figures that read it.
+
+    Outstanding jobs are rendered on the Agg backend in worker processes.
+    Plot functions receive a bare matplotlib Figure, no pyplot state:
+
+        def plot(fig, inputs, params):
+            ax = fig.add_subplot(1, 1, 1)
+            ...
+
+    Usage
+
+        jobs = [FigureJob('out.png', plot, ['capture.csv'], {'window': 5})]
+        render_figures(jobs)
+'''
+
+import hashlib
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+MANIFEST = '.figure_manifest.json'
+MAX_POINTS = 2000           # traces longer than this are min/max decimated before plotting
+
+FigureJob = namedtuple('FigureJob', ['filename', 'plot', 'inputs', 'params'])
+
+_digests = {}
+
+
+# content hash of a file, remembered per (path, size, mtime) for this process
+def file_digest(filename):
+    st = os.stat(filename)
+    memo = (os.path.abspath(filename), st.st_size, st.st_mtime_ns)
+    if memo not in _digests:
+        h = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _digests[memo] = h.hexdigest()
+    return _digests[memo]
+
+# module.qualname of a plot function, with the module a script would have when imported
+def plot_name(plot):
+    module = plot.__module__
+    if module == '__main__':
+        main = sys.modules['__main__']
+        spec = getattr(main, '__spec__', None)      # set by python -m
+        module = spec.name if spec is not None else os.path.splitext(os.path.basename(main.__file__))[0]
+    return '{}.{}'.format(module, plot.__qualname__)
+
+def job_key(job):
+    h = hashlib.sha1()
+    h.update(plot_name(job.plot).encode())
+    for f in job.inputs:
+        h.update(file_digest(f).encode())
+    h.update(json.dumps(job.params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+def _load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(directory, manifest):
+    filename = os.path.join(directory, MANIFEST)
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(filename + '.tmp', filename)
+
+# executed in the worker processes
+def _render(job):
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(6.4, 4.8))
+    job.plot(fig, job.inputs, job.params)
+    fig.savefig(job.filename)
+    return job.filename
+
+# render every job whose png is missing or out of date, returns the filenames rendered
+def render_figures(jobs, workers=None, force=False):
+    manifests, todo = {}, []
+    for job in jobs:
+        directory = os.path.dirname(os.path.abspath(job.filename))
+        manifest = manifests.setdefault(directory, _load_manifest(directory))
+        key = job_key(job)
+        name = os.path.basename(job.filename)
+        if force or manifest.get(name) != key or not os.path.exists(job.filename):
+            todo.append((job, directory, name, key))
+    if not todo:
+        return []
+
+    rendered = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for (job, directory, name, key), filename in zip(todo, pool.map(_render, [t[0] for t in todo])):
+            print('Saving ', filename)
+            manifests[directory][name] = key
+            rendered.append(filename)
+    for directory, manifest in manifests.items():
+        _save_manifest(directory, manifest)
+    return rendered
@@ -0,0 +1,141 @@
+'''
+    Streaming filters that run on chunks of samples and carry their state
+    across chunk boundaries, so filtering a stream chunk by chunk gives
+    exactly the same output as filtering it in one go. Every filter works on
+    (n,) or (n, channels) arrays, all channels at once, and returns an
+    array of the same shape.
+
+        MovingAverage(window)           mean of the last window samples
+        RunningMedian(window)           median of the last window samples
+        LowPass(cutoff, fs, order)      Butterworth low-pass, second-order
+                                        sections (needs scipy)
+
+    All of them are causal: output i only depends on samples up to i. The
+    stream is assumed to have been at its first value forever before it
+    started, the window filters start with window - 1 copies of it and the
+    low-pass with its steady state, so there is no startup transient.
+
+    The window filters work on the carried samples followed by the new
+    chunk, and every output is computed from the same values in the same
+    order however the stream is chunked. The moving average adds up
+    shifted copies of the chunk (window contiguous adds rather than a
+    strided sum per sample), the median reduces a sliding window view.
+
+    make_filter builds a filter from a short spec, for command lines and
+    the GUI:
+
+        mean:10   median:11   lowpass:20   lowpass:20:2   (cutoff in Hz, order)
+
+    Usage
+
+        f = LowPass(cutoff=20, fs=1000, channels=2)
+        for chunk in chunks:
+            smooth = f.process(chunk)
+
+        f = make_filter('median:11', fs=1000)
+        filtered = np.concatenate(list(filter_chunks(chunks, f)))
+'''
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FILTERS = ('mean', 'median', 'lowpass')
+
+
+def _as_2d(chunk, channels):
+    x = np.asarray(chunk, dtype=np.float64)
+    return x.reshape(len(x), channels), x.shape
+
+
+class _WindowFilter():
+
+    def __init__(self, window, channels=1):
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.window = int(window)
+        self.channels = channels
+        self.reset()
+
+    def reset(self):
+        self._carry = None          # the last window - 1 samples
+
+    def process(self, chunk):
+        x, shape = _as_2d(chunk, self.channels)
+        if not len(x):
+            return x.reshape(shape)
+        if self._carry is None:
+            self._carry = np.repeat(x[:1], self.window - 1, axis=0)
+        data = np.concatenate((self._carry, x))
+        out = self._reduce(data, len(x))
+        self._carry = data[len(data) - (self.window - 1):]
+        return out.reshape(shape)
+
+
+class MovingAverage(_WindowFilter):
+
+    def _reduce(self, data, n):
+        total = data[:n].copy()
+        for k in range(1, self.window):
+            total += data[k:k + n]
+        return total/self.window
+
+
+class RunningMedian(_WindowFilter):
+
+    def _reduce(self, data, n):
+        return np.median(sliding_window_view(data, self.window, axis=0), axis=-1)    # (n, channels, window)
+
+
+class LowPass():
+
+    def __init__(self, cutoff, fs, order=4, channels=1):
+        from scipy import signal        # only needed for the Butterworth filter
+        self._sosfilt = signal.sosfilt
+        self.cutoff = cutoff
+        self.fs = fs
+        self.order = order
+        self.channels = channels
+        self.sos = signal.butter(order, cutoff, fs=fs, output='sos')
+        self._zi_step = signal.sosfilt_zi(self.sos)     # steady state for a unit step, (sections, 2)
+        self.reset()
+
+    def reset(self):
+        self._zi = None
+
+    def process(self, chunk):
+        x, shape = _as_2d(chunk, self.channels)
+        if not len(x):
+            return x.reshape(shape)
+        if self._zi is None:
+            self._zi = self._zi_step[:, :, np.newaxis]*x[0]      # (sections, 2, channels)
+        out, self._zi = self._sosfilt(self.sos, x, axis=0, zi=self._zi)
+        return out.reshape(shape)
+
+
+# filter from a spec like 'mean:10', 'median:11', 'lowpass:20' or 'lowpass:20:2', None for 'none' or ''
+def make_filter(spec, fs=1000.0, channels=1):
+    if not spec or spec == 'none':
+        return None
+    name, *args = spec.split(':')
+    try:                        # only a spec that can't be parsed is unknown
+        if name == 'mean':
+            make, params = MovingAverage, (int(args[0]), channels)
+        elif name == 'median':
+            make, params = RunningMedian, (int(args[0]), channels)
+        elif name == 'lowpass':
+            make, params = LowPass, (float(args[0]), fs, int(args[1]) if len(args) > 1 else 4, channels)
+        else:
+            make = None
+    except (IndexError, ValueError):
+        make = None
+    if make is None:
+        raise ValueError('Unknown filter {}, use one of {} like mean:10 or lowpass:20'.format(spec, FILTERS))
+    try:
+        return make(*params)
+    except ValueError as e:     # parsed but not possible, e.g. a cutoff above Nyquist
+        raise ValueError('Bad filter {}: {}'.format(spec, e)) from e
+
+# filtered chunks, for the chunked readers in teensy/loader.py and teensy/recorder.py
+def filter_chunks(chunks, filt):
+    for chunk in chunks:
+        yield filt.process(chunk)
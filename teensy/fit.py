@@ -0,0 +1,62 @@
+'''
+    Batched polynomial least squares for the pressure calibration. Every
+    data set and every degree is fitted in one pass: the Vandermonde
+    matrices of all (data set, degree) pairs are stacked into one array,
+    zero padded to the longest data set and the highest degree, and solved
+    together with a single batched pseudo inverse. Padding rows and columns
+    are all zeros so they don't change the fit, padded coefficients come
+    out as exactly 0.
+
+    Counts are scaled to [-1, 1] per data set before building the matrices
+    to keep them well conditioned, the coefficients are scaled back.
+
+    The leave-one-out residual of every point comes from the same solve,
+    using the diagonal of the hat matrix H = A pinv(A):
+
+        loo[i] = (y[i] - fit[i]) / (1 - H[i, i])
+
+    It is nan when the fit has no spare points (n <= degree + 1).
+
+    Usage
+
+        coeffs, residuals, loo = fit_polynomials([counts_a, counts_b], [psi_a, psi_b], degrees=[1, 2, 3])
+        coeffs[set, d]          # low to high, padded with 0s to max(degrees) + 1
+'''
+
+import numpy as np
+
+
+# returns coeffs (sets, degrees, max degree + 1), residuals and loo residuals (sets, degrees, longest set)
+def fit_polynomials(xs, ys, degrees=(1, 2, 3)):
+    degrees = list(degrees)
+    sets = len(xs)
+    n = max(len(x) for x in xs)
+    order = max(degrees) + 1
+
+    x = np.zeros((sets, n))
+    y = np.zeros((sets, n))
+    valid = np.zeros((sets, n), dtype=bool)
+    for i, (xi, yi) in enumerate(zip(xs, ys)):
+        x[i, :len(xi)] = xi
+        y[i, :len(yi)] = yi
+        valid[i, :len(xi)] = True
+    scale = np.abs(x).max(axis=1)
+    scale[scale == 0] = 1.0
+
+    # A[set, degree] is the (n, order) Vandermonde matrix with padded rows and columns zeroed
+    powers = (x/scale[:, np.newaxis])[..., np.newaxis] ** np.arange(order)
+    mask = np.arange(order) <= np.array(degrees)[:, np.newaxis]
+    A = powers[:, np.newaxis] * mask[np.newaxis, :, np.newaxis, :] * valid[:, np.newaxis, :, np.newaxis]
+
+    pinv = np.linalg.pinv(A)                                        # (sets, degrees, order, n)
+    scaled = np.einsum('sdon,sn->sdo', pinv, y)
+    fitted = np.einsum('sdno,sdo->sdn', A, scaled)
+    residuals = np.where(valid[:, np.newaxis], y[:, np.newaxis] - fitted, np.nan)
+
+    hat = np.einsum('sdno,sdon->sdn', A, pinv)
+    spare = np.array([[len(xi) > d + 1 for d in degrees] for xi in xs])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        loo = np.where(spare[..., np.newaxis], residuals/(1 - hat), np.nan)
+
+    coeffs = scaled / scale[:, np.newaxis, np.newaxis] ** np.arange(order)
+    return coeffs, residuals, loo
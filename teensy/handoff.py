@@ -0,0 +1,128 @@
+'''
+    Bounded, thread safe hand-off of sample batches from the acquisition
+    thread to the GUI thread. The producer put()s whole batches, the
+    consumer takes everything waiting in one drain() and gets it back as a
+    single concatenated batch.
+
+    At most maxsize batches are held. When the consumer stalls (a Save, a
+    window drag) and the hand-off is full, policy decides what gives:
+
+        'drop_oldest'   the oldest batch is discarded, the display stays live
+        'drop_newest'   the new batch is discarded, what is held is kept
+        'block'         put() waits for room, backpressure goes upstream
+
+    A producer running in an asyncio loop (forwarding an AcquisitionService
+    subscription) awaits put_async() instead, which waits for room in an
+    executor thread, so a full 'block' hand-off never stalls the loop and
+    the serial reader with it.
+
+    Dropped batches and samples are counted. drain() and clear() swap the
+    whole deque out, so pausing discards any backlog in O(1).
+
+    Metrics: depth (batches held now) and max_depth, batch_size
+    (RunningStats of samples per batch) and latency (RunningStats of the
+    time between put() and drain() in ms, one value per batch).
+
+    Usage
+
+        handoff = BatchHandoff(maxsize=256, policy='drop_oldest')
+        handoff.put(batch)              # acquisition thread
+        await handoff.put_async(batch)  # acquisition coroutine
+        data = handoff.drain()          # GUI thread, None if nothing waiting
+        handoff.latency.mean, handoff.dropped_samples
+'''
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from .running import RunningStats
+
+POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+class BatchHandoff():
+
+    def __init__(self, maxsize=256, policy='drop_oldest'):
+        if policy not in POLICIES:
+            raise ValueError('Unknown overflow policy {}, use one of {}'.format(policy, POLICIES))
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = int(maxsize)
+        self.policy = policy
+        self._batches = deque()         # (enqueue time, batch)
+        self._room = threading.Condition()
+        self._closed = False
+        self.max_depth = 0
+        self.dropped = 0                # batches discarded by the overflow policy
+        self.dropped_samples = 0
+        self.batch_size = RunningStats()
+        self.latency = RunningStats()
+
+    def __len__(self):
+        return len(self._batches)
+
+    @property
+    def depth(self):
+        return len(self._batches)
+
+    # False if the batch was dropped, or the hand-off closed while waiting for room
+    def put(self, batch, timeout=None):
+        with self._room:
+            if self._closed:
+                return False
+            if len(self._batches) >= self.maxsize:
+                if self.policy == 'drop_newest':
+                    self._drop(batch)
+                    return False
+                if self.policy == 'block':
+                    self._room.wait_for(lambda: len(self._batches) < self.maxsize or self._closed, timeout)
+                    if self._closed or len(self._batches) >= self.maxsize:
+                        return False
+                else:
+                    self._drop(self._batches.popleft()[1])
+            self._batches.append((time.monotonic(), batch))
+            self.max_depth = max(self.max_depth, len(self._batches))
+            return True
+
+    # put() for coroutines, only a 'block' wait for room leaves the loop
+    async def put_async(self, batch, timeout=None):
+        if self.policy != 'block' or len(self._batches) < self.maxsize:
+            return self.put(batch)      # room can only grow until this producer adds, so no wait
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.put, batch, timeout)
+
+    def _drop(self, batch):
+        self.dropped += 1
+        self.dropped_samples += len(batch)
+
+    def _take(self):
+        with self._room:
+            batches, self._batches = self._batches, deque()
+            self._room.notify_all()
+        return batches
+
+    # everything waiting as one batch, or None
+    def drain(self):
+        batches = self._take()
+        if not batches:
+            return None
+        now = time.monotonic()
+        times = np.fromiter((t for t, _ in batches), dtype=np.float64, count=len(batches))
+        self.latency.update((now - times)*1e3)
+        data = [b for _, b in batches]
+        self.batch_size.update([len(b) for b in data])
+        return np.concatenate(data) if len(data) > 1 else data[0]
+
+    # throws away everything waiting without looking at it
+    def clear(self):
+        self._take()
+
+    # wakes a blocked put(), nothing is accepted afterwards
+    def close(self):
+        with self._room:
+            self._closed = True
+            self._room.notify_all()
@@ -0,0 +1,111 @@
+'''
+    Blitted live plot. The lines, legend and labels are created once; every
+    frame only updates the line data with set_data, restores the cached
+    background and redraws the animated artists. Windows longer than twice
+    the axes width in pixels are min/max decimated to one column per pixel,
+    so a 1,000,000 sample window draws about as fast as a 1,000 sample one.
+
+    The full canvas is only redrawn when the axes limits have to change or
+    the figure gets resized. The y limits grow as soon as the data leaves
+    them but only shrink once they are more than twice the data range (with
+    its margin), and never below min_span, so a steady sensor with a few
+    counts of noise keeps the same limits and is only blitted. The time
+    spent in the last frames is shown in the top left corner of the axes.
+
+    Usage
+
+        plot = LivePlot(ax)
+        plot.update(window_data[:, 1:], enabled=(True, False))
+'''
+
+import time
+
+import numpy as np
+
+from .decimate import minmax_decimate
+
+
+class LivePlot():
+
+    def __init__(self, ax, labels=('adc0', 'adc1'), colors=('C0', 'C1'),
+                 title='Live Sensor Readings', xlabel='Time (ms)', ylabel='Pressure (psi)', min_span=0.2):
+        self.ax = ax
+        self.min_span = min_span        # least y range shown, in data units
+        self.fig = ax.figure
+        self.lines = [ax.plot([], [], c, label=l, animated=True)[0] for l, c in zip(labels, colors)]
+        self.frame_text = ax.text(0.01, 0.98, '', transform=ax.transAxes, va='top', ha='left',
+                                  fontsize='small', animated=True)
+        ax.legend(loc='lower right')
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        ax.grid(True)
+        self.frame_ms = 0.0             # smoothed time spent in update()
+        self._background = None
+        self._cid = self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+
+    @property
+    def artists(self):
+        return self.lines + [self.frame_text]
+
+    # a full draw happened (resize, limits changed, ...), grab the new background
+    def _on_draw(self, event):
+        canvas = self.fig.canvas
+        self._background = canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        for a in self.artists:
+            self.fig.draw_artist(a)
+
+    def _limits_changed(self, n, lo, hi):
+        changed = False
+        if self.ax.get_xlim() != (0, max(n - 1, 1)):
+            self.ax.set_xlim(0, max(n - 1, 1))
+            changed = True
+        y0, y1 = self.ax.get_ylim()
+        span = 1.2*max(hi - lo, self.min_span)     # the data range with a 10 % margin on either side
+        if np.isfinite(lo) and (lo < y0 or hi > y1 or (y1 - y0) > 2*span):
+            mid = (lo + hi)/2
+            self.ax.set_ylim(mid - span/2, mid + span/2)
+            changed = True
+        return changed
+
+    def update(self, y, enabled=None):
+        start = time.perf_counter()
+        y = np.asarray(y).reshape(len(y), -1)
+        n = len(y)
+        if enabled is None:
+            enabled = [True]*len(self.lines)
+        columns = max(int(self.ax.bbox.width), 1)       # one column per pixel
+        x, y = minmax_decimate(y, columns)
+        lo, hi = np.inf, -np.inf
+        for i, line in enumerate(self.lines):
+            visible = bool(enabled[i]) and i < y.shape[1] and len(y) > 0
+            line.set_visible(visible)
+            if visible:
+                line.set_data(x, y[:, i])
+                lo, hi = min(lo, y[:, i].min()), max(hi, y[:, i].max())
+        self.frame_text.set_text('frame {:.1f} ms'.format(self.frame_ms))
+
+        canvas = self.fig.canvas
+        if self._limits_changed(n, lo, hi) or self._background is None:
+            canvas.draw()           # full redraw, _on_draw refreshes the background
+        else:
+            canvas.restore_region(self._background)
+            self._draw_artists()
+            canvas.blit(self.fig.bbox)
+        elapsed_ms = (time.perf_counter() - start)*1e3
+        self.frame_ms += 0.2*(elapsed_ms - self.frame_ms)
+        return elapsed_ms
+
+    # animated artists are skipped by a normal draw, so turn them off while saving
+    def savefig(self, filename, **kwargs):
+        for a in self.artists:
+            a.set_animated(False)
+        try:
+            self.fig.savefig(filename, **kwargs)
+        finally:
+            for a in self.artists:
+                a.set_animated(True)
+            self.fig.canvas.draw()
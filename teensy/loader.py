@@ -0,0 +1,97 @@
+'''
+    Fast loader for raw capture csv files written by read_pressure_sensors.py
+    and gui_live.py:
+
+        <index>,<us>,<adc0>,<adc1>
+
+    The file is parsed by pandas' C parser and rows with any non numeric
+    field (headers, error messages) are skipped. The parsed columns are
+    cached next to the csv in <name>.csv.cache.npz together with the path,
+    size and mtime of the csv, so the next load of an unchanged file reads
+    the arrays back without any csv parsing (or importing pandas).
+
+    iter_capture reads the same files in chunks of rows without caching,
+    for captures that are larger than memory.
+
+    Usage
+
+        idx, ts, adc0, adc1 = load_capture('test_data/.../test_16G_20psi.csv')
+        for idx, ts, adc0, adc1 in iter_capture('long_capture.csv'):
+            ...
+'''
+
+import json
+import os
+
+import numpy as np
+
+CACHE_SUFFIX = '.cache.npz'
+
+
+# identifies the version of a file, caches keyed by it go stale when the file changes
+def cache_key(filename):
+    st = os.stat(filename)
+    return {'path': os.path.abspath(filename), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+# whether the first num_columns fields of a csv line are numbers, false for headers
+def is_numeric_row(line, num_columns):
+    try:
+        [float(x) for x in line.split(',')[:num_columns]]
+        return True
+    except ValueError:
+        return False
+
+def _read_csv(filename, num_columns, **kwargs):
+    import pandas as pd     # only needed when the cache is missing or stale
+    with open(filename) as f:
+        header = 0 if is_numeric_row(f.readline(), num_columns) else 1
+    return pd.read_csv(filename, header=None, skiprows=header, usecols=range(num_columns), engine='c',
+                       low_memory=False, **kwargs)
+
+def _columns(df):
+    import pandas as pd
+    if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in df.dtypes):
+        df = df.apply(pd.to_numeric, errors='coerce')      # non numerical rows in the body become NaN
+    return np.ascontiguousarray(df.dropna().to_numpy(dtype=np.float64).T)   # skip rows that have non numerical data
+
+def _parse_csv(filename, num_columns):
+    return _columns(_read_csv(filename, num_columns))
+
+def _read_cache(cache_file, key):
+    try:
+        with np.load(cache_file, allow_pickle=False) as cached:
+            if json.loads(str(cached['key'])) == key:
+                return cached['columns']
+    except (OSError, KeyError, ValueError):
+        pass    # missing, unreadable or foreign cache file, parse again
+    return None
+
+def _write_cache(cache_file, key, columns):
+    tmp = cache_file + '.tmp.npz'
+    try:
+        np.savez(tmp, key=np.array(json.dumps(key)), columns=columns)
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass    # read-only data directory, just don't cache
+
+# returns one float64 array per csv column (index, us, adc0, adc1 for captures)
+def load_capture(filename, num_columns=4, cache=True):
+    filename = os.fspath(filename)
+    if not cache:
+        return tuple(_parse_csv(filename, num_columns))
+    key = cache_key(filename)
+    key['columns'] = num_columns
+    cache_file = filename + CACHE_SUFFIX
+    columns = _read_cache(cache_file, key)
+    if columns is None:
+        columns = _parse_csv(filename, num_columns)
+        _write_cache(cache_file, key, columns)
+    return tuple(columns)
+
+# yields one tuple of float64 column arrays per chunk of up to chunk_rows rows
+def iter_capture(filename, num_columns=4, chunk_rows=1 << 20):
+    with _read_csv(os.fspath(filename), num_columns, chunksize=chunk_rows) as reader:
+        for df in reader:
+            columns = _columns(df)
+            if columns.shape[1]:
+                yield tuple(columns)
@@ -0,0 +1,108 @@
+'''
+    Counts to PSI lookup tables. The ADCs return 16 bit signed counts, so
+    every calibration polynomial can be evaluated ahead of time for all
+    65536 possible values. Converting a batch is then one np.take, no
+    matter the polynomial degree.
+
+    The tables of every (sensor, adc, degree) in a coefficient file are
+    stored as one float32 .npy array, one row per key, and the keys in a
+    json file next to it:
+
+        calibration_lut.npy         (keys, 65536) float32
+        calibration_lut.json        [[sensor, adc, degree], ...]
+
+    Rows are indexed by the counts reinterpreted as uint16, so no offset
+    is needed. The .npy is memory mapped read only, every process that
+    opens it shares the same pages.
+
+    Table entries are the float64 polynomial rounded once to float32, so
+    they are within half a float32 ulp (6e-8 relative) of Calibration.to_psi.
+
+    Usage
+
+        write_lut(Calibration('calibration_coefficients.csv'), 'calibration_lut.npy')
+        lut = CalibrationLUT('calibration_lut.npy')
+        psi = lut.to_psi(counts, sensor='A', adc=0, deg=3)
+        ms_psi = lut.calibrate(Recording('recording').read(), sensors=('A', 'B'))
+'''
+
+import json
+import os
+
+import numpy as np
+
+from .calibration import Calibration
+
+TABLE_SIZE = 1 << 16
+
+# every int16 value, in uint16 order, so that table[counts.view(np.uint16)] is the psi for counts
+_ALL_COUNTS = np.arange(TABLE_SIZE, dtype=np.uint16).view(np.int16)
+
+
+def _keys_file(filename):
+    return os.path.splitext(filename)[0] + '.json'
+
+def build_tables(calibration):
+    keys = sorted(calibration.keys())
+    tables = np.empty((len(keys), TABLE_SIZE), dtype=np.float32)
+    for i, key in enumerate(keys):
+        tables[i] = calibration.to_psi(_ALL_COUNTS, *key)
+    return keys, tables
+
+# writes the tables of every key in a Calibration to filename (.npy) and its .json key list
+def write_lut(calibration, filename='calibration_lut.npy'):
+    keys, tables = build_tables(calibration)
+    tmp = filename + '.tmp.npy'
+    out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=tables.shape)
+    out[:] = tables
+    out.flush()
+    del out
+    with open(_keys_file(filename) + '.tmp', 'w') as f:
+        json.dump([list(k) for k in keys], f)
+    os.replace(tmp, filename)
+    os.replace(_keys_file(filename) + '.tmp', _keys_file(filename))
+    return filename
+
+
+class CalibrationLUT():
+
+    def __init__(self, filename='calibration_lut.npy'):
+        self.filename = filename
+        with open(_keys_file(filename)) as f:
+            keys = [(s, int(a), int(d)) for s, a, d in json.load(f)]
+        self.tables = np.load(filename, mmap_mode='r')
+        self._rows = {key: i for i, key in enumerate(keys)}
+
+    # tables built in memory from a coefficient csv, for when no lut file was written
+    @classmethod
+    def from_coefficients(cls, filename='calibration_coefficients.csv'):
+        lut = cls.__new__(cls)
+        lut.filename = filename
+        keys, lut.tables = build_tables(Calibration(filename))
+        lut._rows = {key: i for i, key in enumerate(keys)}
+        return lut
+
+    def keys(self):
+        return self._rows.keys()
+
+    def table(self, sensor, adc, deg=3):
+        try:
+            return np.asarray(self.tables[self._rows[(sensor, int(adc), int(deg))]])
+        except KeyError:
+            raise KeyError('No calibration for sensor {} adc {} degree {} in {}'.format(
+                           sensor, adc, deg, self.filename)) from None
+
+    # counts that aren't int16 already are cast (and truncated) to int16 first
+    def to_psi(self, counts, sensor, adc, deg=3):
+        counts = np.asarray(counts)
+        if counts.dtype != np.int16:
+            counts = counts.astype(np.int16)
+        return np.take(self.table(sensor, adc, deg), counts.view(np.uint16))
+
+    # (n, 3) ms, adc0 psi, adc1 psi for a batch of SAMPLE_DTYPE samples
+    def calibrate(self, batch, sensors, deg=3):
+        out = np.empty((len(batch), 3))
+        out[:, 0] = batch['ms']
+        out[:, 1] = self.to_psi(batch['adc0'], sensors[0], 0, deg)
+        out[:, 2] = self.to_psi(batch['adc1'], sensors[1], 1, deg)
+        return out
@@ -0,0 +1,328 @@
+'''
+    Noise and frequency response characterization of captures, for the gain
+    and supply voltage test runs in test_data.
+
+    Every capture is classified by the shape of its adc0 signal:
+
+        step    square wave input, nearly every sample sits on one of two
+                levels far apart (STEP_OCCUPANCY of them within 5 % of the
+                level difference or 4 noise), with edges between them
+        tone    sine input, one sinusoid holds TONE_VARIANCE of the
+                variance and leaves no more than TONE_RATIO times the
+                sample to sample noise
+        dc      constant input (pressure points)
+        other   none of them, a drifting input like the air readings
+
+    The sample to sample noise is the MAD of the differences of consecutive
+    samples, which edges and slow drift hardly change.
+
+    and the noise is what is left after removing the signal: the level of
+    each plateau (without the samples around the edges) for steps, the
+    fitted sinusoid for tones (so it includes their distortion) and a
+    straight line for dc captures. What a straight line leaves of the other
+    captures is mostly their signal, so their noise is estimated from the
+    differences of consecutive samples instead, and they are left out of the
+    means per gain of summarize. From it:
+
+        rms_noise       counts
+        noise_uv        rms noise referred to the ADC input, 3.3 V/gain full scale
+        enob            effective number of bits, 16 - log2(rms_noise*sqrt(12))
+        noise_density   counts/sqrt(Hz), median of the Welch PSD above fs/10
+
+    Step captures also get the level difference (amplitude), the fundamental
+    frequency and the median over all edges of the 10-90 % rise time,
+    overshoot and settling time (to within 2 % or 3 rms noise of the new
+    level, whichever is wider), and the bandwidth 0.35/rise time that goes
+    with them. Edges that take less than a sample leave rise time, settling
+    time and bandwidth out (nan), they are only known to be faster. With the
+    input amplitude from a file or directory name like 100mVpp the measured
+    gain is worked out too.
+
+    characterize works on a (files, samples) array and all its steps are
+    vectorized over the files. characterize_directory groups the captures
+    of a directory by length and sample rate, so captures of the same run
+    are done in one go, and caches each result next to its capture in
+    <name>.csv.noise.json, keyed like the loader's cache by path, size and
+    mtime. Timestamp gaps (dropped samples) are counted and the step
+    frequency is taken from the timestamps of the edges. Values in volts
+    (the *_voltage_conversion captures) are turned back into counts with the
+    gain from the file name.
+
+    Usage
+
+        result = characterize(counts, fs=1000.0)        # counts: (files, samples)
+        result = characterize(counts, fs=1000.0, ms=timestamps)
+        rows = characterize_directory('test_data/sensor_A_gain_tests_3v_supply_1_hz_square_wave_100mVpp')
+        table = summarize(rows)
+
+    characterize_noise.py runs every directory below test_data in parallel
+    and writes the summary table comparing all gain settings.
+'''
+
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from .loader import load_capture, cache_key, is_numeric_row
+
+ENGINE_VERSION = 3
+ADC_BITS = 16
+ADC_MAX = 65535             # counts per 3.3 V/PGA, like V_per_bit in the Teensy firmware
+V_REF = 3.3
+CACHE_SUFFIX = '.noise.json'
+STEP_OCCUPANCY = 0.95       # samples on the two levels of a step capture
+STEP_SEPARATION = 40        # least level difference of a step capture, in sample to sample noise
+TONE_VARIANCE = 0.99        # variance held by the sinusoid of a tone capture
+TONE_RATIO = 8              # most rms left by the sinusoid of a tone capture, in sample to sample noise
+OTHER_RATIO = 4             # dc captures leaving more than this times the sample to sample noise are other
+COLUMNS = ['directory', 'file', 'gain', 'kind', 'samples', 'fs_hz', 'mean', 'amplitude', 'frequency_hz',
+           'rms_noise', 'noise_uv', 'enob', 'noise_density', 'rise_ms', 'overshoot_pct', 'settling_ms',
+           'bandwidth_hz', 'edges', 'gaps', 'input_mvpp', 'measured_gain']
+
+_gain_regex = re.compile(r'(?:^|_)(\d+)G(?=[_.]|$)')
+_mvpp_regex = re.compile(r'(\d+(?:\.\d+)?)mVpp', re.IGNORECASE)
+
+
+# gain from the file name, else from the directory name, nan if neither has one
+def parse_gain(filename):
+    path = Path(filename)
+    for name in (path.stem, path.parent.name):
+        match = _gain_regex.search(name)
+        if match:
+            return float(match.group(1))
+    return np.nan
+
+def parse_input_mvpp(filename):
+    path = Path(filename)
+    match = _mvpp_regex.search(path.stem) or _mvpp_regex.search(path.parent.name)
+    return float(match.group(1)) if match else np.nan
+
+# capture files have an adc0 column or start with numbers, results and calibration tables don't
+def is_capture(filename):
+    with open(filename) as f:
+        line = f.readline()
+    return 'adc0' in line or is_numeric_row(line, 4)
+
+def welch_psd(x, fs, nperseg=4096):
+    from scipy import signal        # only needed for the PSD
+    return signal.welch(x, fs, nperseg=min(nperseg, x.shape[-1]), detrend='linear', axis=-1)
+
+
+# frequency of the strongest component of every row, hann windowed spectrum with parabolic interpolation
+def _fundamental(x, fs):
+    n = x.shape[1]
+    spectrum = np.abs(np.fft.rfft((x - x.mean(axis=1, keepdims=True))*np.hanning(n), axis=1))
+    spectrum[:, 0] = 0
+    k = np.clip(np.argmax(spectrum, axis=1), 1, spectrum.shape[1] - 2)
+    rows = np.arange(len(x))
+    a, b, c = (np.log(spectrum[rows, k + d] + 1e-12) for d in (-1, 0, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(a - 2*b + c != 0, 0.5*(a - c)/(a - 2*b + c), 0.0)
+    return (k + np.clip(delta, -0.5, 0.5))*fs/n
+
+# two-level state of every sample with hysteresis, and whether a level has been seen yet
+def _levels(x, mid, hysteresis):
+    idx = np.arange(x.shape[1])
+    last_high = np.maximum.accumulate(np.where(x > (mid + hysteresis)[:, None], idx, -1), axis=1)
+    last_low = np.maximum.accumulate(np.where(x < (mid - hysteresis)[:, None], idx, -1), axis=1)
+    return last_high > last_low, np.maximum(last_high, last_low) >= 0
+
+# true for samples from before samples ahead of an edge to after samples past it
+def _near_edges(edges, before, after):
+    n = edges.shape[1]
+    count = np.concatenate((np.zeros((len(edges), 1), dtype=np.int64), np.cumsum(edges, axis=1)), axis=1)
+    idx = np.arange(n)
+    return count[:, np.minimum(idx + before + 1, n)] - count[:, np.maximum(idx - after, 0)] > 0
+
+# median rise time, overshoot and settling time in samples over the edges of one row
+def _step_response(x, edges, rising, low, high, noise):
+    amplitude = high - low
+    half = int(np.median(np.diff(edges))) if len(edges) > 1 else 0
+    pre, post = half//2, half - half//2
+    inside = (edges >= pre) & (edges + post <= len(x))
+    if pre < 2 or not inside.any():
+        return np.nan, np.nan, np.nan
+    edges, rising = edges[inside], rising[inside]
+    windows = x[edges[:, None] + np.arange(-pre, post)]
+    y = np.where(rising[:, None], windows - low, high - windows)/amplitude    # 0 before the edge, 1 after
+    t10, t90 = np.argmax(y >= 0.1, axis=1), np.argmax(y >= 0.9, axis=1)
+    band = max(0.02, 3*noise/amplitude)
+    outside = np.abs(y - 1) > band
+    last_outside = windows.shape[1] - 1 - np.argmax(outside[:, ::-1], axis=1)
+    return (np.median(t90 - t10), np.median(y.max(axis=1) - 1)*100, np.median(last_outside + 1 - t10))
+
+# noise and response metrics of every row of x (files, samples), counts sampled at fs, ms the
+# timestamps if the captures have gaps
+def characterize(x, fs, ms=None, settle_ms=20, guard_ms=5):
+    x = np.atleast_2d(np.asarray(x, dtype=np.float64))
+    files, n = x.shape
+    ms = np.broadcast_to(np.arange(n)*1000/fs if ms is None else np.atleast_2d(ms), x.shape)
+    t = np.arange(n)/fs
+    lo, hi = np.percentile(x, [5, 95], axis=1)
+    span, mid = hi - lo, (lo + hi)/2
+    step_noise = np.median(np.abs(np.diff(x, axis=1)), axis=1)*1.4826/np.sqrt(2)
+    frequency = _fundamental(x, fs)
+
+    result = {k: np.full(files, np.nan) for k in ['amplitude', 'frequency_hz', 'rise_ms', 'overshoot_pct',
+                                                    'settling_ms', 'edges']}
+    result['kind'] = np.full(files, 'dc', dtype=object)
+    result['mean'] = x.mean(axis=1)
+
+    # dc: straight line through every row at once
+    slope, offset = np.polyfit(t, x.T, 1)
+    residual = x - (slope[:, None]*t + offset[:, None])
+    keep = np.ones_like(x, dtype=bool)
+
+    # steps: two levels far apart that hold nearly every sample, and edges between them (however many
+    # samples each edge takes)
+    lower, upper = np.percentile(x, [25, 75], axis=1)       # on the plateaus for duty cycles of 25-75 %
+    tolerance = np.maximum(0.05*(upper - lower), 4*step_noise)[:, None]
+    occupancy = np.mean((np.abs(x - lower[:, None]) < tolerance) | (np.abs(x - upper[:, None]) < tolerance),
+                        axis=1)
+    is_high, seen = _levels(x, mid, span/4)
+    change = np.zeros_like(is_high)
+    change[:, 1:] = (is_high[:, 1:] != is_high[:, :-1]) & seen[:, :-1]
+    step = ((occupancy >= STEP_OCCUPANCY) & (upper - lower > STEP_SEPARATION*step_noise)
+            & (change.sum(axis=1) >= 2))
+
+    # tones: a sinusoid near the fundamental, kept if it explains nearly all of the variance and leaves
+    # little more than the noise. Gaps shift the frequency seen by the fft, so the fit is tried over
+    # +-10 % of it on the real sample times
+    for i in np.flatnonzero(~step & (frequency > 2/t[-1])):
+        ti = (ms[i] - ms[i, 0])/1000
+        best = None
+        for f in frequency[i]*np.linspace(0.9, 1.1, 41):
+            design = np.column_stack((np.ones(n), ti, np.cos(2*np.pi*f*ti), np.sin(2*np.pi*f*ti)))
+            coef = np.linalg.lstsq(design, x[i], rcond=None)[0]
+            tone_residual = x[i] - design @ coef
+            if best is None or tone_residual.var() < best[0].var():
+                best = (tone_residual, coef, f)
+        tone_residual, coef, f = best
+        if (tone_residual.var() < (1 - TONE_VARIANCE)*x[i].var()
+                and tone_residual.std() < TONE_RATIO*step_noise[i]):
+            result['kind'][i] = 'tone'
+            result['amplitude'][i] = 2*np.hypot(coef[2], coef[3])      # peak to peak
+            result['frequency_hz'][i] = f
+            residual[i] = tone_residual
+
+    # plateau levels of the steps, with the samples around the edges left out
+    if step.any():
+        xs, high, seen, change = x[step], is_high[step], seen[step], change[step]
+        keep_step = seen & ~_near_edges(change, int(guard_ms*fs/1000), int(settle_ms*fs/1000))
+        high_level = np.sum(xs*(keep_step & high), axis=1)/np.maximum(np.sum(keep_step & high, axis=1), 1)
+        low_level = np.sum(xs*(keep_step & ~high), axis=1)/np.maximum(np.sum(keep_step & ~high, axis=1), 1)
+        residual[step] = xs - np.where(high, high_level[:, None], low_level[:, None])
+        keep[step] = keep_step
+        noise = np.sqrt(np.sum(residual[step]**2*keep_step, axis=1)/np.maximum(keep_step.sum(axis=1), 1))
+        for j, i in enumerate(np.flatnonzero(step)):
+            edges = np.flatnonzero(change[j])
+            result['kind'][i] = 'step'
+            result['amplitude'][i] = high_level[j] - low_level[j]
+            result['edges'][i] = len(edges)
+            if len(edges) > 1:
+                result['frequency_hz'][i] = 1000/(2*np.median(np.diff(ms[i, edges])))
+            rise, overshoot, settling = _step_response(xs[j], edges, high[j, edges], low_level[j], high_level[j],
+                                                       noise[j])
+            # edges within one sample only give a bound, left out
+            result['rise_ms'][i] = rise*1000/fs if rise > 0 else np.nan
+            result['overshoot_pct'][i] = overshoot
+            result['settling_ms'][i] = settling*1000/fs if settling > 0 else np.nan
+
+    result['rms_noise'] = np.sqrt(np.sum(residual**2*keep, axis=1)/np.maximum(keep.sum(axis=1), 1))
+    # a drifting input isn't a straight line, its noise is taken from the sample to sample steps
+    other = (result['kind'] == 'dc') & (result['rms_noise'] > OTHER_RATIO*step_noise)
+    result['kind'][other] = 'other'
+    result['rms_noise'][other] = step_noise[other]
+    freqs, psd = welch_psd(residual, fs)
+    result['noise_density'] = np.sqrt(np.median(psd[:, freqs >= fs/10], axis=1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['enob'] = ADC_BITS - np.log2(result['rms_noise']*np.sqrt(12))
+    result['bandwidth_hz'] = 350/result['rise_ms']
+    result['gaps'] = np.sum(np.diff(ms, axis=1) > 1.5*1000/fs, axis=1)
+    return result
+
+
+def _read_cache(cache_file, key):
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+        if cached['key'] == key:
+            return cached['result']
+    except (OSError, KeyError, ValueError):
+        pass    # missing, unreadable or stale, characterize again
+    return None
+
+def _write_cache(cache_file, key, result):
+    tmp = cache_file + '.tmp'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump({'key': key, 'result': result}, f)
+        os.replace(tmp, cache_file)
+    except OSError:
+        pass    # read-only data directory, just don't cache
+
+def _json_value(value):
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    return value.item() if isinstance(value, np.generic) else value
+
+# adc0 in counts, timestamps and the sample rate of one capture
+def _load_counts(filename, gain):
+    idx, ts, adc0, adc1 = load_capture(filename)
+    fs = 1000/np.median(np.diff(ts)) if len(ts) > 1 else 1000.0      # ts in ms
+    if np.all(np.abs(adc0) < 10) and np.any(adc0 != np.round(adc0)) and not np.isnan(gain):
+        adc0 = adc0*gain*ADC_MAX/V_REF      # a capture converted to volts
+    return adc0, ts, float(fs)
+
+# one result dict per capture in directory, from the cache when the capture hasn't changed
+def characterize_directory(directory, cache=True, settle_ms=20, guard_ms=5):
+    files = sorted(str(f) for f in Path(directory).glob('*.csv') if is_capture(f))
+    rows, todo = {}, []
+    for f in files:
+        key = dict(cache_key(f), version=ENGINE_VERSION, settle_ms=settle_ms, guard_ms=guard_ms)
+        cached = _read_cache(f + CACHE_SUFFIX, key) if cache else None
+        if cached is not None:
+            rows[f] = cached
+        else:
+            todo.append((f, key))
+
+    groups = {}         # (samples, fs) -> [(file, key, counts, ts)], each group is characterized at once
+    for f, key in todo:
+        counts, ts, fs = _load_counts(f, parse_gain(f))
+        if len(counts) < 16:
+            continue    # nothing to characterize
+        groups.setdefault((len(counts), fs), []).append((f, key, counts, ts))
+    for (n, fs), members in groups.items():
+        result = characterize(np.stack([m[2] for m in members]), fs, np.stack([m[3] for m in members]),
+                              settle_ms, guard_ms)
+        for i, (f, key, counts, ts) in enumerate(members):
+            gain, mvpp = parse_gain(f), parse_input_mvpp(f)
+            row = {'directory': str(directory), 'file': os.path.basename(f), 'gain': gain, 'samples': n, 'fs_hz': fs}
+            row.update({k: v[i] for k, v in result.items()})
+            row['noise_uv'] = row['rms_noise']*V_REF/(gain*ADC_MAX)*1e6
+            row['input_mvpp'] = mvpp
+            measured = row['kind'] in ('step', 'tone')
+            row['measured_gain'] = row['amplitude']*V_REF/ADC_MAX/(mvpp/1000) if measured else np.nan
+            row = {k: _json_value(row[k]) for k in COLUMNS}
+            rows[f] = row
+            if cache:
+                _write_cache(f + CACHE_SUFFIX, key, row)
+    return [rows[f] for f in files if f in rows]
+
+# every directory below root that holds captures
+def find_capture_directories(root):
+    return sorted({str(f.parent) for f in Path(root).rglob('*.csv') if is_capture(f)})
+
+# one table of all results sorted by gain, and the mean of the main metrics per gain and kind (without the
+# other captures, their noise is only an estimate)
+def summarize(rows):
+    import pandas as pd     # only needed for the tables
+    table = pd.DataFrame(rows, columns=COLUMNS).astype({'gain': float})
+    table = table.sort_values(['gain', 'directory', 'file'], na_position='last').reset_index(drop=True)
+    groups = table[table['kind'] != 'other'].groupby(['gain', 'kind'])
+    by_gain = groups[['rms_noise', 'noise_uv', 'enob', 'noise_density', 'rise_ms', 'measured_gain']].mean()
+    by_gain['captures'] = groups.size()
+    return table, by_gain
@@ -0,0 +1,190 @@
+'''
+    Drives every Teensy that is plugged in at once. Each board gets its own
+    reader thread (pyserial releases the GIL while it waits on the port), and
+    the streams are merged onto one host timeline.
+
+    A board only knows its own ms_since_start, so every batch is used to
+    estimate the offset between the board clock and the host clock:
+
+        offset = host_receive_time - ms/1000
+
+    The smallest value seen is the one with the least USB/OS latency, so the
+    estimate is a running minimum that is allowed to creep up by max_drift
+    (s/s) to follow crystal drift between the boards and the host.
+
+    When the estimate drops, a board's new samples would land before the
+    ones already stamped, so a board's times are held at the newest one
+    handed out until its clock has caught up. With every board's times
+    never going backwards, releasing merged samples only once every running
+    board has reported past them means read() always returns samples in
+    host time order.
+
+    Usage
+
+        pool = TeensyPool()
+        pool.start(period_us=1000)
+        samples = pool.read()       # fields: time, device, ms, adc0, adc1
+        print(pool.stats())
+        pool.stop()
+'''
+
+import queue
+import threading
+import time
+
+import numpy as np
+import serial.serialutil
+
+from .teensy import Teensy, findUsbPorts
+
+POOL_DTYPE = np.dtype([('time', '<f8'), ('device', '<i2'), ('ms', '<i4'), ('adc0', '<i2'), ('adc1', '<i2')])
+
+
+class DeviceReader():
+
+    def __init__(self, index, teensy, maxsize=1024, max_drift=100e-6):
+        self.index = index
+        self.teensy = teensy
+        self.batches = queue.Queue()
+        self.maxsize = maxsize
+        self.max_drift = max_drift
+        self.offset = None          # host time - board time, seconds
+        self.latest = -np.inf       # host time of the newest sample handed out
+        self.samples = 0
+        self.dropped = 0            # samples thrown away because the merge fell behind
+        self.error = None
+        self._last_host = None
+        self._last_time = -np.inf   # host time of the newest sample stamped, never goes back
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='teensy-{}'.format(self.index), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _update_offset(self, host, ms):
+        candidate = host - ms/1000
+        if self.offset is None:
+            self.offset = candidate
+        else:
+            self.offset = min(self.offset + self.max_drift*(host - self._last_host), candidate)
+        self._last_host = host
+
+    def _run(self):
+        try:
+            while self._running:
+                block = self.teensy.read_block()
+                if not len(block):
+                    continue
+                host = time.time()
+                self._update_offset(host, block['ms'][-1])
+                samples = np.empty(len(block), dtype=POOL_DTYPE)
+                samples['time'] = np.maximum.accumulate(np.maximum(block['ms']/1000 + self.offset, self._last_time))
+                self._last_time = samples['time'][-1]
+                samples['device'] = self.index
+                samples['ms'] = block['ms']
+                samples['adc0'] = block['adc0']
+                samples['adc1'] = block['adc1']
+                if self.batches.qsize() >= self.maxsize:     # merge isn't keeping up, drop the oldest
+                    try:
+                        self.dropped += len(self.batches.get_nowait())
+                    except queue.Empty:
+                        pass
+                self.batches.put(samples)
+                self.samples += len(samples)
+        except (serial.serialutil.SerialException, OSError) as e:
+            self.error = e
+
+    # samples lost on the board link plus samples dropped on the host. Frames and lines the decoder threw away
+    # also leave timestamp gaps, which catch samples the board never sent too, so the link count is the larger
+    def drop_count(self):
+        decoder = self.teensy.decoder
+        decoded = getattr(decoder, 'dropped', 0) + getattr(decoder, 'malformed', 0)
+        return max(decoded, self.teensy.continuity.missing) + self.dropped
+
+
+class TeensyPool():
+
+    def __init__(self, hwid='16c0:0483', ports=None, verbose=True):
+        ports = findUsbPorts(hwid) if ports is None else ports
+        if not ports:
+            raise ValueError('Teensy not found')
+        self.readers = []
+        for i, port in enumerate(ports):
+            t = Teensy(hwid=hwid, verbose=verbose)
+            t.connect(port)
+            self.readers.append(DeviceReader(i, t))
+        self._pending = [np.empty(0, dtype=POOL_DTYPE) for _ in self.readers]
+        self._started = None
+
+    def __len__(self):
+        return len(self.readers)
+
+    @property
+    def devices(self):
+        return [r.teensy for r in self.readers]
+
+    def start(self, period_us=1000, binary=False):
+        for t in self.devices:
+            t.send("s")                     # stop, then configure every board before any of them starts
+            t.serial_handle.flushInput()
+            if binary != t.binary:
+                t.set_binary(binary)
+            t.decoder.reset()
+        for r, t in zip(self.readers, self.devices):
+            t.send("s {}".format(period_us))
+            r.start()
+        self._started = time.time()
+
+    def stop(self):
+        for r in self.readers:
+            r._running = False
+        for r, t in zip(self.readers, self.devices):
+            r.stop()
+            t.send("s")
+
+    # merge everything that is known to be complete, in host time order
+    def read(self):
+        for i, r in enumerate(self.readers):
+            batches = [self._pending[i]]
+            while True:
+                try:
+                    batches.append(r.batches.get_nowait())
+                except queue.Empty:
+                    break
+            self._pending[i] = np.concatenate(batches)
+            if len(self._pending[i]):
+                r.latest = max(r.latest, self._pending[i]['time'].max())
+
+        # a board that stopped reporting (error or stopped) no longer holds back the others
+        live = [r.latest for r in self.readers if r.running]
+        watermark = min(live) if live else np.inf
+        ready = []
+        for i, pending in enumerate(self._pending):
+            done = pending['time'] <= watermark
+            ready.append(pending[done])
+            self._pending[i] = pending[~done]
+        merged = np.concatenate(ready)
+        return merged[np.argsort(merged['time'], kind='stable')]
+
+    def stats(self):
+        elapsed = time.time() - self._started if self._started else 0.0
+        total = sum(r.samples for r in self.readers)
+        return {
+            'devices': len(self.readers),
+            'samples': total,
+            'samples_per_s': total/elapsed if elapsed > 0 else 0.0,
+            'drops': [r.drop_count() for r in self.readers],
+            'clock_offsets_s': [None if r.offset is None else float(r.offset) for r in self.readers],
+            'errors': [None if r.error is None else str(r.error) for r in self.readers],
+        }
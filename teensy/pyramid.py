@@ -0,0 +1,198 @@
+'''
+    Min/max/mean pyramid of a recording, for drawing any time range of a
+    long recording at screen resolution without touching the raw samples.
+
+    Level k holds one record per 2**k samples:
+
+        ms              timestamp of the first sample of the block
+        <field>_min     minimum of the block, for every data field
+        <field>_max     maximum of the block
+        <field>_mean    mean of the block (float32)
+
+    PyramidWriter is fed the same batches as the segment files and builds
+    level min_level straight from the samples and every level above it
+    from pairs of records of the level below, one level file each:
+
+        recording/
+            pyramid/level_05.bin
+            pyramid/level_06.bin
+            ...
+
+    Only complete blocks are written. The writer carries less than
+    2**min_level samples plus one record per level between batches, so
+    memory use stays constant however long the recording gets.
+
+    envelope() picks the coarsest level that still has at least one block
+    per column for the requested range, reads only that part of it (plus
+    the raw samples after the last complete block) and reduces it to the
+    requested number of columns. Columns are exact to within one block of
+    the chosen level at either end of the range.
+
+    Usage
+
+        env = Recording('recording').envelope(start_ms=0, stop_ms=3600000, width=1200)
+        ax.fill_between(env['ms'], env['adc0_min'], env['adc0_max'])
+        ax.plot(env['ms'], env['adc0_mean'])
+'''
+
+import os
+
+import numpy as np
+
+DIRECTORY = 'pyramid'
+MIN_LEVEL = 5
+MAX_LEVEL = 24
+
+
+def level_dtype(dtype):
+    fields = [('ms', '<i8')]
+    for name in dtype.names:
+        if name != 'ms':
+            fields += [(name + '_min', dtype[name]), (name + '_max', dtype[name]), (name + '_mean', '<f4')]
+    return np.dtype(fields)
+
+def level_file(k):
+    return os.path.join(DIRECTORY, 'level_{:02d}.bin'.format(k))
+
+
+class PyramidWriter():
+
+    def __init__(self, directory, dtype, min_level=MIN_LEVEL, max_level=MAX_LEVEL):
+        self.directory = str(directory)
+        self.dtype = np.dtype(dtype)
+        self.fields = [name for name in self.dtype.names if name != 'ms']
+        self.record_dtype = level_dtype(self.dtype)
+        self.min_level = min_level
+        self.max_level = max_level
+        self.levels = list(range(min_level, max_level + 1))
+        self.counts = {k: 0 for k in self.levels}
+        os.makedirs(os.path.join(self.directory, DIRECTORY), exist_ok=True)
+        self._files = {k: open(os.path.join(self.directory, level_file(k)), 'wb') for k in self.levels}
+        self._raw = np.empty(0, dtype=self.dtype)                               # incomplete lowest block
+        self._carry = {k: np.empty(0, dtype=self.record_dtype) for k in self.levels[1:]}   # odd records
+
+    # one record per 2**min_level samples
+    def _reduce_samples(self, samples):
+        size = 1 << self.min_level
+        records = np.empty(len(samples) // size, dtype=self.record_dtype)
+        records['ms'] = samples['ms'][::size]
+        for name in self.fields:
+            blocks = samples[name].reshape(-1, size)
+            records[name + '_min'] = blocks.min(axis=1)
+            records[name + '_max'] = blocks.max(axis=1)
+            records[name + '_mean'] = blocks.mean(axis=1)
+        return records
+
+    # one record per pair of records of the level below
+    def _reduce_pairs(self, records):
+        a, b = records[0::2], records[1::2]
+        out = np.empty(len(b), dtype=self.record_dtype)
+        out['ms'] = a['ms']
+        for name in self.fields:
+            out[name + '_min'] = np.minimum(a[name + '_min'], b[name + '_min'])
+            out[name + '_max'] = np.maximum(a[name + '_max'], b[name + '_max'])
+            out[name + '_mean'] = (a[name + '_mean'].astype(np.float64) + b[name + '_mean'])/2
+        return out
+
+    def write(self, batch):
+        samples = np.concatenate((self._raw, np.asarray(batch, dtype=self.dtype)))
+        complete = len(samples) >> self.min_level << self.min_level
+        self._raw = samples[complete:].copy()
+        records = self._reduce_samples(samples[:complete])
+        for k in self.levels:
+            if not len(records):
+                break
+            self._files[k].write(records.tobytes())
+            self.counts[k] += len(records)
+            if k + 1 in self._carry:
+                records = np.concatenate((self._carry[k + 1], records))
+                paired = len(records) & ~1
+                self._carry[k + 1] = records[paired:].copy()
+                records = self._reduce_pairs(records[:paired])
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+    def to_dict(self):
+        return {'min_level': self.min_level, 'max_level': self.max_level, 'dtype': self.record_dtype.descr}
+
+
+class Pyramid():
+
+    def __init__(self, directory, info, num_samples):
+        self.directory = str(directory)
+        self.min_level = info['min_level']
+        self.max_level = info['max_level']
+        self.record_dtype = np.dtype([tuple(field) for field in info['dtype']])
+        self.num_samples = num_samples
+        self._levels = {}
+
+    # records of level k, memory-mapped, limited to blocks the segments hold completely
+    def level(self, k):
+        if k not in self._levels:
+            filename = os.path.join(self.directory, level_file(k))
+            count = min(os.path.getsize(filename) // self.record_dtype.itemsize if os.path.exists(filename) else 0,
+                        self.num_samples >> k)
+            self._levels[k] = (np.memmap(filename, dtype=self.record_dtype, mode='r', shape=(count,))
+                               if count else np.empty(0, dtype=self.record_dtype))
+        return self._levels[k]
+
+    # coarsest level with at least one block per column, None for raw samples
+    def choose_level(self, num_samples, width):
+        per_column = num_samples // max(int(width), 1)
+        if per_column < 1 << self.min_level:
+            return None
+        return min(int(np.log2(per_column)), self.max_level)
+
+
+# reduce blocks (records of any level or raw samples) covering weights samples each to width columns
+def _columns(blocks, weights, fields, width, record_dtype):
+    position = np.cumsum(weights) - weights                 # sample offset of every block
+    total = position[-1] + weights[-1]
+    width = max(min(int(width), len(blocks)), 1)
+    starts = np.unique(np.searchsorted(position, np.arange(width)*total/width, side='right') - 1)
+    out = np.empty(len(starts), dtype=record_dtype)
+    out['ms'] = blocks['ms'][starts]
+    count = np.add.reduceat(weights, starts)
+    for name in fields:
+        out[name + '_min'] = np.minimum.reduceat(blocks[name + '_min'], starts)
+        out[name + '_max'] = np.maximum.reduceat(blocks[name + '_max'], starts)
+        out[name + '_mean'] = np.add.reduceat(blocks[name + '_mean']*weights, starts)/count
+    return out
+
+# raw samples as level 0 records
+def _as_records(samples, fields, record_dtype):
+    records = np.empty(len(samples), dtype=record_dtype)
+    records['ms'] = samples['ms']
+    for name in fields:
+        records[name + '_min'] = records[name + '_max'] = samples[name]
+        records[name + '_mean'] = samples[name]
+    return records
+
+# envelope of samples i to j of a recording, read_samples(i, j) returns raw samples by position;
+# without a pyramid (recordings made before it existed) everything comes from the raw samples
+def envelope(pyramid, read_samples, sample_dtype, i, j, width):
+    dtype = level_dtype(sample_dtype)
+    fields = [name for name in sample_dtype.names if name != 'ms']
+    if j <= i:
+        return np.empty(0, dtype=dtype)
+    k = pyramid.choose_level(j - i, width) if pyramid is not None else None
+    parts, weights = [], []
+    if k is not None:
+        level = pyramid.level(k)
+        first, last = i >> k, min(-(-j >> k), len(level))
+        if last > first:
+            parts.append(np.asarray(level[first:last]))
+            weights.append(np.full(last - first, 1 << k, dtype=np.float64))
+            i = last << k                                   # the rest comes from the raw samples
+    if j > i:
+        parts.append(_as_records(read_samples(i, j), fields, dtype))
+        weights.append(np.ones(j - i))
+    blocks, weights = np.concatenate(parts), np.concatenate(weights)
+    return _columns(blocks, weights, fields, width, dtype)
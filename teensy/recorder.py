@@ -0,0 +1,297 @@
+'''
+    Continuous recorder for long captures. Decoded batches are appended as
+    raw structured samples to fixed size segment files in one directory:
+
+        recording/
+            header.json             dtype, segment list, metadata
+            segment_00000.bin       raw SAMPLE_DTYPE records
+            segment_00001.bin
+            ...
+            gaps.bin                GAP_DTYPE records, see teensy/continuity.py
+            pyramid/level_05.bin    min/max/mean per 2**k samples, see teensy/pyramid.py
+            ...
+
+    Memory use is constant: batches go straight to the open segment. Data
+    and header are flushed and fsync'ed every flush_interval seconds, so a
+    crash loses at most that much. The header is replaced atomically.
+
+    Recording memory-maps the segments back. A time range is located with
+    a binary search on the ms field, so only the pages that hold the
+    requested samples are ever read.
+
+    The recorder also keeps running statistics (count, mean, SDev, min,
+    max) of every data field, per segment and in total, see
+    teensy/running.py. They are stored in the header, so the stats of a
+    recording are known without reading any samples.
+
+    The timestamps are checked against period_us (default: the period_us
+    in the metadata, else 1000) as they are written. The counts of gaps,
+    missing samples, duplicates and jitter go into the header, each gap is
+    appended to gaps.bin, so analyses can exclude or interpolate around
+    them without scanning the samples.
+
+    Recording.envelope() draws on the pyramid the recorder builds while it
+    writes, so zooming and panning across hours of samples only reads a
+    few thousand records.
+
+    RecorderThread feeds a recorder from its own reader (e.g. a RingReader
+    of teensy/shm.py) in a thread of its own, so nothing else consuming
+    the stream, like a GUI that stalls or is paused, can make the
+    recording lose batches.
+
+    Usage
+
+        with StreamRecorder('recording') as recorder:
+            recorder.write(batch)
+
+        thread = RecorderThread(StreamRecorder('recording'), acquisition.reader()).start()
+        thread.close()          # stops reading and closes the recorder
+
+        samples = Recording('recording').read(start_ms=60000, stop_ms=61000)
+        Recording('recording').stats().sdev
+        Recording('recording').gaps()
+        Recording('recording').envelope(start_ms=0, stop_ms=36000000, width=1200)
+'''
+
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from .continuity import GAP_DTYPE, ContinuityTracker
+from .decode import SAMPLE_DTYPE
+from .pyramid import Pyramid, PyramidWriter, envelope
+from .running import RunningStats
+
+HEADER = 'header.json'
+GAPS = 'gaps.bin'
+
+
+def _write_json(filename, data):
+    tmp = filename + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
+
+
+class StreamRecorder():
+
+    def __init__(self, directory, segment_samples=1 << 20, flush_interval=1.0, dtype=SAMPLE_DTYPE, metadata=None,
+                 period_us=None, pyramid=True):
+        self.directory = str(directory)
+        self.segment_samples = int(segment_samples)
+        self.flush_interval = flush_interval
+        self.dtype = np.dtype(dtype)
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(os.path.join(self.directory, HEADER)):
+            raise FileExistsError('{} already holds a recording'.format(self.directory))
+        self.fields = [name for name in self.dtype.names if name != 'ms']
+        self.stats = RunningStats(len(self.fields))     # whole recording, live
+        self.continuity = ContinuityTracker(period_us or (metadata or {}).get('period_us', 1000))
+        self.header = {
+            'format': 1,
+            'dtype': self.dtype.descr,
+            'created': datetime.now().isoformat(),
+            'segment_samples': self.segment_samples,
+            'metadata': metadata or {},
+            'stats_fields': self.fields,
+            'stats': None,
+            'continuity': None,
+            'gaps': GAPS,
+            'segments': [],
+        }
+        self.samples = 0
+        self._file = None
+        self._gaps_file = open(os.path.join(self.directory, GAPS), 'wb')
+        self.pyramid = PyramidWriter(self.directory, self.dtype) if pyramid else None
+        self.header['pyramid'] = self.pyramid.to_dict() if pyramid else None
+        self._segment = None
+        self._last_flush = time.monotonic()
+        self._open_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open_segment(self):
+        name = 'segment_{:05d}.bin'.format(len(self.header['segments']))
+        self._segment = {'file': name, 'samples': 0, 'first_ms': None, 'last_ms': None, 'stats': None}
+        self._segment_stats = RunningStats(len(self.fields))
+        self.header['segments'].append(self._segment)
+        self._file = open(os.path.join(self.directory, name), 'wb')
+
+    def write(self, batch):
+        batch = np.asarray(batch, dtype=self.dtype)
+        self.continuity.update(batch['ms'])
+        self._gaps_file.write(self.continuity.take_index().tobytes())
+        if self.pyramid is not None:
+            self.pyramid.write(batch)
+        while len(batch):
+            room = self.segment_samples - self._segment['samples']
+            if room == 0:
+                self._close_segment()
+                self._open_segment()
+                continue
+            part, batch = batch[:room], batch[room:]
+            self._file.write(part.tobytes())
+            if self._segment['first_ms'] is None:
+                self._segment['first_ms'] = int(part['ms'][0])
+            self._segment['last_ms'] = int(part['ms'][-1])
+            self._segment['samples'] += len(part)
+            self.samples += len(part)
+            values = np.column_stack([part[name] for name in self.fields])
+            self._segment_stats.update(values)
+            self.stats.update(values)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _store_stats(self):
+        self._segment['stats'] = self._segment_stats.to_dict()
+        self.header['stats'] = self.stats.to_dict()
+        self.header['continuity'] = self.continuity.to_dict()
+
+    def flush(self):
+        for f in (self._file, self._gaps_file):
+            f.flush()
+            os.fsync(f.fileno())
+        if self.pyramid is not None:
+            self.pyramid.flush()
+        self._store_stats()
+        _write_json(os.path.join(self.directory, HEADER), self.header)
+        self._last_flush = time.monotonic()
+
+    def _close_segment(self):
+        self._store_stats()
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.continuity.finish()
+        self._gaps_file.write(self.continuity.take_index().tobytes())
+        self._gaps_file.flush()
+        os.fsync(self._gaps_file.fileno())
+        self._gaps_file.close()
+        self._close_segment()
+        self._file = None
+        if self.pyramid is not None:
+            self.pyramid.flush()
+            self.pyramid.close()
+        _write_json(os.path.join(self.directory, HEADER), self.header)
+
+    # write every batch of an AcquisitionService subscription until the stream ends
+    async def consume(self, subscription):
+        async for batch in subscription:
+            self.write(batch)
+
+
+# writes every batch read from reader (anything with read_block()) until closed
+class RecorderThread():
+
+    def __init__(self, recorder, reader):
+        self.recorder = recorder
+        self.reader = reader
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self.reader.read_block()
+            if len(batch):
+                self.recorder.write(batch)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.recorder.close()
+
+
+class Recording():
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        with open(os.path.join(self.directory, HEADER)) as f:
+            self.header = json.load(f)
+        self.dtype = np.dtype([tuple(field) for field in self.header['dtype']])
+        self.metadata = self.header['metadata']
+        self.segments = []
+        for segment in self.header['segments']:
+            filename = os.path.join(self.directory, segment['file'])
+            count = os.path.getsize(filename) // self.dtype.itemsize    # may be ahead of the header
+            if count:
+                self.segments.append(np.memmap(filename, dtype=self.dtype, mode='r', shape=(count,)))
+        info = self.header.get('pyramid')
+        self.pyramid = Pyramid(self.directory, info, len(self)) if info else None
+
+    def __len__(self):
+        return sum(len(s) for s in self.segments)
+
+    # RunningStats of the header's stats_fields, merged from the segments as of the last flush
+    def stats(self):
+        fields = self.header.get('stats_fields', [])
+        return RunningStats.merged([RunningStats.from_dict(s['stats']) for s in self.header['segments']
+                                    if s.get('stats')], len(fields))
+
+    # GAP_DTYPE records of every gap found while recording, indexed by sample position in read()
+    def gaps(self):
+        filename = os.path.join(self.directory, self.header.get('gaps', GAPS))
+        if not os.path.exists(filename):
+            return np.empty(0, dtype=GAP_DTYPE)
+        gaps = np.fromfile(filename, dtype=GAP_DTYPE, count=os.path.getsize(filename) // GAP_DTYPE.itemsize)
+        return gaps[gaps['index'] < len(self)]     # the index may be ahead of the segments
+
+    # samples with start_ms <= ms < stop_ms, only touching the segments and pages that hold them
+    def read(self, start_ms=None, stop_ms=None):
+        parts = []
+        for segment in self.segments:
+            ms = segment['ms']
+            if (start_ms is not None and ms[-1] < start_ms) or (stop_ms is not None and ms[0] >= stop_ms):
+                continue
+            # bisect instead of np.searchsorted, which would copy the whole strided ms column first
+            i = 0 if start_ms is None else bisect.bisect_left(ms, start_ms)
+            j = len(ms) if stop_ms is None else bisect.bisect_left(ms, stop_ms)
+            parts.append(segment[i:j])
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(parts)        # copies only the requested range out of the maps
+
+    # position of the first sample with ms >= the given ms
+    def position(self, ms):
+        offset = 0
+        for segment in self.segments:
+            if segment['ms'][-1] >= ms:
+                return offset + bisect.bisect_left(segment['ms'], ms)
+            offset += len(segment)
+        return offset
+
+    # samples i to j by position
+    def read_positions(self, i, j):
+        parts, offset = [], 0
+        for segment in self.segments:
+            if i < offset + len(segment) and j > offset:
+                parts.append(segment[max(i - offset, 0):j - offset])
+            offset += len(segment)
+        if not parts:
+            return np.empty(0, dtype=self.dtype)
+        return np.concatenate(parts)
+
+    # min/max/mean of every field in width columns over start_ms <= ms < stop_ms, see teensy/pyramid.py
+    def envelope(self, start_ms=None, stop_ms=None, width=1000):
+        i = 0 if start_ms is None else self.position(start_ms)
+        j = len(self) if stop_ms is None else self.position(stop_ms)
+        return envelope(self.pyramid, self.read_positions, self.dtype, i, j, width)
@@ -0,0 +1,68 @@
+'''
+    Fixed capacity, multi-channel ring buffer for live data.
+
+    Every sample is written twice, at pos and pos + capacity, so the most
+    recent n samples are always one contiguous block and latest(n) can hand
+    out a view without copying. Views are only valid until the next write.
+
+    Usage
+
+        buf = RingBuffer(capacity=1000, channels=3)
+        buf.extend(np.column_stack((t, psi0, psi1)))
+        window = buf.latest(100)        # (100, 3) view, oldest sample first
+'''
+
+import numpy as np
+
+
+class RingBuffer():
+
+    def __init__(self, capacity, channels=1, dtype=np.float64):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.capacity = int(capacity)
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self._data = np.zeros((2*self.capacity, channels), dtype=self.dtype)
+        self._pos = 0           # where the next sample goes, always < capacity
+        self._count = 0         # number of valid samples, at most capacity
+        self.total = 0          # number of samples ever written
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        self._pos, self._count = 0, 0
+
+    def extend(self, batch):
+        batch = np.asarray(batch, dtype=self.dtype).reshape(-1, self.channels)
+        cap = self.capacity
+        k = len(batch)
+        self.total += k
+        if k >= cap:                                # only the newest capacity samples survive
+            self._data[:cap] = batch[-cap:]
+            self._data[cap:] = batch[-cap:]
+            self._pos, self._count = 0, cap
+            return
+        m = min(k, cap - self._pos)                 # samples that fit before wrapping
+        self._data[self._pos:self._pos + m] = batch[:m]
+        self._data[self._pos + cap:self._pos + cap + m] = batch[:m]
+        self._data[:k - m] = batch[m:]
+        self._data[cap:cap + k - m] = batch[m:]
+        self._pos = (self._pos + k) % cap
+        self._count = min(self._count + k, cap)
+
+    def latest(self, n=None):
+        n = self._count if n is None else max(0, min(int(n), self._count))
+        end = self._pos + self.capacity
+        return self._data[end - n:end]
+
+    # change capacity, keeping as many of the newest samples as fit
+    def resize(self, capacity):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        keep = self.latest(min(self._count, int(capacity))).copy()
+        total = self.total
+        self.__init__(capacity, self.channels, self.dtype)
+        self.extend(keep)
+        self.total = total
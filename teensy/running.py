@@ -0,0 +1,177 @@
+'''
+    Streaming statistics that never keep the series. RunningStats holds
+    count, mean, the sum of squared deviations (M2), min and max for each
+    channel and is updated one whole batch at a time: the batch statistics
+    are computed vectorized and combined with Chan's parallel form of
+    Welford's update
+
+        delta = mean_b - mean_a
+        mean = mean_a + delta * n_b / n
+        M2 = M2_a + M2_b + delta**2 * n_a * n_b / n
+
+    which is the same formula merge() uses, so accumulators from different
+    chunks, files or worker processes can be combined exactly.
+
+    WindowedStats covers (about) the last window samples by keeping one
+    RunningStats per block of window/blocks samples and merging them on
+    request, so it stays bounded without storing samples either.
+
+    chunked_window_stats computes the rolling mean statistics of
+    teensy/stats.py over a capture one chunk at a time, for files that
+    don't fit in memory, and accumulated_window_stats turns them into the
+    same columns as window_stats.
+
+    Usage
+
+        live = RunningStats(channels=2)
+        live.update(np.column_stack((batch['adc0'], batch['adc1'])))
+        live.mean, live.sdev
+
+        total = RunningStats.merged([a, b, c])
+'''
+
+from collections import deque
+
+import numpy as np
+
+from .stats import WINDOW_SIZES
+
+
+class RunningStats():
+
+    def __init__(self, channels=1):
+        self.channels = channels
+        self.count = 0
+        self.mean = np.zeros(channels)
+        self.m2 = np.zeros(channels)
+        self.min = np.full(channels, np.inf)
+        self.max = np.full(channels, -np.inf)
+
+    def __len__(self):
+        return self.count
+
+    def _combine(self, n, mean, m2, lo, hi):
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta*(n/total)
+        self.m2 = self.m2 + m2 + delta**2*(self.count*n/total)
+        self.min = np.minimum(self.min, lo)
+        self.max = np.maximum(self.max, hi)
+        self.count = total
+
+    # batch is (n,) for one channel or (n, channels)
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=np.float64).reshape(-1, self.channels)
+        if len(batch) == 0:
+            return self
+        mean = batch.mean(axis=0)
+        m2 = ((batch - mean)**2).sum(axis=0)
+        self._combine(len(batch), mean, m2, batch.min(axis=0), batch.max(axis=0))
+        return self
+
+    def merge(self, other):
+        if other.count:
+            self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        return self
+
+    @classmethod
+    def merged(cls, accumulators, channels=None):
+        accumulators = list(accumulators)
+        out = cls(channels or (accumulators[0].channels if accumulators else 1))
+        for a in accumulators:
+            out.merge(a)
+        return out
+
+    @property
+    def var(self):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.m2/(self.count - 1) if self.count > 1 else np.full(self.channels, np.nan)
+
+    # sample standard deviation, like the SDev column of the stats scripts
+    @property
+    def sdev(self):
+        return np.sqrt(self.var)
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean.tolist(), 'm2': self.m2.tolist(),
+                'min': self.min.tolist(), 'max': self.max.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        out = cls(len(d['mean']))
+        out.count = d['count']
+        out.mean, out.m2 = np.array(d['mean'], dtype=np.float64), np.array(d['m2'], dtype=np.float64)
+        out.min, out.max = np.array(d['min'], dtype=np.float64), np.array(d['max'], dtype=np.float64)
+        return out
+
+
+class WindowedStats():
+
+    def __init__(self, window, channels=1, blocks=16):
+        self.channels = channels
+        self.blocks = blocks
+        self.resize(window)
+
+    # starts over with a new window length
+    def resize(self, window):
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.window = int(window)
+        self.block_size = max(1, -(-self.window//self.blocks))
+        self._blocks = deque(maxlen=-(-self.window//self.block_size))
+        self._current = RunningStats(self.channels)
+
+    def update(self, batch):
+        batch = np.asarray(batch, dtype=np.float64).reshape(-1, self.channels)
+        while len(batch):
+            room = self.block_size - self._current.count
+            self._current.update(batch[:room])
+            batch = batch[room:]
+            if self._current.count == self.block_size:
+                self._blocks.append(self._current)
+                self._current = RunningStats(self.channels)
+        return self
+
+    # statistics of the last window to window + block_size samples
+    def stats(self):
+        return RunningStats.merged(list(self._blocks) + [self._current], self.channels)
+
+    def clear(self):
+        self._blocks.clear()
+        self._current = RunningStats(self.channels)
+
+
+# {window: RunningStats} of the rolling means of every channel, fed by chunks of (n, channels) samples
+def chunked_window_stats(chunks, windows=WINDOW_SIZES, channels=1):
+    windows = list(windows)
+    out = {w: RunningStats(channels) for w in windows}
+    carry = np.empty((0, channels))     # the last max(windows) - 1 samples of the previous chunks
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=np.float64).reshape(-1, channels)
+        if not len(chunk):
+            continue
+        data = np.concatenate((carry, chunk))
+        csum = np.empty((len(data) + 1, channels))
+        csum[0] = 0
+        np.cumsum(data, axis=0, out=csum[1:])
+        for w in windows:
+            first = max(w, len(carry) + 1)          # only means that end inside the new chunk
+            if first <= len(data):
+                out[w].update((csum[first:] - csum[first - w:len(data) + 1 - w])/w)
+        carry = data[-(max(windows) - 1):] if max(windows) > 1 else data[:0]
+    return out
+
+# the same columns as teensy.stats.window_stats, one dict per channel, from chunked_window_stats
+def accumulated_window_stats(accumulators, name='', pressure=np.nan):
+    windows = list(accumulators)
+    channels = accumulators[windows[0]].channels
+    return [{
+        'Data Set Name': [name]*len(windows),
+        'Pressure': [pressure]*len(windows),
+        '# Samples': np.array([accumulators[w].count for w in windows]),
+        'Window': np.array(windows),
+        'Min': np.array([accumulators[w].min[c] for w in windows]),
+        'Max': np.array([accumulators[w].max[c] for w in windows]),
+        'Average': np.array([accumulators[w].mean[c] for w in windows]),
+        'SDev': np.array([accumulators[w].sdev[c] for w in windows]),
+    } for c in range(channels)]
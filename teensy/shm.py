@@ -0,0 +1,307 @@
+'''
+    Acquisition in its own process, publishing decoded samples through a
+    multiprocessing.shared_memory ring, so GUI redraws, calibration and
+    recording never hold up draining the serial port.
+
+    The shared block is a small header of uint64 words followed by
+    2*capacity SAMPLE_DTYPE records:
+
+        seq             samples committed so far (sample s is at s % capacity)
+        write_end       samples being written, set before the data is touched
+        capacity
+        stop            set by any process to ask the writer to finish
+        running         set by the writer once it is streaming
+        period_us
+        gaps, missing, duplicates, outliers     the writer's Teensy.continuity
+
+    There is exactly one writer and no lock. The writer announces write_end,
+    writes the samples (twice, at pos and pos + capacity like RingBuffer, so
+    the newest n samples are always one contiguous block) and then commits
+    seq. A reader copies what it wants and afterwards drops every sample
+    older than write_end - capacity, which the writer may have overwritten
+    meanwhile, counting them as lost.
+
+    latest() hands out zero-copy views into the shared block. They are only
+    valid until the writer laps them, valid() tells whether that happened.
+
+    The process started by AcquisitionProcess holds the write end of a pipe
+    to its stdin and stops by itself when that closes, so it never keeps
+    the port open after its parent is gone, however that went. Readers
+    have to be done with the ring before AcquisitionProcess.stop() closes
+    it.
+
+    Usage
+
+        acquisition = AcquisitionProcess(period_us=1000)    # owns the Teensy
+        acquisition.start()
+        reader = acquisition.reader()
+        samples = reader.read()         # everything since the last read
+        service = AcquisitionService(reader)    # read_block() like a Teensy
+        acquisition.stop()
+
+        python -m teensy.shm [period_us] [capacity] [--port=PORT] [--binary]    # standalone, prints the name
+        reader = SharedRing.attach(name).reader()       # from any other process
+'''
+
+import os
+import sys
+import time
+import threading
+import subprocess
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .decode import SAMPLE_DTYPE
+
+SEQ, WRITE_END, CAPACITY, STOP, RUNNING, PERIOD_US, GAPS, MISSING, DUPLICATES, OUTLIERS = range(10)
+HEADER_WORDS = 16
+HEADER_BYTES = HEADER_WORDS*8
+
+ContinuityCounts = namedtuple('ContinuityCounts', ['gaps', 'missing', 'duplicates', 'outliers'])
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)      # python >= 3.13
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if os.name == 'posix':      # else the resource tracker unlinks it when this process exits
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedRing():
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray(HEADER_WORDS, dtype=np.uint64, buffer=shm.buf)
+        self.capacity = int(self.header[CAPACITY])
+        self.data = np.ndarray(2*self.capacity, dtype=SAMPLE_DTYPE, buffer=shm.buf, offset=HEADER_BYTES)
+
+    @classmethod
+    def create(cls, capacity=1 << 20, name=None):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        shm = shared_memory.SharedMemory(name=name, create=True,
+                                         size=HEADER_BYTES + 2*int(capacity)*SAMPLE_DTYPE.itemsize)
+        header = np.ndarray(HEADER_WORDS, dtype=np.uint64, buffer=shm.buf)
+        header[:] = 0
+        header[CAPACITY] = capacity
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach(name))
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def seq(self):
+        return int(self.header[SEQ])
+
+    # only ever called by the one writer process
+    def write(self, batch):
+        batch = np.asarray(batch, dtype=SAMPLE_DTYPE)
+        seq, cap = self.seq, self.capacity
+        k = len(batch)
+        if not k:
+            return
+        if k > cap:                                 # only the newest capacity samples survive
+            seq, batch, k = seq + k - cap, batch[-cap:], cap
+        self.header[WRITE_END] = seq + k
+        pos = seq % cap
+        m = min(k, cap - pos)                       # samples that fit before wrapping
+        self.data[pos:pos + m] = batch[:m]
+        self.data[pos + cap:pos + cap + m] = batch[:m]
+        self.data[:k - m] = batch[m:]
+        self.data[cap:cap + k - m] = batch[m:]
+        self.header[SEQ] = seq + k
+
+    # oldest sample that can still be trusted after a read
+    def _oldest(self):
+        return max(int(self.header[WRITE_END]) - self.capacity, 0)
+
+    # (view of the newest n samples, seq of the sample after them), zero copy
+    def latest(self, n=None):
+        seq = self.seq
+        n = min(seq, self.capacity) if n is None else max(0, min(int(n), seq, self.capacity))
+        end = seq % self.capacity + self.capacity
+        return self.data[end - n:end], seq
+
+    # True while the samples of a latest() view ending at seq haven't been overwritten
+    def valid(self, view, seq):
+        return seq - len(view) >= self._oldest()
+
+    # (copy of samples start to stop, index of the first sample returned), the ones overwritten are skipped
+    def read(self, start, stop=None):
+        stop = self.seq if stop is None else min(stop, self.seq)
+        start = max(start, stop - self.capacity)
+        if stop <= start:
+            return np.empty(0, dtype=SAMPLE_DTYPE), stop
+        end = stop % self.capacity + self.capacity
+        out = self.data[end - (stop - start):end].copy()
+        first = max(start, self._oldest())
+        return out[first - start:], first
+
+    def reader(self, start=None):
+        return RingReader(self, self.seq if start is None else start)
+
+    def set_continuity(self, continuity):
+        self.header[GAPS:OUTLIERS + 1] = (continuity.gaps, continuity.missing, continuity.duplicates,
+                                          continuity.outliers)
+
+    @property
+    def continuity(self):
+        return ContinuityCounts(*(int(v) for v in self.header[GAPS:OUTLIERS + 1]))
+
+    @property
+    def running(self):
+        return bool(self.header[RUNNING])
+
+    def request_stop(self):
+        self.header[STOP] = 1
+
+    # views from latest() have to be gone before this
+    def close(self):
+        del self.header, self.data
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingReader():
+
+    def __init__(self, ring, start=0):
+        self.ring = ring
+        self.cursor = start
+        self.lost = 0               # samples overwritten before this reader got to them
+        self.poll_interval = 0.001
+
+    @property
+    def continuity(self):
+        return self.ring.continuity
+
+    # every sample since the last read, copied out of the ring
+    def read(self):
+        samples, first = self.ring.read(self.cursor)
+        self.lost += first - self.cursor
+        self.cursor = first + len(samples)
+        return samples
+
+    # waits up to timeout for new samples, so the reader can stand in for a Teensy
+    def read_block(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while self.ring.seq == self.cursor and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+        return self.read()
+
+
+# set once stdin reaches its end, which for a pipe happens when the process holding the other end closes
+# it or exits
+def stdin_closed():
+    closed = threading.Event()
+
+    def watch():
+        while os.read(sys.stdin.fileno(), 4096):     # unbuffered, sys.stdin's lock would stall the exit
+            pass
+        closed.set()
+
+    threading.Thread(target=watch, name='parent-watch', daemon=True).start()
+    return closed
+
+
+# body of the acquisition process, owns the Teensy until the ring's stop flag (or the stop event) is set
+def acquire(ring, port=None, period_us=1000, binary=False, stop=None):
+    from .teensy import Teensy      # pyserial is only needed in the writer
+    attached = isinstance(ring, str)
+    if attached:                    # a name, from another process
+        ring = SharedRing.attach(ring)
+    teensy = Teensy(verbose=False)
+    try:
+        teensy.connect(port)
+        if binary:
+            teensy.set_binary(True)
+        teensy.send('s {}'.format(period_us))
+        ring.header[PERIOD_US] = period_us
+        ring.header[RUNNING] = 1
+        while not ring.header[STOP] and not (stop is not None and stop.is_set()):
+            ring.write(teensy.read_block())
+            ring.set_continuity(teensy.continuity)
+    finally:
+        ring.header[RUNNING] = 0
+        if teensy.serial_handle.is_open:
+            teensy.send('s')
+            teensy.serial_handle.close()
+        if attached:
+            ring.close()
+
+
+# runs python -m teensy.shm in a fresh interpreter, so it works the same with fork and spawn and
+# never re-imports the calling script
+class AcquisitionProcess():
+
+    def __init__(self, port=None, period_us=1000, capacity=1 << 20, binary=False):
+        self.port = port
+        self.period_us = period_us
+        self.capacity = capacity
+        self.binary = binary
+        self.ring = None
+        self.process = None
+
+    def start(self, timeout=10.0):
+        self.ring = SharedRing.create(self.capacity)
+        args = [sys.executable, '-m', 'teensy.shm', str(self.period_us), '--ring=' + self.ring.name]
+        if self.port:
+            args.append('--port=' + self.port)
+        if self.binary:
+            args.append('--binary')
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE,        # closed when this process goes away
+                                        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        deadline = time.monotonic() + timeout
+        while not self.ring.running:
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError('Acquisition process did not start streaming')
+            time.sleep(0.01)
+        return self
+
+    def reader(self):
+        return self.ring.reader()
+
+    def stop(self, timeout=5.0):
+        if self.ring is None:
+            return
+        self.ring.request_stop()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.terminate()
+            self.process.wait()
+        self.process.stdin.close()
+        self.ring.close()
+        self.ring = None
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = dict(a[2:].partition('=')[::2] for a in sys.argv[1:] if a.startswith('--'))
+    period_us = int(args[0]) if len(args) > 0 else 1000
+    capacity = int(args[1]) if len(args) > 1 else 1 << 20
+    if 'ring' in options:       # started by AcquisitionProcess, which owns the ring, ends with it
+        acquire(options['ring'], options.get('port'), period_us, 'binary' in options, stdin_closed())
+        sys.exit()
+    ring = SharedRing.create(capacity)
+    print('Shared ring {} ({} samples), attach with SharedRing.attach({!r})'.format(ring.name, capacity, ring.name))
+    try:
+        acquire(ring, options.get('port'), period_us, 'binary' in options)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ring.close()
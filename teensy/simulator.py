@@ -0,0 +1,233 @@
+'''
+    Virtual Teensy on a pseudo terminal, for running the whole acquisition
+    stack without hardware. It speaks the same commands as
+    dual_diff_read_with_interval_timer.ino:
+
+        s <period_us>       start sampling every period_us, s or s 0 stops
+        p                   print the current period
+        b 1 / b 0           packed binary frames / ascii lines
+
+    and streams either a capture replayed from test_data/ (adc0 and adc1
+    columns, looped) or a synthetic waveform ('sine', 'square', 'noise').
+
+    rate sets how fast simulated time runs: 1 is real time, 10 sends ten
+    periods worth of samples per period, None sends as fast as the reader
+    drains the pty. corruption is the probability for each sent byte to be
+    flipped or dropped, to exercise the decoders' resync paths.
+
+    Usage
+
+        with VirtualTeensy('test_data/sensor_A_1_hz_square_wave_100mVpp/test_2020-05-06_13-06-51_8G_20psi.csv') as sim:
+            t = Teensy()
+            t.connect(sim.port)
+
+        python -m teensy.simulator [capture.csv | sine | square | noise] [rate | flat] [corruption]
+
+    The module prints the pty to connect to, scripts pick it up from the
+    TEENSY_PORT environment variable. Pseudo terminals only exist on Unix,
+    elsewhere the module still imports (synthetic() and WAVEFORMS work) but
+    start() raises RuntimeError.
+'''
+
+import os
+import sys
+import time
+import select
+import threading
+try:
+    import tty              # pseudo terminals, Unix only
+except ImportError:
+    tty = None
+
+import numpy as np
+
+from .decode import encode_frames
+
+WAVEFORMS = ('sine', 'square', 'noise')
+MAX_BATCH = 4096            # most samples generated per write
+
+
+# adc0, adc1 int16 arrays for one loop of a waveform, sampled every period_us
+def synthetic(waveform, num_samples=100000, period_us=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_samples)*period_us*1e-6
+    if waveform == 'sine':
+        adc0 = np.sin(2*np.pi*4.46*t)*12000 - 10000
+    elif waveform == 'square':
+        adc0 = np.where(np.sin(2*np.pi*t) >= 0, -6000.0, -14000.0)
+    elif waveform == 'noise':
+        adc0 = np.full(num_samples, -10000.0)
+    else:
+        raise ValueError('Unknown waveform {}, use a capture file or one of {}'.format(waveform, WAVEFORMS))
+    adc0 = adc0 + rng.normal(0, 40, num_samples)
+    adc1 = rng.normal(-17850, 60, num_samples)
+    return adc0.astype(np.int16), adc1.astype(np.int16)
+
+def load_source(source):
+    if isinstance(source, str) and source in WAVEFORMS:
+        return synthetic(source)
+    if isinstance(source, (str, os.PathLike)):
+        from .loader import load_capture
+        idx, ts, adc0, adc1 = load_capture(source)
+        return adc0.astype(np.int16), adc1.astype(np.int16)
+    adc0, adc1 = source
+    return np.asarray(adc0, dtype=np.int16), np.asarray(adc1, dtype=np.int16)
+
+
+class VirtualTeensy():
+
+    def __init__(self, source='sine', rate=1.0, corruption=0.0, seed=None):
+        self.adc0, self.adc1 = load_source(source)
+        if not len(self.adc0):
+            raise ValueError('Nothing to replay in {}'.format(source))
+        self.rate = rate
+        self.corruption = corruption
+        self.rng = np.random.default_rng(seed)
+        self.period_us = 0
+        self.binary = False
+        self.port = None
+        self.samples_sent = 0
+        self.bytes_corrupted = 0
+        self._master = None
+        self._slave = None
+        self._thread = None
+        self._running = False
+        self._pos = 0               # next sample of the source
+        self._seq = 0
+        self._sim_us = 0            # simulated time since start, the ms field
+        self._due = 0.0             # samples owed to the reader
+        self._last = None
+        self._started = None        # time.monotonic() and simulated time when sampling last started
+        self._start_us = 0
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        if tty is None or not hasattr(os, 'openpty'):
+            raise RuntimeError('The virtual Teensy needs a pseudo terminal, not available on {}'.format(sys.platform))
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)     # no echo, no newline translation
+        os.set_blocking(self._master, False)
+        self.port = os.ttyname(self._slave)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for fd in (self._master, self._slave):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def _command(self, line):
+        cmd, _, arg = line.strip().partition(' ')
+        try:
+            value = int(arg.strip() or 0)       # parseInt() returns 0 on a timeout
+        except ValueError:
+            value = 0
+        if cmd == 's':
+            self.period_us = max(value, 0)
+            self._due, self._last = 0.0, time.monotonic()
+            self._started, self._start_us = self._last, self._sim_us
+            return b''
+        if cmd == 'p':
+            return '{}\r\n'.format(self.period_us).encode()
+        if cmd == 'b':
+            self.binary = value != 0
+            self._seq = 0
+        return b''
+
+    def _generate(self, n):
+        idx = (self._pos + np.arange(n)) % len(self.adc0)
+        self._pos = (self._pos + n) % len(self.adc0)
+        t_us = self._sim_us + (np.arange(n) + 1)*self.period_us
+        self._sim_us = int(t_us[-1])
+        ms = t_us//1000
+        adc0, adc1 = self.adc0[idx], self.adc1[idx]
+        self.samples_sent += n
+        if self.binary:
+            data = encode_frames(ms, adc0, adc1, seq_start=self._seq)
+            self._seq = (self._seq + n) & 0xFFFF
+            return data
+        return (''.join(map('{}:{}:{}\r\n'.format, ms.tolist(), adc0.tolist(), adc1.tolist()))).encode()
+
+    def _corrupt(self, data):
+        hit = np.flatnonzero(self.rng.random(len(data)) < self.corruption)
+        if not len(hit):
+            return data
+        self.bytes_corrupted += len(hit)
+        buf = np.frombuffer(data, dtype=np.uint8).copy()
+        flip = self.rng.random(len(hit)) < 0.5
+        buf[hit[flip]] ^= self.rng.integers(1, 256, flip.sum(), dtype=np.uint8)
+        return np.delete(buf, hit[~flip]).tobytes()
+
+    # time.monotonic() at which the sample stamped ms was due, for latency measurements at a fixed rate
+    def due_time(self, ms):
+        return self._started + (np.asarray(ms)*1000 - self._start_us)*1e-6/self.rate
+
+    # how many samples are due since the last call
+    def _samples_due(self):
+        if self.rate is None:
+            return MAX_BATCH
+        now = time.monotonic()
+        self._due += (now - self._last)*1e6*self.rate/self.period_us
+        self._last = now
+        n = min(int(self._due), MAX_BATCH)
+        self._due -= n
+        return n
+
+    def _serve(self):
+        pending, out = b'', b''
+        while self._running:
+            streaming = self.period_us > 0
+            want_write = bool(out) or (streaming and self.rate is None)
+            if streaming and self.rate is not None and not out:
+                timeout = max(self.period_us/self.rate*1e-6, 1e-3)
+            else:
+                timeout = 0.05
+            readable, writable, _ = select.select([self._master], [self._master] if want_write else [], [],
+                                                  timeout)
+            if readable:
+                try:
+                    pending += os.read(self._master, 4096)
+                except OSError:
+                    break
+                while b'\n' in pending:
+                    line, pending = pending.split(b'\n', 1)
+                    out += self._command(line.decode(errors='replace'))
+            if self.period_us > 0 and len(out) < 1 << 16:
+                n = self._samples_due()
+                if n:
+                    data = self._generate(n)
+                    out += self._corrupt(data) if self.corruption else data
+            if out:
+                try:
+                    written = os.write(self._master, out)
+                    out = out[written:]
+                except BlockingIOError:
+                    pass        # reader is behind, keep it for the next round
+                except OSError:
+                    break
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'sine'
+    rate = sys.argv[2] if len(sys.argv) > 2 else '1'
+    corruption = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    with VirtualTeensy(source, None if rate == 'flat' else float(rate), corruption) as sim:
+        print('Virtual Teensy at {}'.format(sim.port))
+        print('    export TEENSY_PORT={}'.format(sim.port))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print('Sent {} samples'.format(sim.samples_sent))
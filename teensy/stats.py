@@ -0,0 +1,52 @@
+'''
+    Vectorized rolling statistics for raw captures. One cumulative sum per
+    channel is computed once and every requested window size is taken from
+    it, for all channels at once:
+
+        mean_w[i] = (csum[i + w] - csum[i]) / w
+
+    window_stats summarizes every rolling mean with the columns used by the
+    calibration_data_sensor_* csv files:
+
+        Data Set Name, Pressure, # Samples, Window, Min, Max, Average, SDev
+'''
+
+import numpy as np
+
+STATS_COLUMNS = ['Data Set Name', 'Pressure', '# Samples', 'Window', 'Min', 'Max', 'Average', 'SDev']
+WINDOW_SIZES = [1, 5, 10, 50, 100, 500]
+
+
+def _channels(data):
+    data = np.asarray(data, dtype=np.float64)
+    return data[np.newaxis] if data.ndim == 1 else data
+
+# rolling means for every window size from one cumulative sum, {window: (channels, n - window + 1)}
+def rolling_means(data, windows=WINDOW_SIZES):
+    data = _channels(data)
+    csum = np.zeros((data.shape[0], data.shape[1] + 1))
+    np.cumsum(data, axis=1, out=csum[:, 1:])
+    return {w: (csum[:, w:] - csum[:, :-w])/w for w in windows if 0 < w <= data.shape[1]}
+
+# one dict of columns per channel, one row per window size
+def window_stats(data, windows=WINDOW_SIZES, name='', pressure=np.nan, means=None):
+    if means is None:
+        means = rolling_means(data, windows)
+    windows = list(means)
+    channels = next(iter(means.values())).shape[0] if means else _channels(data).shape[0]
+    count = np.array([[means[w].shape[1] for w in windows]]*channels)
+    lo = np.array([means[w].min(axis=1) for w in windows]).T
+    hi = np.array([means[w].max(axis=1) for w in windows]).T
+    avg = np.array([means[w].mean(axis=1) for w in windows]).T
+    sdev = np.array([means[w].std(axis=1, ddof=1) if means[w].shape[1] > 1 else np.full(channels, np.nan)
+                     for w in windows]).T
+    return [{
+        'Data Set Name': [name]*len(windows),
+        'Pressure': [pressure]*len(windows),
+        '# Samples': count[c],
+        'Window': np.array(windows),
+        'Min': lo[c],
+        'Max': hi[c],
+        'Average': avg[c],
+        'SDev': sdev[c],
+    } for c in range(channels)]
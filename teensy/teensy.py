@@ -4,6 +4,20 @@
 
         <timestamp>:<adc0_value>:<adc1_value>
 
+    or, after set_binary(True), the packed frames described in decode.py.
+
+    Only the commands in REPLIES are answered by the firmware ("p" with the
+    period), send() returns '' for the others ("s", "b") without waiting,
+    a readline there would stall for the timeout or eat a sample.
+
+    read_block() checks the timestamps of every block against the period
+    last sent with "s <period_us>", see continuity.py. The running counts
+    are in Teensy.continuity.
+
+    connect() uses the port given, else the TEENSY_PORT environment
+    variable (e.g. a VirtualTeensy from simulator.py), else searches the
+    USB ports for the Teensy's hwid.
+
     Outputs:
 
         One csv file with the polled data.
@@ -14,9 +28,16 @@
 '''
 
 import atexit
+import os
 import serial
 import serial.serialutil
 import serial.tools.list_ports
+import numpy as np
+
+from .continuity import ContinuityTracker
+from .decode import FrameDecoder, LineDecoder
+
+REPLIES = ('p',)            # commands the firmware answers with a line
 
 def findUsbPort(hwid):
     ports = list(serial.tools.list_ports.comports())
@@ -26,6 +47,9 @@ def findUsbPort(hwid):
             return p.device
     return None                 # hwid not found
 
+def findUsbPorts(hwid):
+    return [p.device for p in serial.tools.list_ports.comports() if hwid.upper() in p.hwid]
+
 class Teensy():
 
     def __init__(self, hwid='16c0:0483', verbose=True):
@@ -33,10 +57,15 @@ class Teensy():
         self.serial_handle.hwid = hwid
         self.serial_handle.port = None                # start with no port
         self.verbose = verbose
+        self.binary = False
+        self.frame_decoder = FrameDecoder()
+        self.line_decoder = LineDecoder()
+        self.continuity = ContinuityTracker()
+        self.chunk_size = 1 << 16                       # most bytes to pull from the rx buffer in one read
         atexit.register(self.serial_handle.close)
 
-    def connect(self):
-        self.serial_handle.port = findUsbPort(self.serial_handle.hwid)
+    def connect(self, port=None):
+        self.serial_handle.port = port or os.environ.get('TEENSY_PORT') or findUsbPort(self.serial_handle.hwid)
         if self.serial_handle.port is None:
             raise ValueError('Teensy not found')
         if self.serial_handle.is_open:
@@ -48,7 +77,12 @@ class Teensy():
 
     def send(self, cmd):
         if self.verbose: print('Sent: ' + cmd)
+        words = cmd.split()
+        if len(words) == 2 and words[0] == 's' and words[1].isdigit() and int(words[1]):
+            self.continuity.reset(int(words[1]))        # new sampling period, the counts start over
         self.serial_handle.write(bytes(cmd + '\n', encoding='ascii'))
+        if not words or words[0] not in REPLIES:
+            return ''                                   # nothing comes back, the next line is a sample
         response = self.receive()
         # if self.verbose: print("Response: ", response)
         return response                                 # return the response to the command
@@ -56,7 +90,23 @@ class Teensy():
     def receive(self):
         response = b''
         response += self.serial_handle.readline()       # wait for the first line to fill in the rx buffer
-        return response.decode().rstrip()               # return decoded byte response (as string) without traililng newline
+        return response.decode(errors='replace').rstrip()   # return decoded byte response (as string) without traililng newline
+
+    def set_binary(self, enabled=True):
+        self.send("b {}".format(int(enabled)))  # switch the firmware output format
+        self.binary = enabled
+        self.frame_decoder.reset()
+
+    @property
+    def decoder(self):
+        return self.frame_decoder if self.binary else self.line_decoder
+
+    # drain everything waiting in the rx buffer (blocking for at least one byte) and decode it
+    def read_block(self):
+        data = self.serial_handle.read(min(max(self.serial_handle.in_waiting, 1), self.chunk_size))
+        samples = self.decoder.feed(data)               # structured array of decoded samples
+        self.continuity.update(samples['ms'])
+        return samples
 
     def read_adcs(self):
         data = self.receive().split(':')
@@ -71,21 +121,32 @@ class Teensy():
                 pass                # don't use anything if data was bad
         return t0, v0, v1
 
-    def sample(self, num_samples, period_us=1000):
-        times, adc0, adc1 = [], [], []
-        num_datapoints = 0
+    def sample(self, num_samples, period_us=1000, discard=50):
+        times = np.empty(num_samples, dtype=np.int32)
+        adc0 = np.empty(num_samples, dtype=np.int16)
+        adc1 = np.empty(num_samples, dtype=np.int16)
         self.send("s")                         # stop the internal timer
         self.serial_handle.flushInput()        # flush serial input
         self.serial_handle.flushOutput()       # flush serial input
         self.send("s {}".format(period_us))    # set sampling period and begin sampling
-        while num_datapoints < num_samples + 50:    # take 50 extra samples to get rid of
-            t0, v0, v1 = self.read_adcs()
-            if t0 is not None:                      # ignore bad datapoints
-                times.append(t0)
-                adc0.append(v0)
-                adc1.append(v1)
-                num_datapoints += 1
-            if num_datapoints >= num_samples + 50:
-                break
+        self.decoder.reset()
+        num_datapoints = -discard              # take extra samples to get rid of
+        while num_datapoints < num_samples:
+            block = self.read_block()
+            if num_datapoints < 0:             # still inside the discarded samples
+                skip = min(-num_datapoints, len(block))
+                block = block[skip:]
+                num_datapoints += skip
+            n = min(len(block), num_samples - num_datapoints)
+            times[num_datapoints:num_datapoints + n] = block['ms'][:n]
+            adc0[num_datapoints:num_datapoints + n] = block['adc0'][:n]
+            adc1[num_datapoints:num_datapoints + n] = block['adc1'][:n]
+            num_datapoints += n
         self.send("s") # stop the data collection
-        return times[50:], adc0[50:], adc1[50:]
+        if self.verbose and not self.binary and self.line_decoder.malformed:
+            print('Skipped {} malformed lines'.format(self.line_decoder.malformed))
+        if self.verbose and (self.continuity.gaps or self.continuity.duplicates or self.continuity.outliers):
+            print('{} gaps ({} samples missing), {} duplicate timestamps, {} corrupted timestamps'.format(
+                  self.continuity.gaps, self.continuity.missing, self.continuity.duplicates,
+                  self.continuity.outliers))
+        return times, adc0, adc1
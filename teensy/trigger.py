@@ -0,0 +1,211 @@
+'''
+    Streaming trigger stage. Decoded batches go in, only the samples around
+    each event come out, so a pulse experiment records its pulses instead
+    of hours of baseline.
+
+    A condition looks at one channel, optionally calibrated to PSI, and
+    fires with hysteresis (a Schmitt trigger): after firing it has to be
+    re-armed by the signal moving back past the hysteresis band first.
+
+        Rising(level, hysteresis)           value goes up through level
+        Falling(level, hysteresis)          value goes down through level
+        Crossing(level, hysteresis)         either direction
+        Slope(rate, span, hysteresis)       change per second over span
+                                            samples passes rate (a negative
+                                            rate fires on falling slopes)
+        OutOfBand(low, high, hysteresis)    value leaves [low, high]
+
+    Every condition works on whole batches with cumulative maximums instead
+    of a per-sample loop and carries its state (armed or not, the last
+    samples for Slope) to the next batch, so the result doesn't depend on
+    how the stream is split into batches.
+
+    TriggerStage keeps the last pre samples, and each event is emitted as
+    one window of pre samples before the trigger, the trigger sample and
+    post - 1 samples after it. Triggers inside a window that is still being
+    collected are ignored, and a window never reaches back into the previous
+    one, so the windows come out in order and without overlap. Memory use is
+    the pre-trigger history plus the one open window.
+
+    Usage
+
+        lut = CalibrationLUT()
+        stage = TriggerStage(Rising(level=20.0, hysteresis=0.5), pre=200, post=800,
+                             calibrate=lambda counts: lut.to_psi(counts, 'A', 0))
+        for event in stage.process(batch):
+            recorder.write(event.samples)
+
+        await stage.consume(subscription, recorder)
+'''
+
+from collections import namedtuple
+
+import numpy as np
+
+from .decode import SAMPLE_DTYPE
+
+Event = namedtuple('Event', ['index', 'ms', 'samples'])     # index: trigger position in the stream
+
+
+# indices where fire is set while armed; arm sets the state, fire clears it
+def _schmitt(fire, arm, armed):
+    n = len(fire)
+    idx = np.arange(n)
+    last_arm = np.maximum.accumulate(np.where(arm, idx, -1))
+    last_fire = np.maximum.accumulate(np.where(fire, idx, -1))
+    prev_arm = np.concatenate(([-1], last_arm[:-1]))         # before sample i
+    prev_fire = np.concatenate(([-1], last_fire[:-1]))
+    armed_before = (prev_arm > prev_fire) | ((prev_arm == -1) & (prev_fire == -1) & armed)
+    triggers = np.flatnonzero(fire & armed_before)
+    if n:
+        if last_arm[-1] > last_fire[-1]:
+            armed = True
+        elif last_fire[-1] > last_arm[-1]:
+            armed = False
+    return triggers, armed
+
+
+class Rising():
+
+    def __init__(self, level, hysteresis=0.0):
+        self.level = level
+        self.hysteresis = hysteresis
+        self.armed = False          # has to see the signal below the band first
+
+    def find(self, values, ms):
+        triggers, self.armed = _schmitt(values >= self.level, values < self.level - self.hysteresis, self.armed)
+        return triggers
+
+
+class Falling():
+
+    def __init__(self, level, hysteresis=0.0):
+        self.level = level
+        self.hysteresis = hysteresis
+        self.armed = False
+
+    def find(self, values, ms):
+        triggers, self.armed = _schmitt(values <= self.level, values > self.level + self.hysteresis, self.armed)
+        return triggers
+
+
+class Crossing():
+
+    def __init__(self, level, hysteresis=0.0):
+        self.rising = Rising(level, hysteresis)
+        self.falling = Falling(level, hysteresis)
+
+    def find(self, values, ms):
+        return np.union1d(self.rising.find(values, ms), self.falling.find(values, ms))
+
+
+class OutOfBand():
+
+    def __init__(self, low, high, hysteresis=0.0):
+        self.low = low
+        self.high = high
+        self.hysteresis = hysteresis
+        self.armed = False
+
+    def find(self, values, ms):
+        outside = (values < self.low) | (values > self.high)
+        inside = (values >= self.low + self.hysteresis) & (values <= self.high - self.hysteresis)
+        triggers, self.armed = _schmitt(outside, inside, self.armed)
+        return triggers
+
+
+class Slope():
+
+    def __init__(self, rate, span=10, hysteresis=0.0):
+        if int(span) < 1:
+            raise ValueError('span must be at least 1')
+        self.rate = rate
+        self.span = int(span)
+        self.edge = Rising(abs(rate), hysteresis)
+        self._values = np.empty(0)          # the last span samples of the previous batches
+        self._ms = np.empty(0)
+
+    def find(self, values, ms):
+        values = np.concatenate((self._values, values))
+        ms = np.concatenate((self._ms, np.asarray(ms, dtype=np.float64)))
+        carried = len(self._values)
+        self._values, self._ms = values[-self.span:], ms[-self.span:]
+        if len(values) <= self.span:
+            return np.empty(0, dtype=np.intp)
+        dt = (ms[self.span:] - ms[:-self.span])*1e-3
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(dt > 0, (values[self.span:] - values[:-self.span])/dt, 0.0)
+        if self.rate < 0:
+            slope = -slope
+        # slope[j] ends at values[j + span], which is always in this batch (carried <= span)
+        return self.edge.find(slope, None) + self.span - carried
+
+
+class TriggerStage():
+
+    def __init__(self, condition, pre=100, post=900, channel='adc0', calibrate=None, dtype=SAMPLE_DTYPE):
+        if pre < 0 or post < 1:
+            raise ValueError('pre must be at least 0 and post at least 1')
+        self.condition = condition
+        self.pre = int(pre)
+        self.post = int(post)
+        self.channel = channel
+        self.calibrate = calibrate          # counts -> value the condition is compared with, e.g. psi
+        self.dtype = np.dtype(dtype)
+        self.samples = 0                    # samples seen
+        self.events = 0                     # windows emitted
+        self.ignored = 0                    # triggers inside an open window
+        self._history = np.empty(0, dtype=self.dtype)  # the last pre samples
+        self._open = None                   # (trigger index, parts, samples still missing)
+        self._end = 0                       # stream index after the last window
+
+    def _values(self, batch):
+        values = batch[self.channel]
+        return np.asarray(self.calibrate(values) if self.calibrate else values, dtype=np.float64)
+
+    def _emit(self, index, parts):
+        samples = np.concatenate(parts)
+        self.events += 1
+        trigger = index - (self._end - len(samples))      # position of the trigger sample in the window
+        return Event(int(index), int(samples['ms'][trigger]), samples)
+
+    def process(self, batch):
+        batch = np.asarray(batch, dtype=self.dtype)
+        start = self.samples                # stream index of batch[0]
+        events = []
+        triggers = self.condition.find(self._values(batch), batch['ms']) + start if len(batch) else []
+
+        if self._open is not None:          # the rest of the window still being collected
+            index, parts, missing = self._open
+            take = batch[:missing]
+            parts.append(take)
+            self._end = start + len(take)
+            if len(take) == missing:
+                events.append(self._emit(index, parts))
+                self._open = None
+            else:
+                self._open = (index, parts, missing - len(take))
+
+        for t in triggers:
+            if t < self._end or self._open is not None:
+                self.ignored += 1
+                continue
+            first = max(t - self.pre, self._end)            # never reach back into the last window
+            history = self._history[len(self._history) - (start - first):] if first < start else self._history[:0]
+            stop = min(t + self.post, start + len(batch))
+            parts = [history, batch[max(first - start, 0):stop - start]]
+            self._end = stop
+            if stop == t + self.post:
+                events.append(self._emit(t, parts))
+            else:
+                self._open = (t, parts, t + self.post - stop)
+
+        self.samples += len(batch)
+        self._history = np.concatenate((self._history, batch))[-self.pre:] if self.pre else self._history
+        return events
+
+    # write the windows of every batch of an AcquisitionService subscription until the stream ends
+    async def consume(self, subscription, recorder):
+        async for batch in subscription:
+            for event in self.process(batch):
+                recorder.write(event.samples)
@@ -3,14 +3,32 @@
         Start the timers at some period (us): s 3000<cr>
         print out the current period: p<cr>
         Stop the timers: s<cr>
+        Stream packed binary frames: b 1<cr>
+        Stream ascii lines (default): b 0<cr>
+
+    Binary frames are 14 little-endian bytes:
+        <sync:u16 = 0xA55A><seq:u16><ms:u32><adc0:i16><adc1:i16><crc:u16>
+    crc is CRC-16/CCITT (poly 0x1021, init 0xFFFF) over seq, ms, adc0 and adc1.
 */
 
 #include <ADC.h>
 #include <ADC_util.h>
 
 #define BAUD_RATE 115200
+#define FRAME_SYNC 0xA55A
 
 volatile int timer_period_us;
+volatile bool binary_mode = false;
+volatile uint16_t frame_seq = 0;
+
+struct __attribute__((packed)) Frame {
+    uint16_t sync;
+    uint16_t seq;
+    uint32_t ms;
+    int16_t adc0;
+    int16_t adc1;
+    uint16_t crc;
+};
 
 IntervalTimer timer0;
 
@@ -69,6 +87,9 @@ void loop() {
             }
         } else if (c == 'p') { // query timer period
             Serial.println(timer_period_us, DEC);
+        } else if (c == 'b') { // select binary (1) or ascii (0) output
+            binary_mode = Serial.parseInt() != 0;
+            frame_seq = 0;
         }
     }
 
@@ -91,12 +112,36 @@ void timer0_isr() {
     int16_t adc1_diff_value = adc->adc1->analogReadDifferential(A12, A13);
 
     // send data over serial
-    Serial.print(ms_since_start, DEC);
-    Serial.print(":");
-    Serial.print(adc0_diff_value, DEC);
-    Serial.print(":");
-    Serial.println(adc1_diff_value, DEC);
+    if (binary_mode) {
+        Frame frame;
+        frame.sync = FRAME_SYNC;
+        frame.seq = frame_seq++;
+        frame.ms = ms_since_start;
+        frame.adc0 = adc0_diff_value;
+        frame.adc1 = adc1_diff_value;
+        frame.crc = crc16((uint8_t *)&frame.seq, sizeof(frame) - 2*sizeof(uint16_t));
+        Serial.write((uint8_t *)&frame, sizeof(frame));
+    }
+    else {
+        Serial.print(ms_since_start, DEC);
+        Serial.print(":");
+        Serial.print(adc0_diff_value, DEC);
+        Serial.print(":");
+        Serial.println(adc1_diff_value, DEC);
+    }
 
     // toggle LED every time isr fires
     digitalWriteFast(LED_BUILTIN, !digitalReadFast(LED_BUILTIN));
 }
+
+// CRC-16/CCITT, poly 0x1021, init 0xFFFF
+uint16_t crc16(const uint8_t *data, size_t len) {
+    uint16_t crc = 0xFFFF;
+    while (len--) {
+        crc ^= (uint16_t)(*data++) << 8;
+        for (int i = 0; i < 8; i++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+        }
+    }
+    return crc;
+}
@@ -0,0 +1,60 @@
+'''
+    Every pressure.py command has to get through its --dry-run (importing
+    what it needs) within a generous time, acquire, record and live without
+    the heavy modules, and acquire and record must fail with their usage,
+    not a traceback, when arguments are missing. Every command runs in a
+    fresh interpreter, so nothing imported by the test itself counts.
+    benchmarks/cli_startup_benchmark.py has the actual timings.
+
+    Usage
+
+        python -m pytest tests/
+'''
+
+import sys
+import json
+import time
+import subprocess
+from pathlib import Path
+
+import pytest
+
+root = Path(__file__).resolve().parents[1]
+
+HEAVY_MODULES = ['pandas', 'matplotlib', 'PySimpleGUI', 'scipy', 'tkinter']
+LIGHT_SECONDS = 3.0         # about 0.2 s here
+ANALYSIS_SECONDS = 10.0     # about 0.6 s here, pandas is imported
+COMMANDS = [
+    ['acquire', '20.0', '--no-plot'],
+    ['record', 'recording'],
+    ['live'],
+    ['analyze', 'single', 'test_data'],
+    ['analyze', 'multiple', 'test_data'],
+    ['analyze', 'batch'],
+    ['analyze', 'noise'],
+    ['calibrate', 'test_data'],
+]
+LIGHT = ('acquire', 'record', 'live')       # the heavy modules wait until the command runs
+
+def run(code):
+    return subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True)
+
+@pytest.mark.parametrize('command', COMMANDS, ids=' '.join)
+def test_dry_run_starts_quickly(command):
+    start = time.perf_counter()
+    out = run('import sys, json, pressure; pressure.main(["pressure.py"] + {!r} + ["--dry-run"]); '
+              'print(json.dumps(sorted({{m.split(".")[0] for m in sys.modules}})))'.format(command))
+    elapsed = time.perf_counter() - start
+    assert out.returncode == 0, out.stderr
+    light = command[0] in LIGHT
+    assert elapsed < (LIGHT_SECONDS if light else ANALYSIS_SECONDS)
+    if light:
+        loaded = json.loads(out.stdout.strip().splitlines()[-1])
+        assert not set(loaded) & set(HEAVY_MODULES)
+
+@pytest.mark.parametrize('command', [['acquire'], ['record']])
+def test_missing_arguments_print_usage(command):
+    out = subprocess.run([sys.executable, 'pressure.py'] + command, cwd=root, capture_output=True, text=True)
+    assert out.returncode != 0
+    assert 'Usage' in out.stderr
+    assert 'Traceback' not in out.stderr
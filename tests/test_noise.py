@@ -0,0 +1,41 @@
+'''
+    Every capture in test_data has to get the kind of the input it was
+    taken with, see teensy/noise.py. Square wave runs are steps, air
+    readings are never steps or tones (their noise would be averaged into
+    the table per gain) and the pressure points are dc.
+
+    Usage
+
+        python -m pytest tests/
+'''
+
+from pathlib import Path
+
+import pytest
+
+from teensy.noise import characterize_directory, find_capture_directories
+
+root = Path(__file__).resolve().parents[1]
+
+# named like a square wave run but recorded from a sine: harmonics 3 and 5 are 2.5 % and 0.2 % of
+# the fundamental (33 % and 20 % for a square wave), its histogram is the sin_wave capture's
+SINE_CAPTURES = {'test_2020-05-06_13-14-30_8G_20psi.csv'}
+
+def kinds(pattern):
+    directories = [d for d in find_capture_directories(root / 'test_data') if Path(d).match(pattern)]
+    assert directories, pattern
+    return {row['file']: row['kind'] for d in directories for row in characterize_directory(d, cache=False)}
+
+def test_square_waves_are_steps():
+    for name, kind in kinds('*square_wave*').items():
+        assert kind == ('tone' if name in SINE_CAPTURES else 'step'), name
+
+def test_sine_wave_is_a_tone():
+    assert set(kinds('*sin_wave*').values()) == {'tone'}
+
+@pytest.mark.parametrize('pattern', ['*air_readings*', 'calibration_data_*', 'bad_data', '*_adc0'])
+def test_constant_and_drifting_inputs_are_not_steps_or_tones(pattern):
+    found = kinds(pattern)
+    assert not {name for name, kind in found.items() if kind in ('step', 'tone')}
+    if 'air' not in pattern:       # pressure points
+        assert set(found.values()) == {'dc'}